@@ -7,6 +7,7 @@ import seaborn as sns
 import sys
 import re
 import glob # To get file list for time axis
+from factor_analytics import membership_strength, assignment_changes, transition_counts
 
 # --- Configuration ---
 # Directory where the FINAL chosen factor matrices are saved
@@ -186,21 +187,19 @@ plt.close()
 
 # 4. Assign Communities Over Time & Visualize
 print("\nAssigning communities over time...")
-# Reconstruct approximate contribution: W_i * A_ir * B_jr * C_tr (sum over j)
-# Simplified approach: Assign based on max(A_ir * C_tr) for each device i at time t
-# Multiply A and C element-wise for each component, then find max component per device/time
-# Incorporate weights: A_weighted = factor_A * weights[np.newaxis, :]
-# contribution = A_weighted @ factor_C.T # Gives N x T matrix if B sums to 1 per component? No.
-# Let's use the simpler A[i,r] * C[t,r] approach first
-
-contributions = np.zeros((num_iot_devices, T, CHOSEN_RANK))
-for r in range(CHOSEN_RANK):
-     # Outer product of device vector and time vector for component r, scaled by weight
-     component_activity = np.outer(factor_A[:, r], factor_C[:, r]) * weights[r] # Shape N x T
-     contributions[:, :, r] = component_activity
-
-# Find the index (cluster number 0 to R-1) with the maximum contribution for each device/time
-community_assignment = np.argmax(contributions, axis=2) # Shape N x T
+# Assign each device i at time t to the component with the largest weights[r] * A[i, r] * C[t, r]
+# (see factor_analytics.py); strength is that component's share of the device's total contribution
+community_assignment, membership = membership_strength(factor_A, factor_C, weights) # Shape N x T
+
+# Community changes between consecutive time steps and per-device transition counts
+changes = assignment_changes(community_assignment, device_labels, [str(label)[:10] for label in time_labels])
+transitions = transition_counts(community_assignment, CHOSEN_RANK) # Shape N x R x R
+changes.to_csv(os.path.join(plot_layer_dir, "community_changes.csv"), index=False)
+print(f"Found {len(changes)} community changes ({changes['device'].nunique()} of {num_iot_devices} devices change at least once); "
+      f"mean membership strength {np.nanmean(membership):.2f}.")
+stays = np.trace(transitions, axis1=1, axis2=2) / np.maximum(transitions.sum(axis=(1, 2)), 1)
+print(f"Least stable device: {device_labels[int(np.argmin(stays))]} (keeps its community {stays.min() * 100:.0f}% of steps)")
+print("Saved community changes.")
 
 print("Visualizing community assignments...")
 plt.figure(figsize=(15, 8))
@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from rank_sweep import find_layer_tensors
+from sparse_tensor import load_dense_tensor, load_sparse_tensor
+from cp_backends import decompose
+from cp_apr import poisson_deviance
+from cp_utils import relative_error, tensor_norm
+from factor_matching import align_components
+
+# --- Configuration ---
+TENSOR_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\tensors"
+AGGREGATION_METRIC = 'count' # Poisson models are meant for the count tensors
+LEAST_SQUARES_SOLVER = 'mu'  # Least-squares baseline (cp_backends.py), fitted on the dense tensor
+RANK = 5
+SEEDS = [42, 43, 44]         # Both models start from the same random factors
+N_ITER_MAX = 500
+TOL = 1e-8
+CHECKPOINT_ITERS = 10        # Fits run in chunks of this many iterations; both objectives are timed at every chunk
+TARGET_MARGIN = 0.01         # Time to target: first checkpoint within 1% of the best value of each objective
+BURSTY_FRACTION = 0.2        # Devices with the highest coefficient of variation of their daily totals
+
+
+# --- Benchmark Helpers ---
+def timed_fit(tensor, dense_tensor, norm_tensor, solver, seed):
+    """Chunked fit recording (seconds, iterations, least-squares error, deviance) at every checkpoint.
+
+    Both solvers only carry their factors between iterations (CP-APR restarts its inactive-entry
+    nudging at each chunk), so the chunks follow one long run. Returns (weights, factors, checkpoints).
+    """
+    state, checkpoints, seconds, iterations = 'random', [], 0.0, 0
+    while iterations < N_ITER_MAX:
+        chunk = min(CHECKPOINT_ITERS, N_ITER_MAX - iterations)
+        start = time.perf_counter()
+        (weights, factors), errors = decompose(tensor, RANK, solver=solver, n_iter_max=chunk, init=state, tol=TOL,
+                                               random_state=seed, return_errors=True)
+        seconds += time.perf_counter() - start
+        iterations += len(errors)
+        state = (weights, factors)
+        checkpoints.append((seconds, iterations, relative_error(dense_tensor, weights, factors, norm_tensor),
+                            poisson_deviance(tensor, weights, factors)))
+        if len(errors) < chunk: # Converged within the chunk
+            break
+    return weights, factors, checkpoints
+
+
+def seconds_to(checkpoints, column, target):
+    """Time of the first checkpoint whose `column` (2: LS error, 3: deviance) is within target, else NaN."""
+    for checkpoint in checkpoints:
+        if checkpoint[column] <= target:
+            return checkpoint[0]
+    return np.nan
+
+
+def device_communities(weights, factors):
+    """Expected count of every device in every component (columns of A scaled to the component totals)."""
+    totals = weights * np.prod([factor.sum(axis=0) for factor in factors[1:]], axis=0)
+    return factors[0] * totals[np.newaxis, :]
+
+
+def bursty_devices(dense_tensor, fraction):
+    """Boolean mask of the `fraction` of active devices with the most variable daily totals."""
+    daily = dense_tensor.sum(axis=1)
+    mean = daily.mean(axis=1)
+    variation = np.divide(daily.std(axis=1), mean, out=np.zeros_like(mean), where=mean > 0)
+    active = mean > 0
+    cutoff = np.quantile(variation[active], 1 - fraction) if active.any() else np.inf
+    return active & (variation >= cutoff)
+
+
+# --- Run Benchmark ---
+if __name__ == "__main__":
+    layer_paths = find_layer_tensors(TENSOR_DIR, AGGREGATION_METRIC)
+    if not layer_paths:
+        print(f"FATAL ERROR: No *_{AGGREGATION_METRIC}_tensor.npy files found in {TENSOR_DIR}")
+        sys.exit(1)
+    solvers = (LEAST_SQUARES_SOLVER, 'cp_apr')
+    print(f"Comparing least-squares '{LEAST_SQUARES_SOLVER}' and Poisson 'cp_apr' CPD at rank {RANK} on {len(layer_paths)} layers "
+          f"({len(SEEDS)} seeds, at most {N_ITER_MAX} iterations)...")
+
+    run_rows, community_rows = [], []
+    for layer, path in layer_paths.items():
+        dense_tensor = np.asarray(load_dense_tensor(path), dtype=np.float64)
+        sparse_tensor = load_sparse_tensor(path).astype(np.float64)
+        norm_tensor = tensor_norm(dense_tensor)
+        inputs = {LEAST_SQUARES_SOLVER: dense_tensor, 'cp_apr': sparse_tensor}
+        fits, layer_rows = {}, []
+        for solver in solvers:
+            for seed in SEEDS:
+                try:
+                    weights, factors, checkpoints = timed_fit(inputs[solver], dense_tensor, norm_tensor, solver, seed)
+                except Exception as e:
+                    print(f"  {layer} {solver} seed {seed} FAILED: {e}")
+                    continue
+                seconds, iterations, ls_error, deviance = checkpoints[-1]
+                fits[(solver, seed)] = (weights, factors, deviance if solver == 'cp_apr' else ls_error)
+                layer_rows.append({'layer': layer, 'solver': solver, 'seed': seed, 'seconds': seconds, 'iterations': iterations,
+                                   'ms_per_iteration': 1e3 * seconds / max(iterations, 1), 'ls_error': ls_error,
+                                   'deviance': deviance, 'checkpoints': checkpoints})
+        if not layer_rows:
+            continue
+        layer_runs = pd.DataFrame(layer_rows)
+        best_error = layer_runs['ls_error'].min() * (1 + TARGET_MARGIN)
+        best_deviance = layer_runs['deviance'].min() * (1 + TARGET_MARGIN)
+        layer_runs['seconds_to_ls_target'] = [seconds_to(c, 2, best_error) for c in layer_runs['checkpoints']]
+        layer_runs['seconds_to_deviance_target'] = [seconds_to(c, 3, best_deviance) for c in layer_runs['checkpoints']]
+        run_rows.append(layer_runs.drop(columns='checkpoints'))
+
+        print(f"\n{layer} {dense_tensor.shape}, {sparse_tensor.nnz} nonzeros (density {sparse_tensor.density:.3f}):")
+        print(f"  {'solver':<8} {'seconds':>8} {'iters':>6} {'ms/iter':>8} {'LS error':>9} {'deviance':>12} "
+              f"{'t->LS target':>13} {'t->dev target':>14}   (medians over seeds)")
+        for solver, runs in layer_runs.groupby('solver', sort=False):
+            medians = runs.median(numeric_only=True)
+            to_ls, to_dev = medians['seconds_to_ls_target'], medians['seconds_to_deviance_target']
+            print(f"  {solver:<8} {medians['seconds']:>7.3f}s {medians['iterations']:>6.0f} {medians['ms_per_iteration']:>8.2f} "
+                  f"{medians['ls_error']:>9.5f} {medians['deviance']:>12.5g} "
+                  f"{'-' if np.isnan(to_ls) else f'{to_ls:.3f}s':>13} {'-' if np.isnan(to_dev) else f'{to_dev:.3f}s':>14}")
+
+        # --- Device Communities of the Best Model of Each Kind ---
+        best = {solver: min((key for key in fits if key[0] == solver), key=lambda key: fits[key][2], default=None)
+                for solver in solvers}
+        if best[LEAST_SQUARES_SOLVER] is None or best['cp_apr'] is None:
+            continue
+        ls_weights, ls_factors, _ = fits[best[LEAST_SQUARES_SOLVER]]
+        apr_weights, apr_factors, _ = fits[best['cp_apr']]
+        permutation, similarities = align_components(ls_factors, apr_factors, modes=(1, 2)) # Categories and time
+        ls_members = device_communities(ls_weights, ls_factors).argmax(axis=1)
+        apr_members = device_communities(apr_weights[permutation], [factor[:, permutation] for factor in apr_factors]).argmax(axis=1)
+        active = dense_tensor.sum(axis=(1, 2)) > 0
+        bursty = bursty_devices(dense_tensor, BURSTY_FRACTION)
+        agreement = float(np.mean(ls_members[active] == apr_members[active]))
+        bursty_agreement = float(np.mean(ls_members[bursty] == apr_members[bursty])) if bursty.any() else np.nan
+        community_rows.append({'layer': layer, 'matched_similarity': float(np.mean(similarities)), 'active_devices': int(active.sum()),
+                               'agreement': agreement, 'bursty_devices': int(bursty.sum()), 'bursty_agreement': bursty_agreement})
+        print(f"  Dominant community of {int(active.sum())} active devices: same in both models for {agreement:.0%} "
+              f"({bursty_agreement:.0%} of the {int(bursty.sum())} burstiest); matched component similarity {np.mean(similarities):.3f}")
+
+    try:
+        runs_path = os.path.join(TENSOR_DIR, f"benchmark_cp_apr_{AGGREGATION_METRIC}_runs.csv")
+        communities_path = os.path.join(TENSOR_DIR, f"benchmark_cp_apr_{AGGREGATION_METRIC}_communities.csv")
+        pd.concat(run_rows, ignore_index=True).to_csv(runs_path, index=False)
+        pd.DataFrame(community_rows).to_csv(communities_path, index=False)
+        print(f"\nSaved per-run results to {runs_path} and community agreement to {communities_path}")
+    except Exception as e:
+        print(f"Error saving benchmark results: {e}")
+
+    print("\n--- Benchmark Finished ---")
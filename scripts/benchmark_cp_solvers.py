@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from sparse_tensor import load_dense_tensor
+from rank_sweep import find_layer_tensors
+from cp_backends import LEAST_SQUARES_SOLVERS, decompose
+from cp_utils import relative_error, tensor_norm
+
+# --- Configuration ---
+TENSOR_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\tensors"
+AGGREGATION_METRIC = 'count' # Benchmarks every <layer>_<metric> tensor in TENSOR_DIR (the six layer tensors)
+SOLVERS = LEAST_SQUARES_SOLVERS # cp_backends solvers to compare (Poisson CP-APR: benchmark_cp_apr.py)
+RANK = 5
+SEEDS = [42, 43, 44]         # Every solver runs from the same random starts
+N_ITER_MAX = 500
+TOL = 1e-8
+TARGET_MARGIN = 0.01         # Target error per layer: best final error of any solver and seed, plus 1%
+
+
+# --- Benchmark Helpers ---
+def time_to_target(errors, seconds, target):
+    """Seconds until the error trajectory first reaches target (NaN if never).
+
+    Iterations of one solver cost the same, so the time of iteration k is taken as k / len(errors) of the run.
+    """
+    reached = np.flatnonzero(np.asarray(errors) <= target)
+    if len(errors) == 0 or len(reached) == 0:
+        return np.nan
+    return seconds * (reached[0] + 1) / len(errors)
+
+
+def run_solver(tensor, norm_tensor, solver, seed):
+    """One timed fit. Returns a dict with the error trajectory, fit time, iterations and final error."""
+    start = time.perf_counter()
+    try:
+        (weights, factors), errors = decompose(tensor, RANK, solver=solver, n_iter_max=N_ITER_MAX, init='random',
+                                               tol=TOL, random_state=seed, return_errors=True)
+    except Exception as e:
+        return {'solver': solver, 'seed': seed, 'status': f"failed: {e}", 'errors': [], 'seconds': time.perf_counter() - start,
+                'iterations': 0, 'final_error': np.nan}
+    seconds = time.perf_counter() - start
+    return {'solver': solver, 'seed': seed, 'status': 'ok', 'errors': errors, 'seconds': seconds, 'iterations': len(errors),
+            'final_error': relative_error(tensor, weights, factors, norm_tensor)}
+
+
+# --- Run Benchmark ---
+if __name__ == "__main__":
+    layer_paths = find_layer_tensors(TENSOR_DIR, AGGREGATION_METRIC)
+    if not layer_paths:
+        print(f"FATAL ERROR: No *_{AGGREGATION_METRIC}_tensor.npy files found in {TENSOR_DIR}")
+        sys.exit(1)
+    print(f"Benchmarking solvers {', '.join(SOLVERS)} at rank {RANK} on {len(layer_paths)} layers "
+          f"({len(SEEDS)} seeds, at most {N_ITER_MAX} iterations, tol {TOL:g})...")
+
+    run_rows, summary_rows = [], []
+    for layer, path in layer_paths.items():
+        tensor = np.asarray(load_dense_tensor(path), dtype=np.float64)
+        norm_tensor = tensor_norm(tensor)
+        runs = [run_solver(tensor, norm_tensor, solver, seed) for solver in SOLVERS for seed in SEEDS]
+        if all(run['status'] != 'ok' for run in runs):
+            print(f"\n{layer}: every run failed ({runs[0]['status']})")
+            continue
+        target = np.nanmin([run['final_error'] for run in runs]) * (1 + TARGET_MARGIN)
+        for run in runs:
+            run['layer'], run['shape'] = layer, 'x'.join(map(str, tensor.shape))
+            run['time_to_target_s'] = time_to_target(run['errors'], run['seconds'], target)
+            run['ms_per_iteration'] = 1e3 * run['seconds'] / max(run['iterations'], 1)
+            run_rows.append({key: value for key, value in run.items() if key != 'errors'})
+
+        layer_runs = pd.DataFrame(run_rows[-len(runs):])
+        summary = layer_runs.groupby('solver', sort=False).agg(
+            reached=('time_to_target_s', lambda times: int(times.notna().sum())),
+            median_time_to_target_s=('time_to_target_s', 'median'), best_error=('final_error', 'min'),
+            median_error=('final_error', 'median'), median_iterations=('iterations', 'median'),
+            ms_per_iteration=('ms_per_iteration', 'median'), total_seconds=('seconds', 'sum'))
+        # Fastest: lowest median time to target among solvers that reach it from most starts
+        # (otherwise the lowest median final error: starts end in different local minima)
+        reliable = summary[summary['reached'] * 2 > len(SEEDS)]
+        if not reliable.empty:
+            fastest, choice = reliable['median_time_to_target_s'].idxmin(), 'fastest'
+        else:
+            fastest, choice = summary['median_error'].idxmin(), 'best median fit, no solver reliably reaches the target'
+
+        print(f"\n{layer} {tensor.shape}: target error {target:.5f}")
+        print(f"  {'solver':<11} {'reached':>7} {'t->target':>10} {'best err':>9} {'median err':>10} {'iters':>6} {'ms/iter':>8}")
+        for solver, row in summary.iterrows():
+            reach_time = '-' if np.isnan(row['median_time_to_target_s']) else f"{row['median_time_to_target_s']:.3f}s"
+            print(f"  {solver:<11} {int(row['reached']):>4}/{len(SEEDS):<2} {reach_time:>10} "
+                  f"{row['best_error']:>9.5f} {row['median_error']:>10.5f} {row['median_iterations']:>6.0f} "
+                  f"{row['ms_per_iteration']:>8.2f}{f'  <-- {choice}' if solver == fastest else ''}")
+        summary_rows.append(summary.reset_index().assign(layer=layer, shape=run_rows[-1]['shape'], target_error=target,
+                                                         chosen=lambda frame: frame['solver'] == fastest))
+
+    try:
+        runs_path = os.path.join(TENSOR_DIR, f"benchmark_cp_solvers_{AGGREGATION_METRIC}_runs.csv")
+        summary_path = os.path.join(TENSOR_DIR, f"benchmark_cp_solvers_{AGGREGATION_METRIC}_summary.csv")
+        pd.DataFrame(run_rows).to_csv(runs_path, index=False)
+        pd.concat(summary_rows, ignore_index=True).to_csv(summary_path, index=False)
+        print(f"\nSaved per-run results to {runs_path} and the per-layer summary to {summary_path}")
+    except Exception as e:
+        print(f"Error saving benchmark results: {e}")
+
+    print("\n--- Benchmark Finished ---")
@@ -0,0 +1,68 @@
+import time
+import numpy as np
+import pandas as pd
+from benchmark_layer_aggregation import (
+    GATEWAY_IP, LOCAL_NETWORKS, BROADCAST_IP_STR, categorize_destination, make_synthetic_frame
+)
+from ip_categorizer import DestinationCategorizer
+from layer_aggregation import DESTINATION_CATEGORIES
+
+# --- Configuration ---
+NUM_PACKETS = 2_000_000   # Packets per synthetic day
+NUM_DAYS = 3              # Days categorized with the same (warm) categorizer
+RANDOM_SEED = 7
+
+# Edge cases checked against categorize_destination() on top of the synthetic traffic
+EDGE_CASE_IPS = [
+    "192.168.1.1", "192.168.1.255", "10.255.255.255", "8.8.8.255", "255.255.255.255", "224.0.0.251",
+    "239.255.255.250", "127.0.0.1", "169.254.10.1", "0.0.0.0", "100.64.1.1", "192.0.0.9", "192.0.0.171",
+    "192.0.2.5", "198.18.0.1", "203.0.113.9", "240.0.0.1", "172.32.0.1", "01.2.3.4", "1.2.3", "", "not-an-ip",
+    "2001:4860:4860::8888", "fe80::1", "ff02::fb", "::1", "::", "fd00::1", "::ffff:192.168.1.1",
+]
+
+# --- Run Benchmark ---
+if __name__ == "__main__":
+    rng = np.random.default_rng(RANDOM_SEED)
+    known_macs = [f"40:f6:bc:00:00:{i:02x}" for i in range(24)]
+
+    # --- Correctness: every distinct IP gets the same label as categorize_destination() ---
+    print("Checking labels against categorize_destination()...")
+    checker = DestinationCategorizer(GATEWAY_IP, LOCAL_NETWORKS, broadcast_ip=BROADCAST_IP_STR)
+    sample_ips = pd.unique(make_synthetic_frame(200_000, known_macs, rng)['ip.dst'])
+    mismatches = [ip for ip in list(sample_ips) + EDGE_CASE_IPS
+                  if checker.categorize(ip) != categorize_destination(ip, GATEWAY_IP)]
+    print(f"  {len(sample_ips) + len(EDGE_CASE_IPS)} distinct IPs checked, {len(mismatches)} mismatches")
+    if mismatches:
+        print(f"  MISMATCHES: {mismatches[:20]}")
+        raise SystemExit(1)
+
+    # One destination pool split into days, so later days revisit earlier destinations
+    all_days = make_synthetic_frame(NUM_PACKETS * NUM_DAYS, known_macs, rng)['ip.dst']
+    days = [all_days.iloc[d * NUM_PACKETS:(d + 1) * NUM_PACKETS].reset_index(drop=True) for d in range(NUM_DAYS)]
+
+    # --- Before: categorize_destination() per packet ---
+    print(f"\nPer-packet categorize_destination() on {NUM_PACKETS:,} packets (1 day)...")
+    start = time.time()
+    legacy_labels = days[0].map(lambda ip: categorize_destination(ip, GATEWAY_IP))
+    legacy_duration = time.time() - start
+    print(f"  {legacy_duration:.2f}s -> {NUM_PACKETS / legacy_duration:,.0f} packets/s")
+
+    # --- After: factorize + packed IPv4 checks + LRU shared across days ---
+    print(f"\nDestinationCategorizer over {NUM_DAYS} days of {NUM_PACKETS:,} packets...")
+    categorizer = DestinationCategorizer(GATEWAY_IP, LOCAL_NETWORKS, broadcast_ip=BROADCAST_IP_STR)
+    for day_index, ip_column in enumerate(days):
+        start = time.time()
+        codes = categorizer.column_codes(ip_column)
+        duration = time.time() - start
+        cache_state = "cold" if day_index == 0 else "warm"
+        print(f"  Day {day_index + 1} ({cache_state} cache): {duration:.3f}s -> {NUM_PACKETS / duration:,.0f} packets/s")
+        if day_index == 0:
+            print(f"  Speedup vs per-packet: {legacy_duration / duration:.0f}x")
+            first_day_codes = codes
+    print(f"  Cache: {len(categorizer._cache)} entries, {categorizer.cache_hits} hits, {categorizer.cache_misses} misses")
+
+    category_to_col_index = {category: i for i, category in enumerate(DESTINATION_CATEGORIES)}
+    expected_codes = legacy_labels.map(lambda category: category_to_col_index.get(category, -1)).to_numpy()
+    print(f"  Day 1 column codes match per-packet result: {np.array_equal(first_day_codes, expected_codes)}")
+
+    print("\n--- Benchmark Finished ---")
@@ -0,0 +1,150 @@
+import io
+import ipaddress
+import time
+import numpy as np
+import pandas as pd
+from layer_aggregation import DESTINATION_CATEGORIES, LAYER_KEYS, aggregate_layers, destination_codes
+
+# --- Configuration ---
+NUM_PACKETS = 3_000_000   # Size of the synthetic tshark frame
+NUM_DEVICES = 24          # Known IoT devices (rows)
+NUM_EXTERNAL_IPS = 3000   # Distinct external destinations in the synthetic day
+RANDOM_SEED = 42
+RUN_LEGACY_LOOP = True    # The iterrows loop takes minutes on multi-million-row frames
+
+LOCAL_NETWORKS = [
+    ipaddress.ip_network('192.168.0.0/16', strict=False),
+    ipaddress.ip_network('10.0.0.0/8', strict=False),
+    ipaddress.ip_network('172.16.0.0/12', strict=False),
+]
+BROADCAST_IP_STR = '255.255.255.255'
+GATEWAY_IP = "192.168.1.1"
+
+# --- Helper Function: Categorize Destination IP (as in parsing_all_new.py) ---
+def categorize_destination(ip_str, gateway_ip_str):
+    """Categorizes an IP address string."""
+    if not isinstance(ip_str, str) or not ip_str:
+        return "Non-IP/Invalid"
+    try:
+        ip_addr = ipaddress.ip_address(ip_str)
+        if gateway_ip_str and ip_str == gateway_ip_str: return "Gateway"
+        if ip_str == BROADCAST_IP_STR: return "Broadcast"
+        if ip_str.endswith('.255') and any(ip_addr in net for net in LOCAL_NETWORKS): return "Broadcast"
+        if ip_addr.is_multicast: return "Multicast"
+        if ip_addr.is_loopback: return "Loopback"
+        if ip_addr.is_link_local: return "Link-Local"
+        if ip_addr.is_unspecified: return "Unspecified"
+        for network in LOCAL_NETWORKS:
+            if ip_addr in network: return "Other Local IP"
+        if ip_addr.is_global: return "External"
+        else: return "Other/Unknown IP"
+    except ValueError:
+        return "Non-IP/Invalid"
+
+# --- Reference Implementation: the per-row loop from parsing_all_new.py ---
+def aggregate_layers_iterrows(df, mac_to_row_index, num_devices):
+    """Original per-packet aggregation loop, kept as the correctness and speed baseline."""
+    category_to_col_index = {category: i for i, category in enumerate(DESTINATION_CATEGORIES)}
+    matrix_dict_count = {key: np.zeros((num_devices, len(DESTINATION_CATEGORIES)), dtype=np.int64) for key in LAYER_KEYS}
+    packets_aggregated = 0
+    for _, row in df.iterrows():
+        row_index = mac_to_row_index.get(row['sll.src.eth'])
+        if row_index is not None:
+            category = categorize_destination(row['ip.dst'], GATEWAY_IP)
+            col_index = category_to_col_index.get(category)
+            if col_index is not None:
+                protocol = str(row['_ws.col.protocol']).upper()
+                dst_port_tcp = row['tcp.dstport']
+                dst_port_udp = row['udp.dstport']
+                matrix_dict_count['aggregated_ip'][row_index, col_index] += 1
+                packets_aggregated += 1
+                is_tcp_tls = "TCP" in protocol or "TLS" in protocol
+                is_udp_quic = protocol == "UDP" or "QUIC" in protocol
+                is_dns = protocol == "DNS" or (dst_port_udp == 53.0) or (dst_port_tcp == 53.0)
+                is_discovery = protocol == "SSDP" or protocol == "MDNS" or protocol == "DHCP"
+                if category == "External" and is_tcp_tls:
+                    matrix_dict_count['external_tcp_tls'][row_index, col_index] += 1
+                elif category == "External" and is_udp_quic:
+                    matrix_dict_count['external_udp_quic'][row_index, col_index] += 1
+                elif (category == "Broadcast" or category == "Multicast") and is_discovery:
+                    matrix_dict_count['local_discovery'][row_index, col_index] += 1
+                elif category == "Gateway" and is_dns:
+                    matrix_dict_count['gateway_dns'][row_index, col_index] += 1
+                elif category == "Other Local IP" and protocol == "TCP":
+                    matrix_dict_count['other_local_tcp'][row_index, col_index] += 1
+    return matrix_dict_count, packets_aggregated
+
+# --- Synthetic tshark Frame ---
+def make_synthetic_frame(num_packets, known_macs, rng):
+    """Builds a frame shaped like the cleaned tshark output of parsing_all_new.py."""
+    unknown_macs = [f"aa:bb:cc:00:00:{i:02x}" for i in range(8)]
+    mac_pool = np.array(known_macs + unknown_macs, dtype=object)
+    external_ips = [str(ipaddress.IPv4Address(int(x))) for x in rng.integers(0x01000000, 0xDF000000, NUM_EXTERNAL_IPS)]
+    local_ips = [f"192.168.1.{i}" for i in range(2, 60)] + ["10.0.0.5", "172.16.3.4"]
+    special_ips = [GATEWAY_IP, BROADCAST_IP_STR, "192.168.1.255", "224.0.0.251", "239.255.255.250",
+                   "127.0.0.1", "169.254.3.3", "0.0.0.0", "100.64.0.1", ""]
+    ip_pool = np.array(external_ips + local_ips + special_ips, dtype=object)
+    ip_weights = np.concatenate([np.full(len(external_ips), 0.6 / len(external_ips)),
+                                 np.full(len(local_ips), 0.15 / len(local_ips)),
+                                 np.full(len(special_ips), 0.25 / len(special_ips))])
+    protocols = np.array(["TCP", "TLSv1.2", "TLSv1.3", "UDP", "QUIC", "GQUIC", "DNS", "MDNS", "SSDP",
+                          "DHCP", "HTTP", "NTP", "ICMP", np.nan], dtype=object)
+
+    df = pd.DataFrame({
+        'sll.src.eth': mac_pool[rng.integers(0, len(mac_pool), num_packets)],
+        'ip.dst': ip_pool[rng.choice(len(ip_pool), num_packets, p=ip_weights)],
+        '_ws.col.protocol': protocols[rng.integers(0, len(protocols), num_packets)],
+    })
+    ports = np.array([53, 80, 443, 123, 1900, 5353, 8080, np.nan])
+    df['tcp.dstport'] = ports[rng.integers(0, len(ports), num_packets)]
+    df['udp.dstport'] = ports[rng.integers(0, len(ports), num_packets)]
+    df['frame.len'] = rng.integers(60, 1514, num_packets).astype(np.int64)
+    return df
+
+def matrices_to_csv_bytes(matrix_dict_count, known_macs):
+    """Serializes every layer matrix exactly as parsing_all_new.py writes it."""
+    serialized = {}
+    for layer_key, matrix_data in matrix_dict_count.items():
+        buffer = io.StringIO()
+        pd.DataFrame(matrix_data, index=pd.Index(known_macs, name="MAC_Address"),
+                     columns=DESTINATION_CATEGORIES).to_csv(buffer, index=True, header=True)
+        serialized[layer_key] = buffer.getvalue().encode('utf-8')
+    return serialized
+
+# --- Run Benchmark ---
+if __name__ == "__main__":
+    rng = np.random.default_rng(RANDOM_SEED)
+    known_macs = [f"40:f6:bc:00:00:{i:02x}" for i in range(NUM_DEVICES)]
+    mac_to_row_index = {mac: i for i, mac in enumerate(known_macs)}
+
+    print(f"Building synthetic frame with {NUM_PACKETS:,} packets...")
+    df = make_synthetic_frame(NUM_PACKETS, known_macs, rng)
+
+    print("\nRunning columnar aggregation...")
+    start = time.time()
+    dest_col_codes = destination_codes(df['ip.dst'], categorize_destination, GATEWAY_IP)
+    columnar_result, columnar_packets = aggregate_layers(df, mac_to_row_index, NUM_DEVICES, dest_col_codes)
+    columnar_duration = time.time() - start
+    print(f"  Columnar: {columnar_duration:.2f}s ({NUM_PACKETS / columnar_duration:,.0f} packets/s), "
+          f"aggregated {columnar_packets:,} packets")
+
+    if RUN_LEGACY_LOOP:
+        print("\nRunning legacy iterrows loop...")
+        start = time.time()
+        legacy_result, legacy_packets = aggregate_layers_iterrows(df, mac_to_row_index, NUM_DEVICES)
+        legacy_duration = time.time() - start
+        print(f"  iterrows: {legacy_duration:.2f}s ({NUM_PACKETS / legacy_duration:,.0f} packets/s), "
+              f"aggregated {legacy_packets:,} packets")
+        print(f"  Speedup: {legacy_duration / columnar_duration:.1f}x")
+
+        columnar_csvs = matrices_to_csv_bytes(columnar_result, known_macs)
+        legacy_csvs = matrices_to_csv_bytes(legacy_result, known_macs)
+        identical = columnar_packets == legacy_packets and all(
+            columnar_csvs[key] == legacy_csvs[key] for key in LAYER_KEYS)
+        print(f"\nByte-identical CSVs for all {len(LAYER_KEYS)} layers: {identical}")
+        if not identical:
+            for key in LAYER_KEYS:
+                if columnar_csvs[key] != legacy_csvs[key]: print(f"  MISMATCH in layer {key}")
+            raise SystemExit(1)
+
+    print("\n--- Benchmark Finished ---")
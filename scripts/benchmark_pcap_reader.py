@@ -0,0 +1,137 @@
+import os
+import time
+import shutil
+import struct
+import tempfile
+import numpy as np
+import pandas as pd
+from benchmark_layer_aggregation import GATEWAY_IP, LOCAL_NETWORKS
+from ip_categorizer import DestinationCategorizer
+from layer_aggregation import LAYER_KEYS, aggregate_layers, empty_layer_matrices, add_layer_matrices
+from tshark_reader import build_tshark_cmd, iter_tshark_chunks
+from pcap_reader import LINKTYPE_LINUX_SLL, iter_pcap_chunks
+
+# --- Configuration ---
+PCAP_FILE = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\28013234\pcapIoT\52095392_IoT_2023-05-16.pcap" # <--- ADJUST IF NEEDED
+MAC_ADDRESS_FILE = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\28013234 (1)\CSVs\macAddresses.csv"
+SYNTHETIC_PACKETS = 300_000 # Used when PCAP_FILE does not exist: a synthetic SLL capture is written instead
+CHUNK_PACKETS = 500_000
+
+# --- Synthetic Linux Cooked Capture ---
+def write_synthetic_pcap(path, num_packets, known_macs, rng):
+    """Writes an SLL pcap with IPv4 TCP/UDP/ICMP traffic from known and unknown MACs."""
+    macs = [bytes.fromhex(mac.replace(':', '')) for mac in known_macs] + [bytes.fromhex('02deadbeef%02x' % i) for i in range(4)]
+    destinations = [GATEWAY_IP, "8.8.8.8", "52.94.236.248", "192.168.1.77", "255.255.255.255", "239.255.255.250", "224.0.0.251"]
+    destinations += [f"13.{rng.integers(0, 256)}.{rng.integers(0, 256)}.{rng.integers(1, 255)}" for _ in range(200)]
+    dst_packed = [bytes(int(octet) for octet in ip.split('.')) for ip in destinations]
+    l4_choices = [(6, 443, 100), (6, 443, 0), (6, 80, 60), (6, 8883, 30), (6, 5000, 0), (17, 53, 40), (17, 443, 1200),
+                  (17, 5353, 80), (17, 1900, 120), (17, 67, 300), (17, 40000, 20), (1, None, 56)]
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 262144, LINKTYPE_LINUX_SLL))
+        mac_idx = rng.integers(0, len(macs), num_packets)
+        dst_idx = rng.integers(0, len(dst_packed), num_packets)
+        l4_idx = rng.integers(0, len(l4_choices), num_packets)
+        start = 1684195200
+        for i in range(num_packets):
+            proto, port, payload_len = l4_choices[l4_idx[i]]
+            if proto == 6:
+                l4 = struct.pack('!HHIIBBHHH', 51000, port, 0, 0, 5 << 4, 0x18, 1024, 0, 0) + b'\x00' * payload_len
+            elif proto == 17:
+                l4 = struct.pack('!HHHH', 40001, port, 8 + payload_len, 0) + b'\x00' * payload_len
+            else:
+                l4 = b'\x08\x00' + b'\x00' * (payload_len - 2)
+            ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(l4), 0, 0, 64, proto, 0, b'\xc0\xa8\x01\x0a', dst_packed[dst_idx[i]])
+            sll = struct.pack('!HHH8sH', 4, 1, 6, macs[mac_idx[i]] + b'\x00\x00', 0x0800)
+            frame = sll + ip + l4
+            f.write(struct.pack('<IIII', start + i // 10, (i % 10) * 100000, len(frame), len(frame)))
+            f.write(frame)
+
+
+# --- Readers Under Test ---
+def aggregate_chunks(chunks, mac_to_row_index, num_devices, categorizer):
+    matrix_dict_count = empty_layer_matrices(num_devices)
+    rows_read = 0
+    for chunk in chunks:
+        rows_read += len(chunk)
+        chunk_matrices, _ = aggregate_layers(chunk, mac_to_row_index, num_devices, categorizer.column_codes(chunk['ip.dst']))
+        add_layer_matrices(matrix_dict_count, chunk_matrices)
+    return matrix_dict_count, rows_read
+
+
+def scapy_frame(pcap_path):
+    """Per-packet scapy loop extracting the same fields (like the dataset's original scripts)."""
+    from scapy.all import PcapReader as ScapyPcapReader, CookedLinux, Ether, IP, TCP, UDP
+    rows = []
+    with ScapyPcapReader(pcap_path) as packets:
+        for packet in packets:
+            if IP not in packet:
+                continue
+            if CookedLinux in packet: # Raw 8-byte link-layer address field; the MAC is its first 6 bytes
+                src = ':'.join(f"{byte:02x}" for byte in packet[CookedLinux].src[:6])
+            else:
+                src = packet[Ether].src if Ether in packet else ''
+            tcp_port = packet[TCP].dport if TCP in packet else np.nan
+            udp_port = packet[UDP].dport if UDP in packet else np.nan
+            protocol = "TCP" if TCP in packet else ("UDP" if UDP in packet else "IPv4")
+            rows.append((str(src).lower(), packet[IP].dst, protocol, tcp_port, udp_port, len(packet)))
+    return pd.DataFrame(rows, columns=['sll.src.eth', 'ip.dst', '_ws.col.protocol', 'tcp.dstport', 'udp.dstport', 'frame.len'])
+
+
+# --- Run Benchmark ---
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    temp_dir = None
+    if os.path.isfile(MAC_ADDRESS_FILE):
+        known_macs = pd.read_csv(MAC_ADDRESS_FILE)['MAC Address'].str.lower().tolist()
+    else:
+        known_macs = [f"00:17:88:{i:02x}:{i * 7 % 256:02x}:{i * 13 % 256:02x}" for i in range(24)]
+    pcap_path = PCAP_FILE
+    if not os.path.isfile(pcap_path):
+        temp_dir = tempfile.mkdtemp()
+        pcap_path = os.path.join(temp_dir, "synthetic_sll.pcap")
+        print(f"{PCAP_FILE} not found; writing {SYNTHETIC_PACKETS:,} synthetic SLL packets...")
+        write_synthetic_pcap(pcap_path, SYNTHETIC_PACKETS, known_macs, rng)
+    mac_to_row_index = {mac: i for i, mac in enumerate(known_macs)}
+    print(f"Benchmarking readers on {os.path.basename(pcap_path)} ({os.path.getsize(pcap_path) / 1e6:.1f} MB)")
+
+    results = {}
+    try:
+        start = time.time()
+        matrices, rows = aggregate_chunks(iter_pcap_chunks(pcap_path, CHUNK_PACKETS), mac_to_row_index, len(known_macs),
+                                          DestinationCategorizer(GATEWAY_IP, LOCAL_NETWORKS))
+        results['native'] = (time.time() - start, rows, matrices)
+
+        if shutil.which('tshark'):
+            start = time.time()
+            matrices, rows = aggregate_chunks(iter_tshark_chunks(build_tshark_cmd(pcap_path), CHUNK_PACKETS), mac_to_row_index,
+                                              len(known_macs), DestinationCategorizer(GATEWAY_IP, LOCAL_NETWORKS))
+            results['tshark streaming'] = (time.time() - start, rows, matrices)
+        else:
+            print("  tshark not found on PATH, skipping tshark reader.")
+
+        try:
+            start = time.time()
+            df = scapy_frame(pcap_path)
+            matrices, rows = aggregate_chunks([df], mac_to_row_index, len(known_macs), DestinationCategorizer(GATEWAY_IP, LOCAL_NETWORKS))
+            results['scapy'] = (time.time() - start, rows, matrices)
+        except ImportError:
+            print("  scapy not installed, skipping scapy reader.")
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    for label, (seconds, rows, _) in results.items():
+        print(f"  {label:<20} {seconds:8.2f}s  {rows / seconds:>12,.0f} packets/s")
+
+    # Device x category totals only depend on MAC and destination, so they must match exactly;
+    # per-layer totals can differ where tshark's dissector names differ from the port-based labels.
+    _, _, native = results['native']
+    for label, (_, _, matrices) in results.items():
+        if label == 'native':
+            continue
+        same_ip = np.array_equal(native['aggregated_ip'], matrices['aggregated_ip'])
+        print(f"\nnative vs {label}: aggregated_ip identical: {same_ip}")
+        for key in LAYER_KEYS[1:]:
+            print(f"  {key:<20} native {int(native[key].sum()):>10,}  {label} {int(matrices[key].sum()):>10,}")
+    print("\nNative layer totals:", {key: int(native[key].sum()) for key in LAYER_KEYS})
+    print("\n--- Benchmark Finished ---")
@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from benchmark_layer_aggregation import GATEWAY_IP, LOCAL_NETWORKS
+from ip_categorizer import DestinationCategorizer
+from layer_aggregation import LAYER_KEYS, aggregate_layers, empty_layer_matrices, add_layer_matrices
+from tshark_reader import build_tshark_cmd, read_tshark_buffered, iter_tshark_chunks
+
+# --- Configuration ---
+PCAP_FILE = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\28013234\pcapIoT\52095392_IoT_2023-05-16.pcap" # <--- ADJUST IF NEEDED
+MAC_ADDRESS_FILE = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\28013234 (1)\CSVs\macAddresses.csv"
+CHUNK_SIZES = [100_000, 500_000] # Streaming chunk sizes to compare against the buffered path
+
+# --- Peak Memory of the Current Process ---
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None if it cannot be measured here)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024 # bytes on macOS, KB on Linux
+    except ImportError:
+        pass
+    try:
+        import psutil # Windows: peak working set
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+# --- One Ingest Run (executed in a fresh process so peak RSS is per mode) ---
+def run_ingest(mode, chunk_rows):
+    known_macs = pd.read_csv(MAC_ADDRESS_FILE)['MAC Address'].str.lower().tolist()
+    mac_to_row_index = {mac: i for i, mac in enumerate(known_macs)}
+    categorizer = DestinationCategorizer(GATEWAY_IP, LOCAL_NETWORKS)
+    tshark_cmd = build_tshark_cmd(PCAP_FILE)
+
+    start = time.time()
+    rows_read = 0
+    if mode == 'buffered':
+        df = read_tshark_buffered(tshark_cmd)
+        rows_read = 0 if df is None else len(df)
+        if df is None:
+            matrix_dict_count = empty_layer_matrices(len(known_macs))
+        else:
+            matrix_dict_count, _ = aggregate_layers(df, mac_to_row_index, len(known_macs), categorizer.column_codes(df['ip.dst']))
+    else:
+        matrix_dict_count = empty_layer_matrices(len(known_macs))
+        for chunk in iter_tshark_chunks(tshark_cmd, chunk_rows):
+            rows_read += len(chunk)
+            chunk_matrices, _ = aggregate_layers(chunk, mac_to_row_index, len(known_macs), categorizer.column_codes(chunk['ip.dst']))
+            add_layer_matrices(matrix_dict_count, chunk_matrices)
+    duration = time.time() - start
+    return {'rows': rows_read, 'seconds': duration, 'peak_rss_mb': peak_rss_mb(),
+            'totals': {key: int(matrix_dict_count[key].sum()) for key in LAYER_KEYS}}
+
+# --- Run Benchmark ---
+if __name__ == "__main__":
+    if not os.path.isfile(PCAP_FILE):
+        print(f"FATAL ERROR: pcap file not found: {PCAP_FILE}")
+        sys.exit(1)
+    print(f"Benchmarking tshark ingest on {os.path.basename(PCAP_FILE)} "
+          f"({os.path.getsize(PCAP_FILE) / 1e6:.1f} MB)")
+
+    runs = [('buffered', None)] + [('streaming', rows) for rows in CHUNK_SIZES]
+    results = {}
+    for mode, chunk_rows in runs:
+        label = mode if chunk_rows is None else f"{mode} ({chunk_rows:,} rows/chunk)"
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            result = executor.submit(run_ingest, mode, chunk_rows).result()
+        results[label] = result
+        peak = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else "n/a"
+        print(f"  {label:<36} {result['seconds']:8.2f}s  {result['rows'] / result['seconds']:>12,.0f} packets/s  peak RSS {peak}")
+
+    baseline = results['buffered']['totals']
+    consistent = all(result['totals'] == baseline for result in results.values())
+    print(f"\nAll modes produced identical layer totals: {consistent}")
+    print("\n--- Benchmark Finished ---")
@@ -0,0 +1,120 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+
+# --- Incremental Build Manifest ---
+# Records, per pcap, the fingerprint it was processed with (file size + mtime or content hash,
+# plus a hash of every setting that changes the output). A day is only re-parsed when its
+# fingerprint changed or one of its layer CSVs (or its completion marker) is missing. Layers that received new days are
+# listed in tensors/stale_tensors.json until load_tensor.py rebuilds them.
+
+MANIFEST_FILENAME = "parsing_manifest.json"
+STALE_TENSORS_FILENAME = "stale_tensors.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Hex SHA-256 of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pcap_fingerprint(path, hash_content=False):
+    """Identity of a capture file: size and mtime, or its content hash when hash_content is set."""
+    stat = os.stat(path)
+    if hash_content:
+        return {'size': stat.st_size, 'sha256': file_sha256(path)}
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def settings_fingerprint(settings, functions=()):
+    """Hash of the processing settings plus the source code of the functions defining the layers."""
+    payload = {'settings': settings, 'sources': [inspect.getsource(fn) for fn in functions]}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _write_json_atomic(path, data):
+    temp_path = f"{path}.tmp{os.getpid()}"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def _read_json(path, default):
+    if not os.path.isfile(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read {path} ({e}). Ignoring it.")
+        return default
+
+
+class BuildManifest:
+    """Per-pcap record of what was processed, stored as JSON in the output directory."""
+
+    def __init__(self, output_dir, settings_hash, hash_content=False):
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.settings_hash = settings_hash
+        self.hash_content = hash_content
+        data = _read_json(self.path, {})
+        if data.get('version') != MANIFEST_VERSION:
+            data = {}
+        self.entries = data.get('pcaps', {})
+
+    @staticmethod
+    def _key(pcap_path):
+        return os.path.normcase(os.path.abspath(pcap_path))
+
+    def is_up_to_date(self, pcap_path):
+        """True if the pcap was processed with the current settings and all its recorded outputs still exist."""
+        entry = self.entries.get(self._key(pcap_path))
+        if entry is None or entry.get('settings') != self.settings_hash:
+            return False
+        if entry.get('fingerprint') != pcap_fingerprint(pcap_path, self.hash_content):
+            return False
+        return all(os.path.isfile(path) for path in entry.get('outputs', []))
+
+    def record(self, pcap_path, date, output_paths):
+        self.entries[self._key(pcap_path)] = {
+            'date': date,
+            'fingerprint': pcap_fingerprint(pcap_path, self.hash_content),
+            'settings': self.settings_hash,
+            'outputs': sorted(output_paths),
+            'processed_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+    def save(self):
+        _write_json_atomic(self.path, {'version': MANIFEST_VERSION, 'pcaps': self.entries})
+
+
+# --- Tensor Staleness Flags ---
+def mark_tensors_stale(tensor_dir, layer_dir_names, dates):
+    """Flags the tensors built from the given layer directories as needing a rebuild."""
+    os.makedirs(tensor_dir, exist_ok=True)
+    path = os.path.join(tensor_dir, STALE_TENSORS_FILENAME)
+    stale = _read_json(path, {})
+    for layer_dir_name in layer_dir_names:
+        entry = stale.setdefault(layer_dir_name, {'changed_dates': []})
+        entry['changed_dates'] = sorted(set(entry['changed_dates']) | set(dates))
+        entry['flagged_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    _write_json_atomic(path, stale)
+
+
+def clear_stale_tensor(tensor_dir, layer_dir_name):
+    """Removes the stale flag of one layer after its tensor has been rebuilt."""
+    path = os.path.join(tensor_dir, STALE_TENSORS_FILENAME)
+    stale = _read_json(path, {})
+    if stale.pop(layer_dir_name, None) is not None:
+        _write_json_atomic(path, stale)
+
+
+def stale_tensor_layers(tensor_dir):
+    """{layer_dir_name: flag info} for every layer whose tensor is out of date."""
+    return _read_json(os.path.join(tensor_dir, STALE_TENSORS_FILENAME), {})
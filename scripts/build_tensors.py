@@ -0,0 +1,256 @@
+import os
+import re
+import sys
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from build_manifest import clear_stale_tensor, stale_tensor_layers
+from tensor_store import META_FILENAME, TensorStore
+from layer_aggregation import DESTINATION_CATEGORIES
+
+# --- Multi-Layer Tensor Builder ---
+# Replaces one load_tensor.py run per layer: every layer_<key>_<metric> directory is scanned once,
+# all daily CSVs are parsed in parallel with a fixed-schema reader (no pandas), and the script
+# writes each layer's (N, M, T) tensor under its usual name plus one stacked (L, N, M, T) tensor
+# and a JSON index of its layers, devices, categories and dates. With UPDATE_TENSOR_STORES each
+# layer's appendable <layer>_<metric>.store is brought up to date by reading only new or changed days.
+
+# --- Configuration ---
+OUTPUT_BASE_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir"
+OUTPUT_TENSOR_DIR = os.path.join(OUTPUT_BASE_DIR, "tensors")
+AGGREGATION_METRIC = 'count' # Builds the layer_*_<metric> directories ('count', 'bytes' or 'distinct_dst')
+NUM_READERS = 8 # Threads parsing CSV files
+WRITE_LAYER_TENSORS = True # One <layer>_<metric>_tensor.npy per layer, as load_tensor.py writes them
+WRITE_STACKED_TENSOR = True # all_layers_<metric>_tensor.npy with shape (layers, devices, categories, days)
+UPDATE_TENSOR_STORES = True # Append new / changed days to each layer's memory-mapped store (see tensor_store.py)
+# With both WRITE_* options off only the stores are updated, reading just the days they are missing
+
+# Tensor file names that differ from the layer key
+TENSOR_NAME_OVERRIDES = {'other_local_tcp': 'local_tcp'}
+
+EXPECTED_HEADER_FIRST_COLUMN = "MAC_Address"
+_DAY_FILE_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2})\.csv$')
+
+
+def tensor_layer_name(layer_key, metric):
+    return f"{TENSOR_NAME_OVERRIDES.get(layer_key, layer_key)}_{metric}"
+
+
+def find_layer_dirs(base_dir, metric):
+    """{layer_key: directory} of every daily layer_<key>_<metric> directory (sub-daily *_<bin>min ones excluded)."""
+    pattern = re.compile(rf'^layer_(.+)_{re.escape(metric)}$')
+    layer_dirs = {}
+    for name in sorted(os.listdir(base_dir)):
+        match = pattern.match(name)
+        if match and os.path.isdir(os.path.join(base_dir, name)):
+            layer_dirs[match.group(1)] = os.path.join(base_dir, name)
+    return layer_dirs
+
+
+def day_files(layer_dir):
+    """{date: path} of the YYYY-MM-DD.csv files of one layer directory."""
+    files = {}
+    for name in os.listdir(layer_dir):
+        match = _DAY_FILE_PATTERN.match(name)
+        if match: files[match.group(1)] = os.path.join(layer_dir, name)
+    return files
+
+
+def read_day_csv(path):
+    """Fixed-schema reader for one daily layer CSV: (header tuple, MAC tuple, int64 N x M matrix)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        header = tuple(f.readline().rstrip('\r\n').split(','))
+        rows = [line.rstrip('\r\n').split(',') for line in f if line.strip()]
+    macs = tuple(row[0] for row in rows)
+    matrix = np.array([row[1:] for row in rows], dtype=np.int64)
+    return header, macs, matrix
+
+
+def _read_or_error(path):
+    try:
+        return read_day_csv(path), None
+    except Exception as e:
+        return None, e
+
+
+def majority_schema(results):
+    """(header, macs) shared by the most parsed files of _read_or_error results, None if there are none.
+
+    Ties go to the header with the expected MAC_Address + DESTINATION_CATEGORIES columns, so one odd file
+    read first cannot make every other day look wrong.
+    """
+    schemas = Counter((parsed[0], parsed[1]) for parsed, _ in results if parsed is not None)
+    if not schemas:
+        return None
+    expected_header = (EXPECTED_HEADER_FIRST_COLUMN, *DESTINATION_CATEGORIES)
+    return max(schemas, key=lambda schema: (schemas[schema], schema[0] == expected_header))
+
+
+def build_layer_tensors(layer_dirs, num_readers=NUM_READERS):
+    """Reads all days of all layers. Returns (dates, devices, categories, {layer_key: (N, M, T) tensor}).
+
+    Only dates present (and valid) in every layer are used, so all tensors share one time axis.
+    """
+    jobs = [(layer_key, date, path) for layer_key, layer_dir in layer_dirs.items()
+            for date, path in day_files(layer_dir).items()]
+    with ThreadPoolExecutor(max_workers=num_readers) as executor:
+        results = list(executor.map(_read_or_error, [path for _, _, path in jobs]))
+
+    reference = majority_schema(results) # (header, macs) every file must match
+    matrices = {layer_key: {} for layer_key in layer_dirs}
+    for (layer_key, date, path), (parsed, error) in zip(jobs, results):
+        if parsed is None:
+            print(f"  WARNING: Skipping {path}: {error}")
+            continue
+        header, macs, matrix = parsed
+        if (header, macs) != reference or matrix.shape != (len(macs), len(header) - 1):
+            print(f"  WARNING: Skipping {path}: header, device order or shape differs from most other files.")
+            continue
+        matrices[layer_key][date] = matrix
+    if reference is None:
+        raise ValueError("No valid daily CSV files found.")
+    if reference[0][0] != EXPECTED_HEADER_FIRST_COLUMN:
+        print(f"  WARNING: First CSV column is '{reference[0][0]}', expected '{EXPECTED_HEADER_FIRST_COLUMN}'.")
+
+    date_sets = [set(layer_matrices) for layer_matrices in matrices.values()]
+    dates = sorted(set.intersection(*date_sets))
+    for layer_key, layer_matrices in matrices.items():
+        dropped = sorted(set(layer_matrices) - set(dates))
+        if dropped: print(f"  WARNING: {layer_key}: ignoring {len(dropped)} dates missing from other layers: {', '.join(dropped)}")
+    if not dates:
+        raise ValueError("No date is present in every layer directory.")
+
+    header, macs = reference
+    tensors = {layer_key: np.stack([layer_matrices[date] for date in dates], axis=2)
+               for layer_key, layer_matrices in matrices.items()}
+    return dates, list(macs), list(header[1:]), tensors
+
+
+def update_layer_store(store_path, layer_dir, changed_dates=(), num_readers=NUM_READERS):
+    """Writes the days of layer_dir that the store lacks (or that changed since) into it. Returns the dates written."""
+    files = day_files(layer_dir)
+    store = TensorStore(store_path) if os.path.isfile(os.path.join(store_path, META_FILENAME)) else None
+    stored = set(store.dates) if store is not None else set()
+    pending = sorted(date for date in files if date not in stored or date in set(changed_dates))
+    if not pending:
+        return []
+    with ThreadPoolExecutor(max_workers=num_readers) as executor:
+        results = list(executor.map(_read_or_error, [files[date] for date in pending]))
+    dates, matrices = [], []
+    schema = majority_schema(results) if store is None else None # A new store takes the schema most pending days share
+    for date, (parsed, error) in zip(pending, results):
+        if parsed is None:
+            print(f"  WARNING: Skipping {files[date]}: {error}")
+            continue
+        header, macs, matrix = parsed
+        if store is None and (header, macs) == schema:
+            store = TensorStore.create(store_path, macs, header[1:], dtype=matrix.dtype)
+        if store is None:
+            print(f"  WARNING: Skipping {files[date]}: devices/categories differ from most days of {os.path.basename(store_path)}.")
+            continue
+        if list(macs) != store.devices or list(header[1:]) != store.categories:
+            print(f"  WARNING: Skipping {files[date]}: devices/categories differ from {os.path.basename(store_path)}.")
+            continue
+        dates.append(date)
+        matrices.append(matrix)
+    if store is not None:
+        store.write_days(dates, matrices)
+    return dates
+
+
+def _save_npy_atomic(path, array):
+    temp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(temp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path): os.remove(temp_path)
+
+
+# --- Run ---
+if __name__ == "__main__":
+    start_time = time.time()
+    print(f"Scanning {OUTPUT_BASE_DIR} for layer_*_{AGGREGATION_METRIC} directories...")
+    try:
+        layer_dirs = find_layer_dirs(OUTPUT_BASE_DIR, AGGREGATION_METRIC)
+    except OSError as e:
+        print(f"FATAL ERROR: {e}")
+        sys.exit(1)
+    if not layer_dirs:
+        print(f"FATAL ERROR: No layer_*_{AGGREGATION_METRIC} directories found.")
+        sys.exit(1)
+    print(f"Found {len(layer_dirs)} layers: {', '.join(layer_dirs)}")
+
+    os.makedirs(OUTPUT_TENSOR_DIR, exist_ok=True)
+    layer_keys = list(layer_dirs)
+    stale = stale_tensor_layers(OUTPUT_TENSOR_DIR)
+
+    # --- Incremental store update (only days missing from a store, or flagged changed, are read) ---
+    if UPDATE_TENSOR_STORES:
+        updated_keys = [] # Layers whose store is current (a failed one keeps its stale flag)
+        for layer_key in layer_keys:
+            dir_name = os.path.basename(layer_dirs[layer_key])
+            store_path = os.path.join(OUTPUT_TENSOR_DIR, f"{tensor_layer_name(layer_key, AGGREGATION_METRIC)}.store")
+            try:
+                written = update_layer_store(store_path, layer_dirs[layer_key], stale.get(dir_name, {}).get('changed_dates', []))
+            except Exception as e:
+                print(f"  ERROR updating {store_path}: {e}")
+                continue
+            updated_keys.append(layer_key)
+            if written: print(f"  Store {os.path.basename(store_path)}: wrote {len(written)} days ({written[0]} .. {written[-1]})")
+            else: print(f"  Store {os.path.basename(store_path)}: up to date")
+        if not (WRITE_LAYER_TENSORS or WRITE_STACKED_TENSOR):
+            for layer_key in updated_keys:
+                clear_stale_tensor(OUTPUT_TENSOR_DIR, os.path.basename(layer_dirs[layer_key]))
+            failed = len(layer_keys) - len(updated_keys)
+            print(f"\nUpdated {len(updated_keys)} tensor stores in {time.time() - start_time:.3f}s{f' ({failed} failed)' if failed else ''}.")
+            print("\n--- Script Finished ---")
+            sys.exit(0)
+
+    try:
+        dates, devices, categories, tensors = build_layer_tensors(layer_dirs)
+    except Exception as e:
+        print(f"FATAL ERROR building tensors: {e}")
+        sys.exit(1)
+    read_duration = time.time() - start_time
+    print(f"Read {len(layer_dirs)} x {len(dates)} days ({len(devices)} devices x {len(categories)} categories) in {read_duration:.3f}s.")
+
+    tensor_files = {layer_key: f"{tensor_layer_name(layer_key, AGGREGATION_METRIC)}_tensor.npy" for layer_key in layer_keys}
+    try:
+        if WRITE_LAYER_TENSORS:
+            for layer_key in layer_keys:
+                _save_npy_atomic(os.path.join(OUTPUT_TENSOR_DIR, tensor_files[layer_key]), tensors[layer_key])
+                print(f"  Saved {tensor_files[layer_key]} (Shape: {tensors[layer_key].shape})")
+        if WRITE_STACKED_TENSOR:
+            stacked_name = f"all_layers_{AGGREGATION_METRIC}_tensor.npy"
+            stacked = np.stack([tensors[layer_key] for layer_key in layer_keys], axis=0)
+            _save_npy_atomic(os.path.join(OUTPUT_TENSOR_DIR, stacked_name), stacked)
+            print(f"  Saved {stacked_name} (Shape: {stacked.shape}, layers x devices x categories x days)")
+        index = {
+            'metric': AGGREGATION_METRIC,
+            'layers': layer_keys,
+            'layer_dirs': [os.path.basename(layer_dirs[layer_key]) for layer_key in layer_keys],
+            'tensor_files': [tensor_files[layer_key] for layer_key in layer_keys],
+            'devices': devices,
+            'categories': categories,
+            'dates': dates,
+        }
+        index_path = os.path.join(OUTPUT_TENSOR_DIR, f"tensor_index_{AGGREGATION_METRIC}.json")
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1)
+        print(f"  Saved index to {index_path}")
+    except Exception as e:
+        print(f"FATAL ERROR saving tensors: {e}")
+        sys.exit(1)
+
+    # These layers' tensors are current again (see build_manifest.py / parsing_all_new.py)
+    for layer_key in layer_keys:
+        clear_stale_tensor(OUTPUT_TENSOR_DIR, os.path.basename(layer_dirs[layer_key]))
+    still_stale = sorted(stale_tensor_layers(OUTPUT_TENSOR_DIR))
+    if still_stale: print(f"Note: Tensors still flagged stale for: {', '.join(still_stale)}")
+
+    print(f"\nBuilt {len(layer_keys)} layer tensors in {time.time() - start_time:.3f}s.")
+    print("\n--- Script Finished ---")
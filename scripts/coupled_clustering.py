@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import pandas as pd
+import sys
+import time
+from sparse_tensor import load_dense_tensor
+from rank_sweep import find_layer_tensors
+from coupled_cpd import coupled_non_negative_parafac
+from cp_utils import relative_error
+
+# --- Configuration ---
+TENSOR_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\tensors"
+FACTOR_OUTPUT_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\factors"
+
+# --- CHOOSE THE LAYERS AND THE JOINT RANK ---
+AGGREGATION_METRIC = 'count' # 'count', 'bytes' or 'distinct_dst' tensors built by load_tensor.py
+LAYERS = None              # None: every <layer>_<metric> tensor in TENSOR_DIR; or e.g. ['local_tcp_count', 'gateway_dns_count']
+CHOSEN_RANK = 5            # One rank for all layers: component r is the same device community in each
+SHARE_TIME_FACTOR = False  # True: one time factor C for all layers as well
+NORMALIZE_LAYERS = True    # Divide each layer by its norm so large layers do not dominate the fit
+# --- END CHOOSE ---
+
+# --- CPD Parameters (see coupled_cpd.py) ---
+CPD_TOL = 1e-8
+CPD_N_ITER_MAX = 500
+CPD_RANDOM_STATE = 42
+NUM_RUNS_FOR_BEST = 5      # Joint fits from different seeds; the lowest total error is kept
+
+# --- Load the Layer Tensors ---
+layer_paths = find_layer_tensors(TENSOR_DIR, AGGREGATION_METRIC)
+if LAYERS is not None:
+    layer_paths = {layer: layer_paths[layer] for layer in LAYERS if layer in layer_paths}
+if not layer_paths:
+    print(f"FATAL ERROR: No *_{AGGREGATION_METRIC}_tensor.npy files found in {TENSOR_DIR}")
+    sys.exit(1)
+
+print(f"Loading {len(layer_paths)} layer tensors from {TENSOR_DIR}...")
+tensors = []
+for layer, path in layer_paths.items():
+    try:
+        tensors.append(np.asarray(load_dense_tensor(path), dtype=np.float64))
+        print(f"  {layer}: {tensors[-1].shape}")
+    except Exception as e:
+        print(f"FATAL ERROR loading tensor {path}: {e}")
+        sys.exit(1)
+
+# --- Perform Coupled Non-Negative CPD ---
+print(f"\nPerforming coupled Non-Negative CPD with Rank R={CHOSEN_RANK} (shared device factor"
+      f"{' and time factor' if SHARE_TIME_FACTOR else ''})...")
+start_time_cpd = time.time()
+best_error, best_factors = np.inf, None
+for run in range(NUM_RUNS_FOR_BEST):
+    seed = CPD_RANDOM_STATE + run
+    try:
+        factors, errors = coupled_non_negative_parafac(tensors, CHOSEN_RANK, shared_time=SHARE_TIME_FACTOR,
+                                                       n_iter_max=CPD_N_ITER_MAX, tol=CPD_TOL, random_state=seed,
+                                                       normalize=NORMALIZE_LAYERS, return_errors=True)
+    except Exception as e:
+        print(f"  Run {run + 1} (seed {seed}) failed: {e}")
+        continue
+    print(f"  Run {run + 1} (seed {seed}): total error {errors[-1]:.6f} after {len(errors)} iterations")
+    if errors[-1] < best_error:
+        best_error, best_factors = errors[-1], factors
+if best_factors is None:
+    print("\nFATAL ERROR: Coupled CPD failed for all runs.")
+    sys.exit(1)
+factor_A, factors_B, factors_C = best_factors
+print(f"\nFinished coupled CPD after {NUM_RUNS_FOR_BEST} runs in {time.time() - start_time_cpd:.2f}s. Best total error: {best_error:.6f}")
+
+layer_errors = [relative_error(tensor, None, [factor_A, B, C]) for tensor, B, C in zip(tensors, factors_B, factors_C)]
+for layer, error in zip(layer_paths, layer_errors):
+    print(f"  {layer}: reconstruction error {error:.6f} (variance explained {(1.0 - error) * 100:.2f}%)")
+
+# --- Save the Factor Matrices ---
+# One complete factor set per layer, named <layer>_coupled_R<rank>_*, so analyze_clustering.py can
+# load any layer with LAYER_NAME = "<layer>_coupled"; factor A is the same in every set.
+print("\nSaving factor matrices...")
+try:
+    os.makedirs(FACTOR_OUTPUT_DIR, exist_ok=True)
+    for layer, B, C in zip(layer_paths, factors_B, factors_C):
+        base_output_name = f"{layer}_coupled_R{CHOSEN_RANK}"
+        np.save(os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_factor_A.npy"), factor_A)
+        np.save(os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_factor_B.npy"), B)
+        np.save(os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_factor_C.npy"), C)
+        np.save(os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_weights.npy"), np.ones(CHOSEN_RANK))
+        print(f"  Saved {base_output_name}_factor_A/B/C.npy and _weights.npy")
+    summary_path = os.path.join(FACTOR_OUTPUT_DIR, f"coupled_{AGGREGATION_METRIC}_R{CHOSEN_RANK}_layer_errors.csv")
+    pd.DataFrame({'layer': list(layer_paths), 'error': layer_errors}).to_csv(summary_path, index=False)
+    print(f"  Saved per-layer errors to: {summary_path}")
+except Exception as e:
+    print(f"FATAL ERROR saving factor matrices: {e}")
+    sys.exit(1)
+
+print("\n--- Script Finished ---")
@@ -0,0 +1,94 @@
+import numpy as np
+import tensorly as tl
+from cp_utils import mttkrp, tensor_norm
+from sparse_tensor import SparseTensor
+
+# --- Coupled Non-Negative CPD ---
+# Fits L layer tensors X_l (N, M_l, T) jointly as X_l ~ [[A, B_l, C_l]] with one device factor A
+# shared by every layer (and optionally one time factor C = C_l), so component r means the same
+# device community in every layer. Multiplicative updates as in tensorly's non_negative_parafac:
+#   A   <- A   * sum_l X_l(1) (C_l kr B_l) / A sum_l (C_l^T C_l * B_l^T B_l)
+#   B_l <- B_l * X_l(2) (C_l kr A) / B_l (C_l^T C_l * A^T A)
+#   C_l <- C_l * X_l(3) (B_l kr A) / C_l (B_l^T B_l * A^T A)     (shared C: sums over l as for A)
+# The R x R Gram matrices are computed once per update and reused across layers and in the error,
+# which comes from the last MTTKRP and the Grams (as in cp_utils.py) instead of the model tensors.
+# Layers are divided by their norms first when normalize is set, so each counts equally.
+
+
+def _scaled(tensor, scale):
+    if isinstance(tensor, SparseTensor):
+        return SparseTensor(tensor.coords, tensor.values / scale, tensor.shape)
+    return np.asarray(tensor, dtype=np.float64) / scale
+
+
+def _update(factor, numerator, denominator, epsilon=1e-12):
+    return factor * numerator / np.maximum(factor @ denominator, epsilon)
+
+
+def coupled_non_negative_parafac(tensors, rank, shared_time=False, n_iter_max=100, init='random', tol=10e-7,
+                                 random_state=None, normalize=True, return_errors=False):
+    """Coupled NNCP of a list of (N, M_l, T_l) dense arrays or SparseTensors with a shared A.
+
+    init is 'random' or (A, [B_l], [C_l]). Returns (A, [B_l], [C_l]) (the same C for every layer
+    when shared_time), scaled so each layer's model approximates the original, unnormalized tensor;
+    with return_errors also the total relative error per iteration (of the normalized layers).
+    """
+    if len({tl.shape(tensor)[0] for tensor in tensors}) != 1:
+        raise ValueError("All layers need the same number of devices.")
+    if shared_time and len({tl.shape(tensor)[2] for tensor in tensors}) != 1:
+        raise ValueError("A shared time factor needs the same number of time steps in every layer.")
+    norms = [tensor_norm(tensor) for tensor in tensors]
+    scales = [norm if normalize and norm > 0 else 1.0 for norm in norms]
+    tensors = [_scaled(tensor, scale) for tensor, scale in zip(tensors, scales)]
+    norm_squared = sum((norm / scale) ** 2 for norm, scale in zip(norms, scales))
+
+    if init == 'random':
+        rng = tl.check_random_state(random_state)
+        N, _, T = tl.shape(tensors[0])
+        A = rng.random_sample((N, rank))
+        Bs = [rng.random_sample((tl.shape(tensor)[1], rank)) for tensor in tensors]
+        if shared_time:
+            C = rng.random_sample((T, rank))
+            Cs = [C] * len(tensors)
+        else:
+            Cs = [rng.random_sample((tl.shape(tensor)[2], rank)) for tensor in tensors]
+    else:
+        A, Bs, Cs = init
+        A = np.asarray(A, dtype=np.float64)
+        Bs = [np.asarray(B, dtype=np.float64) for B in Bs]
+        Cs = [np.asarray(C, dtype=np.float64) for C in Cs]
+        if shared_time: Cs = [Cs[0]] * len(tensors)
+
+    errors = []
+    for iteration in range(n_iter_max):
+        CtCs = [C.T @ C for C in Cs] if not shared_time else [Cs[0].T @ Cs[0]] * len(tensors)
+        BtBs = [B.T @ B for B in Bs]
+
+        numerator = sum(mttkrp(tensor, [A, B, C], 0) for tensor, B, C in zip(tensors, Bs, Cs))
+        A = _update(A, numerator, sum(CtC * BtB for CtC, BtB in zip(CtCs, BtBs)))
+        AtA = A.T @ A
+
+        for l, tensor in enumerate(tensors):
+            Bs[l] = _update(Bs[l], mttkrp(tensor, [A, Bs[l], Cs[l]], 1), CtCs[l] * AtA)
+        BtBs = [B.T @ B for B in Bs]
+
+        time_mttkrps = [mttkrp(tensor, [A, B, C], 2) for tensor, B, C in zip(tensors, Bs, Cs)]
+        if shared_time:
+            C = _update(Cs[0], sum(time_mttkrps), sum(BtB * AtA for BtB in BtBs))
+            Cs = [C] * len(tensors)
+        else:
+            Cs = [_update(C, time_mttkrp, BtB * AtA) for C, time_mttkrp, BtB in zip(Cs, time_mttkrps, BtBs)]
+
+        # ||X - M||^2 summed over layers, from the time MTTKRPs and the Gram matrices
+        residual_squared = norm_squared
+        for time_mttkrp, C, BtB in zip(time_mttkrps, Cs, BtBs):
+            residual_squared += np.sum(AtA * BtB * (C.T @ C)) - 2 * np.sum(time_mttkrp * C)
+        errors.append(float(np.sqrt(max(residual_squared, 0)) / np.sqrt(norm_squared)))
+        if tol and iteration >= 1 and abs(errors[-2] - errors[-1]) < tol:
+            break
+
+    # Undo the normalization in each layer's category factor (A and C stay shared)
+    Bs = [B * scale for B, scale in zip(Bs, scales)]
+    if return_errors:
+        return (A, Bs, Cs), errors
+    return A, Bs, Cs
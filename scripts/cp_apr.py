@@ -0,0 +1,133 @@
+import numpy as np
+import scipy.sparse
+import tensorly as tl
+from sparse_tensor import SparseTensor, khatri_rao_rows
+from cp_utils import relative_error
+
+# --- Poisson Non-Negative CPD (CP-APR) ---
+# Layer tensors are packet counts, for which a Poisson model fits better than least squares:
+# CP-APR (Chi & Kolda, 2012) minimizes the Poisson negative log-likelihood (up to a constant)
+#   f(M) = sum(M) - sum_{x_i > 0} x_i log(m_i)
+# with multiplicative updates of one mode at a time. With the factor columns kept summing to one
+# (weights lambda), sum(M) = sum(lambda), so only the nonzeros enter the data term: every update and
+# the objective cost O(nnz * R), and the dense tensor is never formed. Each mode gets up to
+# inner_iters updates B <- B * Phi, where Phi is the sparse MTTKRP of x / m; it has converged when
+# the KKT violation max |min(B, 1 - Phi)| is below kkt_tol, and the fit stops once every mode
+# converges at its first inner update, or once the Poisson deviance changes by a relative amount below
+# tol (the least-squares error is only reported). Entries stuck near zero where Phi > 1 are nudged up by
+# kappa ("scooching") so they can leave the boundary.
+
+KKT_TOL = 1e-4
+INNER_ITERS = 10
+KAPPA = 0.01
+KAPPA_TOL = 1e-10
+EPS_DIV = 1e-10 # Floor of the model value in divisions and logarithms
+
+
+def as_sparse(tensor):
+    """Float64 SparseTensor of a dense array or SparseTensor."""
+    if isinstance(tensor, SparseTensor):
+        return tensor.astype(np.float64)
+    return SparseTensor.from_dense(np.asarray(tl.to_numpy(tensor), dtype=np.float64))
+
+
+def normalize_columns(weights, factors):
+    """(weights, factors) with every factor column summing to one, the sums moved into the weights."""
+    weights = np.ones(factors[0].shape[1]) if weights is None else np.array(tl.to_numpy(weights), dtype=np.float64)
+    normalized = []
+    for factor in factors:
+        factor = np.array(tl.to_numpy(factor), dtype=np.float64)
+        sums = factor.sum(axis=0)
+        sums[sums == 0] = 1.0
+        normalized.append(factor / sums)
+        weights = weights * sums
+    return weights, normalized
+
+
+def model_at_nonzeros(tensor, weights, factors):
+    """Model values m_i at the nonzero coordinates of a SparseTensor."""
+    return khatri_rao_rows(tensor, factors) @ weights
+
+
+def poisson_deviance(tensor, weights, factors):
+    """Poisson deviance 2 (sum x log(x / M) - sum X + sum M) of a CP model: 0 for a perfect fit, and the
+    CP-APR objective up to a constant, so it compares models of any solver (nonzeros only)."""
+    tensor = as_sparse(tensor)
+    weights = np.ones(factors[0].shape[1]) if weights is None else tl.to_numpy(weights)
+    factors = [tl.to_numpy(factor) for factor in factors]
+    total = float(np.sum(weights * np.prod([np.sum(factor, axis=0) for factor in factors], axis=0)))
+    model = np.maximum(model_at_nonzeros(tensor, weights, factors), EPS_DIV)
+    values = tensor.values[tensor.values > 0]
+    log_ratio = np.log(values) - np.log(model[tensor.values > 0])
+    return 2.0 * (float(values @ log_ratio) - float(tensor.values.sum()) + total)
+
+
+def _update_mode(tensor, weights, factors, mode, previous_phi, inner_iters, kkt_tol):
+    """Inner multiplicative updates of one mode. Returns (weights, Phi, inner updates run, KKT violation)."""
+    products = khatri_rao_rows(tensor, factors, skip_mode=mode) # nnz x R, fixed while this mode is updated
+    index = tensor.coords[mode]
+    rows_of_nonzeros = scipy.sparse.csr_matrix((np.ones(tensor.nnz), (index, np.arange(tensor.nnz))),
+                                               shape=(tensor.shape[mode], tensor.nnz)) # Sums nonzeros into their rows
+    B = factors[mode]
+    if previous_phi is not None: # Scooch: entries at zero that want to grow (Phi > 1)
+        B = B + ((B < KAPPA_TOL) & (previous_phi > 1)) * KAPPA
+    B = B * weights[np.newaxis, :]
+    violation, phi = np.inf, previous_phi
+    for inner in range(inner_iters):
+        ratio = tensor.values / np.maximum(np.einsum('ir,ir->i', B[index], products), EPS_DIV)
+        phi = rows_of_nonzeros @ (products * ratio[:, np.newaxis])
+        violation = float(np.max(np.abs(np.minimum(B, 1.0 - phi))))
+        if violation < kkt_tol:
+            break
+        B = B * phi
+    weights = B.sum(axis=0)
+    factors[mode] = B / np.where(weights > 0, weights, 1.0)[np.newaxis, :]
+    return weights, phi, inner + 1, violation
+
+
+def non_negative_cp_apr(tensor, rank, n_iter_max=100, init='random', tol=10e-7, random_state=None,
+                        return_errors=False, kkt_tol=KKT_TOL, inner_iters=INNER_ITERS):
+    """Poisson non-negative CPD of a count tensor (dense array or SparseTensor) by CP-APR.
+
+    init is 'random' (uniform factors, weights scaled so that the model total matches the data
+    total) or a (weights, factors) start. Stops when the KKT conditions hold (see above) or when the
+    Poisson deviance changes by less than tol relative to the previous iteration. Returns (weights,
+    factors) with factor columns summing to one, or ((weights, factors), least-squares relative
+    errors per iteration) with return_errors, so trajectories compare with the other solvers'.
+    """
+    tensor = as_sparse(tensor)
+    if tensor.nnz == 0:
+        raise ValueError("Cannot decompose an all-zero tensor.")
+    if np.any(tensor.values < 0):
+        raise ValueError("CP-APR needs a non-negative (count) tensor.")
+    if isinstance(init, (tuple, list)):
+        weights, factors = normalize_columns(*init)
+    elif init == 'random':
+        rng = tl.check_random_state(random_state)
+        _, factors = normalize_columns(None, [rng.random_sample((size, rank)) for size in tensor.shape])
+        weights = np.full(rank, tensor.values.sum() / rank)
+    else:
+        raise ValueError(f"Initialization method '{init}' is not supported by CP-APR (use 'random' or a CP tuple).")
+    norm_tensor = tensor.norm()
+    positive = tensor.values[tensor.values > 0]
+    data_term = float(positive @ np.log(positive)) - float(tensor.values.sum()) # Constant part of the deviance
+
+    rec_errors, deviances = [], []
+    phis = [None] * tensor.ndim
+    for iteration in range(n_iter_max):
+        converged = True
+        for mode in range(tensor.ndim):
+            weights, phis[mode], inner_run, violation = _update_mode(tensor, weights, factors, mode, phis[mode], inner_iters, kkt_tol)
+            converged = converged and inner_run == 1 and violation < kkt_tol # KKT held before any update of this mode
+        if return_errors:
+            rec_errors.append(relative_error(tensor, weights, factors, norm_tensor))
+        if tol:
+            # Deviance of the normalized model: sum(M) = sum(weights), only the nonzeros enter the log term
+            model = np.maximum(model_at_nonzeros(tensor, weights, factors), EPS_DIV)
+            deviances.append(2.0 * (data_term + float(weights.sum()) - float(tensor.values @ np.log(model))))
+        if converged or (tol and iteration >= 1 and abs(deviances[-2] - deviances[-1]) < tol * deviances[-2]):
+            break
+
+    if return_errors:
+        return (weights, factors), rec_errors
+    return weights, factors
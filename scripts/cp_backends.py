@@ -0,0 +1,230 @@
+import os
+import numpy as np
+import tensorly as tl
+from tensorly.decomposition import constrained_parafac, non_negative_parafac, non_negative_parafac_hals
+from cp_utils import mttkrp, relative_error, tensor_norm
+from cp_apr import non_negative_cp_apr, poisson_deviance
+from sparse_tensor import SparseTensor, non_negative_parafac_sparse, sparse_path_for, tensor_density
+
+# --- Non-Negative CP Solver Backends ---
+# One call, decompose(tensor, rank, solver=...), for every non-negative CP solver the scripts can use:
+#   'mu'          tensorly's multiplicative updates (non_negative_parafac; sparse_tensor.py's MTTKRP
+#                 version for SparseTensors), the solver all earlier results were computed with
+#   'hals'        tensorly's non_negative_parafac_hals
+#   'hals_numpy'  the NumPy HALS below: Gram matrices are kept up to date instead of recomputed, each
+#                 MTTKRP is reused for up to inner_iters column sweeps (stopping once a sweep changes the
+#                 factor by under 1% of the first sweep's change), the two shorter modes of a dense 3-way
+#                 tensor share one contraction of the longest mode (a two-level dimension tree), and the
+#                 error comes from the last MTTKRP; columns are normalized into the weights every
+#                 iteration, and collapsed columns are re-seeded (or the component dropped, weight 0)
+#   'admm'        tensorly's AO-ADMM constrained_parafac with non_negative=True
+#   'cp_apr'      Poisson (KL-divergence) CPD of count tensors from the nonzeros only (cp_apr.py); it
+#                 fits a different objective, so its least-squares errors are higher by design and its
+#                 fits are compared by Poisson deviance instead (fit_objective)
+# All take n_iter_max, init ('random' or a (weights, factors) start), tol (on the absolute change of the
+# relative error, as tensorly; for 'cp_apr' on the relative change of its Poisson deviance) and random_state,
+# and return (weights, factors) or, with return_errors, ((weights, factors), relative errors per iteration)
+# as NumPy arrays.
+# Benchmarked per layer tensor by benchmark_cp_solvers.py (least squares) and benchmark_cp_apr.py (Poisson).
+
+LEAST_SQUARES_SOLVERS = ('mu', 'hals', 'hals_numpy', 'admm')
+SOLVER_NAMES = LEAST_SQUARES_SOLVERS + ('cp_apr',)
+SPARSE_SOLVERS = ('mu', 'hals_numpy', 'cp_apr') # Solvers that also take a SparseTensor
+
+
+def _random_factors(shape, rank, random_state):
+    """Uniform random non-negative factors, drawn like tensorly's 'random' init."""
+    rng = tl.check_random_state(random_state)
+    return [rng.random_sample((size, rank)) for size in shape]
+
+
+def _start_factors(tensor, rank, init, random_state):
+    """(weights folded into the first factor) float64 factors to start from."""
+    if isinstance(init, (tuple, list)):
+        weights, factors = init
+        factors = [np.array(tl.to_numpy(factor), dtype=np.float64) for factor in factors]
+        if weights is not None:
+            factors[0] = factors[0] * np.reshape(tl.to_numpy(weights), (1, -1))
+        return factors
+    if init == 'random':
+        return _random_factors(tensor.shape, rank, random_state)
+    raise ValueError(f"Initialization method '{init}' is not supported by hals_numpy (use 'random' or a CP tuple).")
+
+
+def _dense_mttkrps(tensor, factors, order):
+    """MTTKRP callables for a dense 3-way tensor updated in `order` (longest mode last).
+
+    The contraction of the longest mode with its factor, Y = X x_last F_last (shape of the other
+    two modes by R), serves both shorter modes, so an iteration costs two passes over X instead of three.
+    """
+    first, second, last = order
+    subscripts = 'ijk'
+    cache = {}
+
+    def contracted():
+        if 'Y' not in cache:
+            cache['Y'] = np.tensordot(tensor, factors[last], axes=(last, 0)) # Remaining axes keep their order
+        return cache['Y']
+
+    def for_mode(mode):
+        if mode == last:
+            cache.pop('Y', None) # The longest mode's factor changes next; Y must be rebuilt next iteration
+            others = [m for m in range(3) if m != mode]
+            expression = f"{subscripts},{subscripts[others[0]]}r,{subscripts[others[1]]}r->{subscripts[mode]}r"
+            return np.einsum(expression, tensor, factors[others[0]], factors[others[1]], optimize=True)
+        other = first if mode == second else second
+        kept = [m for m in range(3) if m != last] # Axis order of Y
+        y_subscripts = ''.join(subscripts[m] for m in kept) + 'r'
+        return np.einsum(f"{y_subscripts},{subscripts[other]}r->{subscripts[mode]}r", contracted(), factors[other])
+    return for_mode
+
+
+def _hals_sweeps(factor, products, gram, inner_iters, epsilon):
+    """Up to inner_iters in-place sweeps of exact non-negative column updates of one factor."""
+    first_change = None
+    for _ in range(inner_iters):
+        change = 0.0
+        for r in range(factor.shape[1]):
+            if gram[r, r] > 0:
+                column = np.maximum(factor[:, r] + (products[:, r] - factor @ gram[:, r]) / gram[r, r], epsilon)
+                change += float(np.sum((column - factor[:, r]) ** 2))
+                factor[:, r] = column
+        if first_change is None:
+            first_change = change
+        elif change <= 1e-4 * first_change: # Squared changes: 1% of the first sweep's step
+            break
+
+
+def _normalize_into_weights(weights, factors):
+    """Rescale every factor column to unit norm in place, moving the norms into the weights."""
+    for factor in factors:
+        norms = np.linalg.norm(factor, axis=0)
+        factor /= np.where(norms > 0, norms, 1.0)[np.newaxis, :]
+        weights = weights * norms
+    return weights
+
+
+def non_negative_parafac_hals_numpy(tensor, rank, n_iter_max=100, init='random', tol=10e-7,
+                                    random_state=None, return_errors=False, inner_iters=5, max_reseeds=3):
+    """Non-negative CPD by hierarchical ALS (exact column updates of one mode at a time).
+
+    Dense arrays and SparseTensors (sparse MTTKRP) are accepted. After every iteration the factor
+    columns are normalized to unit norm and the scale is kept in the weights, which are folded into
+    the first mode updated next. A column that HALS drives to the floor is re-seeded with random
+    values (at most max_reseeds times per component); after that the component is dropped, with zero
+    columns and weight 0, instead of being carried by a compensating blow-up of the other modes.
+    Returns (weights, factors), or ((weights, factors), errors) with return_errors.
+    """
+    epsilon = np.finfo(np.float64).eps # Floor of the column updates
+    sparse = isinstance(tensor, SparseTensor)
+    if not sparse:
+        tensor = np.asarray(tensor, dtype=np.float64)
+    factors = _start_factors(tensor, rank, init, random_state)
+    rng = tl.check_random_state(random_state)
+    norm_tensor = tensor_norm(tensor)
+    if norm_tensor == 0:
+        raise ValueError("Cannot decompose an all-zero tensor.")
+    order = sorted(range(len(factors)), key=lambda mode: (tensor.shape[mode], mode)) # Longest mode updated last
+    if not sparse and len(factors) == 3:
+        dense_mttkrp = _dense_mttkrps(tensor, factors, order)
+    else:
+        dense_mttkrp = lambda mode: mttkrp(tensor, factors, mode)
+    weights = _normalize_into_weights(np.ones(rank), factors)
+    reseeds = np.zeros(rank, dtype=int)
+    dropped = np.zeros(rank, dtype=bool)
+
+    rec_errors = []
+    for iteration in range(n_iter_max):
+        factors[order[0]] *= weights[np.newaxis, :] # The first mode updated carries the scale
+        grams = [factor.T @ factor for factor in factors]
+        for mode in order:
+            gram = np.ones((rank, rank))
+            for other in range(len(factors)):
+                if other != mode:
+                    gram = gram * grams[other]
+            products = dense_mttkrp(mode)
+            factor = factors[mode]
+            _hals_sweeps(factor, products, gram, inner_iters, epsilon)
+
+            # Collapsed columns (every entry at the floor) would make the next modes blow up
+            column_max = factor.max(axis=0)
+            for r in np.flatnonzero(~dropped & (column_max <= 1e-10 * column_max.max())):
+                if reseeds[r] < max_reseeds:
+                    reseeds[r] += 1
+                    live = ~dropped & (column_max > 1e-10 * column_max.max())
+                    scale = np.linalg.norm(factor[:, live], axis=0).mean() if live.any() else 1.0
+                    column = rng.random_sample(factor.shape[0])
+                    factor[:, r] = column * scale / np.linalg.norm(column)
+                else:
+                    dropped[r] = True
+                    for other in range(len(factors)):
+                        factors[other][:, r] = 0.0
+                        grams[other] = factors[other].T @ factors[other]
+            grams[mode] = factor.T @ factor
+
+        if tol or return_errors:
+            # <X, model> from the last mode's MTTKRP, ||model||^2 from the Grams
+            last = order[-1]
+            inner = float(np.sum(products * factors[last]))
+            model_norm_squared = float(np.sum(gram * grams[last]))
+            rec_errors.append(np.sqrt(abs(norm_tensor ** 2 - 2 * inner + model_norm_squared)) / norm_tensor)
+        weights = _normalize_into_weights(np.ones(rank), factors)
+        if tol and iteration >= 1 and abs(rec_errors[-2] - rec_errors[-1]) < tol:
+            break
+
+    if return_errors:
+        return (weights, factors), rec_errors
+    return weights, factors
+
+
+def _tensorly_solver(tensor, rank, solver, n_iter_max, init, tol, random_state):
+    if isinstance(tensor, SparseTensor):
+        raise ValueError(f"Solver '{solver}' needs a dense tensor (sparse solvers: {', '.join(SPARSE_SOLVERS)}).")
+    common = {'rank': rank, 'n_iter_max': n_iter_max, 'init': init, 'random_state': random_state, 'return_errors': True}
+    if solver == 'mu':
+        return non_negative_parafac(tensor, tol=tol, verbose=False, **common)
+    if solver == 'hals':
+        return non_negative_parafac_hals(tensor, tol=tol, verbose=False, **common)
+    return constrained_parafac(tensor, tol_outer=tol, non_negative=True, **common)
+
+
+def use_sparse_tensor(tensor_path, solver, use_sparse='auto', density_threshold=0.1):
+    """Whether to decompose the tensor of a <name>_tensor.npy path as a SparseTensor with solver.
+
+    use_sparse True / False forces the choice; 'auto' goes sparse for the SPARSE_SOLVERS when the solver is
+    'cp_apr' (which only reads the nonzeros), a <name>_tensor.npz exists or the density is below density_threshold.
+    """
+    if use_sparse != 'auto':
+        return bool(use_sparse)
+    return solver in SPARSE_SOLVERS and (solver == 'cp_apr' or os.path.isfile(sparse_path_for(tensor_path))
+                                         or tensor_density(tensor_path) < density_threshold)
+
+
+def fit_objective(tensor, weights, factors, solver, norm_tensor=None):
+    """What fits of one solver are ranked by (lower is better): the Poisson deviance for 'cp_apr', whose
+    objective it is, and the relative error for the least-squares solvers."""
+    if solver == 'cp_apr':
+        return poisson_deviance(tensor, weights, factors)
+    return relative_error(tensor, weights, factors, norm_tensor)
+
+
+def decompose(tensor, rank, solver='mu', n_iter_max=100, init='random', tol=10e-7, random_state=None, return_errors=False):
+    """Non-negative CPD of a dense array or SparseTensor with one of SOLVER_NAMES (see above)."""
+    if solver not in SOLVER_NAMES:
+        raise ValueError(f"Unknown CP solver '{solver}' (use one of {SOLVER_NAMES}).")
+    if solver == 'hals_numpy':
+        (weights, factors), errors = non_negative_parafac_hals_numpy(
+            tensor, rank, n_iter_max=n_iter_max, init=init, tol=tol, random_state=random_state, return_errors=True)
+    elif solver == 'cp_apr':
+        (weights, factors), errors = non_negative_cp_apr(
+            tensor, rank, n_iter_max=n_iter_max, init=init, tol=tol, random_state=random_state, return_errors=True)
+    elif solver == 'mu' and isinstance(tensor, SparseTensor):
+        (weights, factors), errors = non_negative_parafac_sparse(
+            tensor, rank, n_iter_max=n_iter_max, init=init, tol=tol, random_state=random_state, return_errors=True)
+    else:
+        (weights, factors), errors = _tensorly_solver(tensor, rank, solver, n_iter_max, init, tol, random_state)
+    weights = np.ones(rank) if weights is None else np.asarray(tl.to_numpy(weights), dtype=np.float64)
+    factors = [np.asarray(tl.to_numpy(factor)) for factor in factors]
+    if return_errors:
+        return (weights, factors), [float(error) for error in errors]
+    return weights, factors
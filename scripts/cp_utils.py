@@ -0,0 +1,95 @@
+import numpy as np
+import tensorly as tl
+from tensorly.cp_tensor import unfolding_dot_khatri_rao
+from sparse_tensor import SparseTensor, cp_inner, mttkrp as sparse_mttkrp
+
+# --- CP Model Utilities ---
+# Reconstruction error of a CP model without building the model tensor:
+#   ||X - [[w; A, B, C]]||^2 = ||X||^2 - 2 <X, [[w; A, B, C]]> + ||[[w; A, B, C]]||^2
+# The inner product is one MTTKRP (taken along the longest mode, so the Khatri-Rao product it
+# forms has the fewest rows) and the model norm comes from the R x R factor Gram matrices. Dense
+# arrays, memory-mapped tensors and SparseTensors (sparse_tensor.py) are all accepted.
+# Core consistency (CORCONDIA) fits the least-squares Tucker core of the CP factors,
+#   G = X x_1 pinv(A) x_2 pinv(B) x_3 pinv(C)
+# as one mode product per mode (pinv(kron(C, B, A)) = kron(pinv(C), pinv(B), pinv(A))), so neither
+# the Kronecker nor the Khatri-Rao product is formed: O(N M T R) time and O(M T R) extra memory.
+# For a SparseTensor every nonzero adds x * (outer product of its pinv columns) to G, in blocks of
+# nonzeros: O(nnz R^3) time and O(block R^2) memory, without densifying.
+
+
+def tensor_norm(tensor):
+    """Frobenius norm of a dense array or SparseTensor."""
+    if isinstance(tensor, SparseTensor):
+        return tensor.norm()
+    return float(np.linalg.norm(np.asarray(tensor, dtype=np.float64).ravel()))
+
+
+def mttkrp(tensor, factors, mode):
+    """X_(mode) times the Khatri-Rao product of the other factors, for a dense array or SparseTensor."""
+    if isinstance(tensor, SparseTensor):
+        return sparse_mttkrp(tensor, factors, mode)
+    return tl.to_numpy(unfolding_dot_khatri_rao(tensor, (None, factors), mode))
+
+
+def cp_norm_squared(weights, factors):
+    """||[[weights; factors]]||^2 from the factor Gram matrices (no reconstruction)."""
+    gram = np.outer(weights, weights)
+    for factor in factors:
+        gram = gram * (factor.T @ factor)
+    return float(gram.sum())
+
+
+def model_inner(tensor, weights, factors):
+    """<X, [[weights; factors]]> via one MTTKRP (over the nonzeros of a SparseTensor)."""
+    if isinstance(tensor, SparseTensor):
+        return cp_inner(tensor, weights, factors)
+    mode = int(np.argmax(tl.shape(tensor)))
+    return float(tl.sum(unfolding_dot_khatri_rao(tensor, (weights, factors), mode) * factors[mode]))
+
+
+def relative_error(tensor, weights, factors, norm_tensor=None):
+    """||X - [[weights; factors]]|| / ||X|| without reconstructing the model (weights None = all ones).
+
+    Pass norm_tensor when it is already known (e.g. repeated calls on the same tensor).
+    """
+    weights = np.ones(factors[0].shape[1]) if weights is None else tl.to_numpy(weights)
+    factors = [tl.to_numpy(factor) for factor in factors]
+    norm_tensor = tensor_norm(tensor) if norm_tensor is None else norm_tensor
+    residual_squared = norm_tensor ** 2 - 2 * model_inner(tensor, weights, factors) + cp_norm_squared(weights, factors)
+    return float(np.sqrt(abs(residual_squared)) / norm_tensor)
+
+
+def _sparse_tucker_core(tensor, pinvs, block_nonzeros=1 << 16):
+    """Least-squares Tucker core X x_1 pinvs[0] x_2 pinvs[1] ... of a SparseTensor from its nonzeros."""
+    rank = pinvs[0].shape[0]
+    core = np.zeros((rank, rank ** (tensor.ndim - 1)))
+    for start in range(0, tensor.nnz, block_nonzeros):
+        block = slice(start, start + block_nonzeros)
+        rows = pinvs[0][:, tensor.coords[0][block]].T * tensor.values[block, np.newaxis]
+        others = np.ones((rows.shape[0], 1))
+        for mode in range(1, tensor.ndim): # Row-wise Kronecker product of the other modes' pinv columns
+            others = (others[:, :, np.newaxis] * pinvs[mode][:, tensor.coords[mode][block]].T[:, np.newaxis, :]).reshape(rows.shape[0], -1)
+        core += rows.T @ others
+    return core.reshape((rank,) * tensor.ndim)
+
+
+def core_consistency(tensor, weights, factors):
+    """CORCONDIA (Bro & Kiers) of a CP model in percent: 100 (1 - ||G - I||^2 / R).
+
+    G is the least-squares Tucker core of the tensor for the model's factors (weights folded into
+    the first one) and I the superdiagonal identity core; ~100 means the model is appropriate,
+    low or negative values that the rank is too high.
+    """
+    weights = np.ones(factors[0].shape[1]) if weights is None else tl.to_numpy(weights)
+    factors = [tl.to_numpy(factor) for factor in factors]
+    factors[0] = factors[0] * weights[np.newaxis, :]
+    rank = factors[0].shape[1]
+    if isinstance(tensor, SparseTensor):
+        core = _sparse_tucker_core(tensor.astype(np.float64), [np.linalg.pinv(factor) for factor in factors])
+    else:
+        core = np.asarray(tensor, dtype=np.float64)
+        for mode in sorted(range(core.ndim), key=lambda mode: -core.shape[mode]): # Shrink the longest modes first
+            core = np.moveaxis(np.tensordot(np.linalg.pinv(factors[mode]), core, axes=(1, mode)), 0, mode)
+    identity = np.zeros((rank,) * core.ndim)
+    identity[(np.arange(rank),) * core.ndim] = 1.0
+    return float(100.0 * (1.0 - np.sum((core - identity) ** 2) / rank))
@@ -1,92 +1,172 @@
 import os
-import numpy as np
-import tensorly as tl
-from tensorly.decomposition import non_negative_parafac
 import matplotlib.pyplot as plt
 import time
 import sys
+from rank_sweep import find_layer_tensors, run_rank_sweep
 
 # --- Configuration ---
 TENSOR_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\tensors"
-TENSOR_FILENAME = "local_tcp_count_tensor.npy"
+AGGREGATION_METRIC = 'count' # 'count', 'bytes' or 'distinct_dst' tensor built by load_tensor.py
+TENSOR_FILENAME = f"local_tcp_{AGGREGATION_METRIC}_tensor.npy"
 TENSOR_PATH = os.path.join(TENSOR_DIR, TENSOR_FILENAME)
+SWEEP_ALL_LAYERS = False # True: sweep every <layer>_<metric>_tensor.npy in TENSOR_DIR concurrently instead of TENSOR_FILENAME
 
 # --- Rank Estimation Parameters ---
 RANK_RANGE = range(2, 9)
+SEEDS_PER_RANK = 3 # Random initializations per rank (random_state = CPD_RANDOM_STATE + k)
+CPD_SOLVER = 'mu' # cp_backends.py: 'mu', 'hals', 'hals_numpy', 'admm' or Poisson 'cp_apr' (see benchmark_cp_solvers.py, benchmark_cp_apr.py)
+                  # With 'cp_apr', variance explained is the least-squares fit of a Poisson model (lower by design)
 CPD_INIT = 'random'
 CPD_TOL = 1e-7
 CPD_N_ITER_MAX = 100
 CPD_RANDOM_STATE = 42
+NUM_WORKERS = os.cpu_count() # Processes fitting (layer, rank, seed) cells in parallel
 
-# --- Load the Tensor ---
-print(f"Loading tensor: {TENSOR_PATH}")
-try:
-    tensor = np.load(TENSOR_PATH)
-    tensor = tl.tensor(tensor, dtype=tl.float64)
-    print(f"Tensor loaded successfully. Shape: {tensor.shape}")
-except FileNotFoundError:
-    print(f"FATAL ERROR: Tensor file not found at {TENSOR_PATH}")
-    sys.exit(1)
-except Exception as e:
-    print(f"FATAL ERROR loading tensor: {e}")
-    sys.exit(1)
-
-# --- Estimate Rank ---
-print(f"\nEstimating optimal rank R in range {list(RANK_RANGE)}...")
-reconstruction_errors = []
-
-start_time_estimation = time.time()
-
-for r in RANK_RANGE:
-    print(f"  Testing Rank R={r}...")
-    rank_start_time = time.time()
-    try:
-        weights, factors = non_negative_parafac(
-            tensor,
-            rank=r,
-            init=CPD_INIT,
-            n_iter_max=CPD_N_ITER_MAX,
-            tol=CPD_TOL,
-            random_state=CPD_RANDOM_STATE,
-            verbose=False
-        )
-
-        tensor_reconstructed = tl.cp_to_tensor((weights, factors))
-        error = tl.norm(tensor - tensor_reconstructed) / tl.norm(tensor)
-        reconstruction_errors.append(error)
-        print(f"    Reconstruction Error: {error:.4f}")
+# --- Sparse Layers ---
+# The cp_backends.SPARSE_SOLVERS can fit a layer from its nonzeros (see sparse_tensor.py); 'auto' shares it with the
+# workers as COO when CPD_SOLVER = 'cp_apr', a <layer>_tensor.npz exists or it is below SPARSE_DENSITY_THRESHOLD
+# (as in performing_clustering.py). Other solvers always get the dense tensor.
+USE_SPARSE_TENSOR = 'auto'
+SPARSE_DENSITY_THRESHOLD = 0.1
+
+# --- Warm-Started Sweep ---
+# 'cold': every rank from CPD_INIT; 'warm': per seed, rank R+1 starts from the converged rank-R factors
+# plus one new component (see rank_sweep.py); 'both' runs both and prints how they compare.
+# A warm-started rank only gets WARM_N_ITER_MAX iterations, then the cold fit of the same seed is run in chunks of
+# WARM_CHECK_ITERS and kept when it ends lower; it is given up (past WARM_CHECK_WARMUP_ITERS) once even its
+# extrapolation cannot beat the warm fit. On six count layers (ranks 2-8, 3 seeds) 'warm' took 1.32x less time than
+# 'cold' with MU (31% fewer iterations), the best seed as good for 42/42 ranks; CP-APR's deviance flattens early,
+# so its cold fits get a 50-iteration warmup (then 42/42, but no faster than 'cold').
+# The suggested rank comes from the cold cells when they are run.
+SWEEP_MODE = 'warm'
+WARM_NEW_COMPONENT = 'svd' # 'svd' (leading singular vectors of the positive residual) or 'random'
+WARM_N_ITER_MAX = 25 # Iteration budget of warm-started ranks (None: CPD_N_ITER_MAX, run to CPD_TOL)
+WARM_CHECK_ITERS = 5
+WARM_CHECK_WARMUP_ITERS = 50 if CPD_SOLVER == 'cp_apr' else 0
+SWEEP_STARTS = ('cold', 'warm') if SWEEP_MODE == 'both' else (SWEEP_MODE,)
+
+# --- Core Consistency ---
+# CORCONDIA of every fitted cell (see cp_utils.py): ~100% means the CP model fits the data's structure,
+# a sharp drop means the rank is too high. The suggested rank is the highest rank whose best seed stays above the threshold.
+CORE_CONSISTENCY_THRESHOLD = 80.0
+
+
+def best_seed_per_rank(layer_results):
+    """Row of the best seed per (rank, start) among successful cells: the lowest error, or for CP-APR the
+    lowest Poisson deviance (the objective it fits)."""
+    ok = layer_results[layer_results['status'] == 'ok']
+    by = 'deviance' if CPD_SOLVER == 'cp_apr' else 'error'
+    return ok.loc[ok.groupby(['rank', 'start'])[by].idxmin()].set_index(['rank', 'start'])
+
+
+def plot_rank_estimation(layer_results, tensor_filename, plot_path):
+    """Variance explained per rank: best seed as a line, every seed as a dot (one colour per start mode).
+    Core consistency of the best seed on the right axis (dashed)."""
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax_cc = ax.twinx()
+    ok = layer_results[layer_results['status'] == 'ok']
+    best_rows = best_seed_per_rank(layer_results)
+    for (start, start_results), color in zip(ok.groupby('start'), ['tab:red', 'tab:blue']):
+        best = best_rows.xs(start, level='start').sort_index()
+        ax.scatter(start_results['rank'], (1.0 - start_results['error']) * 100, color=color, alpha=0.35, label=f'Each seed ({start})')
+        ax.plot(best.index, (1.0 - best['error']) * 100, marker='o', linestyle='-', color=color, label=f'Variance Explained (best seed, {start})')
+        ax_cc.plot(best.index, best['core_consistency'], marker='s', linestyle='--', color=color, alpha=0.7,
+                   label=f'Core Consistency (best seed, {start})')
+    ax_cc.axhline(CORE_CONSISTENCY_THRESHOLD, color='grey', linestyle=':', linewidth=1)
+    ax_cc.set_ylim(max(-100, min(0, ok['core_consistency'].min() - 5)), 105) # Overfitted ranks can be far below 0
+    ax_cc.set_ylabel('Core Consistency (%)')
+    ax.set_xlabel('Rank (R)')
+    ax.set_ylabel('Variance Explained (%)', color='tab:red')
+    ax.tick_params(axis='y', labelcolor='tab:red')
+    ax.grid(True, axis='y', linestyle=':')
+    ax.set_title(f'Rank Estimation for {tensor_filename}')
+    handles, labels = ax.get_legend_handles_labels()
+    cc_handles, cc_labels = ax_cc.get_legend_handles_labels()
+    ax.legend(handles + cc_handles, labels + cc_labels, loc='center right')
+    fig.savefig(plot_path)
+    return fig
 
+
+# --- Run ---
+if __name__ == "__main__": # Guard needed: the sweep's worker processes re-import this module on Windows
+    if SWEEP_ALL_LAYERS:
+        tensor_paths = find_layer_tensors(TENSOR_DIR, AGGREGATION_METRIC)
+    else:
+        tensor_paths = {os.path.splitext(TENSOR_FILENAME)[0].replace("_tensor", ""): TENSOR_PATH}
+    if not tensor_paths:
+        print(f"FATAL ERROR: No *_{AGGREGATION_METRIC}_tensor.npy files found in {TENSOR_DIR}")
+        sys.exit(1)
+    seeds = [CPD_RANDOM_STATE + k for k in range(SEEDS_PER_RANK)]
+
+    # --- Estimate Rank ---
+    print(f"Estimating optimal rank R in range {list(RANK_RANGE)} for {', '.join(tensor_paths)} ({SEEDS_PER_RANK} seeds per rank)...")
+    start_time_estimation = time.time()
+    try:
+        cpd_params = {'solver': CPD_SOLVER, 'init': CPD_INIT, 'tol': CPD_TOL, 'n_iter_max': CPD_N_ITER_MAX}
+        results = run_rank_sweep(tensor_paths, list(RANK_RANGE), seeds, cpd_params, num_workers=NUM_WORKERS,
+                                 starts=SWEEP_STARTS, new_component=WARM_NEW_COMPONENT, warm_n_iter_max=WARM_N_ITER_MAX,
+                                 warm_check_iters=WARM_CHECK_ITERS, warm_check_warmup_iters=WARM_CHECK_WARMUP_ITERS,
+                                 use_sparse=USE_SPARSE_TENSOR, sparse_density_threshold=SPARSE_DENSITY_THRESHOLD)
+    except FileNotFoundError as e:
+        print(f"FATAL ERROR: Tensor file not found: {e}")
+        sys.exit(1)
     except Exception as e:
-        print(f"    ERROR during decomposition for R={r}: {e}")
-        reconstruction_errors.append(np.nan)
-
-    rank_duration = time.time() - rank_start_time
-    print(f"    Rank {r} processing time: {rank_duration:.2f}s")
-
-estimation_duration = time.time() - start_time_estimation
-print(f"\nFinished rank estimation in {estimation_duration:.2f}s.")
-
-# --- Plot Results ---
-print("\nGenerating plot...")
-fig, ax = plt.subplots(figsize=(10, 6))
-
-variance_explained = [(1.0 - err) * 100 if not np.isnan(err) else np.nan for err in reconstruction_errors]
-ax.plot(list(RANK_RANGE), variance_explained, marker='o', linestyle='-', color='tab:red', label='Variance Explained')
-ax.set_xlabel('Rank (R)')
-ax.set_ylabel('Variance Explained (%)', color='tab:red')
-ax.tick_params(axis='y', labelcolor='tab:red')
-ax.grid(True, axis='y', linestyle=':')
-ax.set_title(f'Rank Estimation for {TENSOR_FILENAME}')
-ax.legend(loc='center right')
-
-plot_filename = os.path.splitext(TENSOR_FILENAME)[0] + "_rank_estimation.png"
-plot_path = os.path.join(TENSOR_DIR, plot_filename)
-try:
-    plt.savefig(plot_path)
-    print(f"Saved estimation plot to: {plot_path}")
-except Exception as e:
-    print(f"Error saving plot: {e}")
-
-plt.show()
-
-print("\n--- Script Finished ---")
\ No newline at end of file
+        print(f"FATAL ERROR during rank sweep: {e}")
+        sys.exit(1)
+    estimation_duration = time.time() - start_time_estimation
+    print(f"\nFinished rank estimation in {estimation_duration:.2f}s "
+          f"(sum of fit times {results['wall_time_s'].sum():.2f}s).")
+
+    # --- Save Results and Plots ---
+    for layer, tensor_path in tensor_paths.items():
+        layer_results = results[results['layer'] == layer]
+        tensor_filename = os.path.basename(tensor_path)
+        per_rank = layer_results.groupby(['rank', 'start']).agg(iterations=('iterations', 'mean'),
+                                                                 wall_time_s=('wall_time_s', 'sum'),
+                                                                 median_core_consistency=('core_consistency', 'median'))
+        best_rows = best_seed_per_rank(layer_results)
+        for column in ('error', 'deviance', 'core_consistency'):
+            per_rank[column] = best_rows[column]
+        print(f"\n{layer}: reconstruction error of the best seed per rank{' (lowest Poisson deviance)' if CPD_SOLVER == 'cp_apr' else ''} "
+              f"(core consistency of the best seed / median over seeds, mean iterations to convergence, total fit time)")
+        for (rank, start), row in per_rank.iterrows():
+            deviance = f", deviance {row['deviance']:.6g}" if CPD_SOLVER == 'cp_apr' else ''
+            print(f"  R={rank} {start}: {row['error']:.4f} (variance explained {(1.0 - row['error']) * 100:.2f}%{deviance}, "
+                  f"core consistency {row['core_consistency']:.1f}% / {row['median_core_consistency']:.1f}%, "
+                  f"{row['iterations']:.0f} iterations, {row['wall_time_s']:.2f}s)")
+        fitted_starts = set(best_rows.index.get_level_values('start'))
+        recommend_from = next((start for start in SWEEP_STARTS if start in fitted_starts), None) # 'cold' is listed first
+        if recommend_from is None:
+            print("  Every fit failed; no rank to suggest.")
+        else:
+            start_rows = best_rows.xs(recommend_from, level='start')
+            consistent = start_rows[start_rows['core_consistency'] >= CORE_CONSISTENCY_THRESHOLD].index
+            if len(consistent):
+                print(f"  Highest rank with core consistency >= {CORE_CONSISTENCY_THRESHOLD:g}% ({recommend_from} starts): R={consistent.max()}")
+            else:
+                print(f"  No rank reaches core consistency >= {CORE_CONSISTENCY_THRESHOLD:g}%; consider fewer components.")
+        if fitted_starts >= {'cold', 'warm'}:
+            totals = layer_results.groupby('start')['wall_time_s'].sum()
+            if CPD_SOLVER == 'cp_apr':
+                best = per_rank['deviance'].unstack('start')
+                as_good = best['warm'] <= best['cold'] * (1 + 1e-3)
+            else:
+                best = per_rank['error'].unstack('start')
+                as_good = best['warm'] <= best['cold'] + 1e-3
+            print(f"  Fit time cold {totals['cold']:.2f}s vs warm {totals['warm']:.2f}s; "
+                  f"warm at least as good as cold (within 1e-3) for {int(as_good.sum())}/{len(best)} ranks")
+
+        base_name = os.path.splitext(tensor_filename)[0] + "_rank_estimation"
+        results_path = os.path.join(TENSOR_DIR, base_name + ".csv")
+        plot_path = os.path.join(TENSOR_DIR, base_name + ".png")
+        try:
+            layer_results.to_csv(results_path, index=False)
+            print(f"Saved sweep results to: {results_path}")
+            plot_rank_estimation(layer_results, tensor_filename, plot_path)
+            print(f"Saved estimation plot to: {plot_path}")
+        except Exception as e:
+            print(f"Error saving results for {layer}: {e}")
+
+    plt.show()
+
+    print("\n--- Script Finished ---")
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# --- Factor Analytics ---
+# Community assignments and derived statistics from CP factors, computed with whole-array
+# operations (no Python loops over devices, time steps or events; long time axes are processed in
+# blocks to bound memory):
+#   contribution[i, t, r] = w_r * A[i, r] * C[t, r]   assignment[i, t] = argmax_r contribution[i, t, r]
+# Label lookups (devices, dates) go through pandas indexes instead of list.index().
+
+CHANGE_COLUMNS = ['device', 'time', 'from_cluster', 'to_cluster']
+
+
+def community_contributions(factor_A, factor_C, weights=None):
+    """(N, T, R) contribution of each component to each device at each time step."""
+    weights = np.ones(factor_A.shape[1]) if weights is None else np.asarray(weights)
+    return np.einsum('ir,tr,r->itr', factor_A, factor_C, weights)
+
+
+def membership_strength(factor_A, factor_C, weights=None, max_elements=2**24):
+    """(assignments, strength), both (N, T).
+
+    assignments holds the component with the largest contribution (0 to R-1); strength is its
+    share of the total contribution (NaN when all are 0). The (N, T, R) contributions are only
+    formed for blocks of time steps of at most max_elements entries, so memory stays bounded for
+    thousands of devices x thousands of time bins; the totals come from one matrix product.
+    """
+    weighted_A = factor_A * (np.ones(factor_A.shape[1]) if weights is None else np.asarray(weights))[np.newaxis, :]
+    num_devices, num_steps, rank = factor_A.shape[0], factor_C.shape[0], factor_A.shape[1]
+    block_steps = max(1, max_elements // max(num_devices * rank, 1))
+    assignments = np.empty((num_devices, num_steps), dtype=np.int64)
+    assigned = np.empty((num_devices, num_steps))
+    for start in range(0, num_steps, block_steps):
+        block = weighted_A[:, np.newaxis, :] * factor_C[np.newaxis, start:start + block_steps, :]
+        block_assignments = np.argmax(block, axis=2)
+        assignments[:, start:start + block_steps] = block_assignments
+        assigned[:, start:start + block_steps] = np.take_along_axis(block, block_assignments[:, :, np.newaxis], axis=2)[:, :, 0]
+    total = weighted_A @ factor_C.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        strength = np.where(total > 0, assigned / total, np.nan)
+    return assignments, strength
+
+
+def community_assignments(factor_A, factor_C, weights=None, max_elements=2**24):
+    """(N, T) index of the component with the largest contribution (0 to R-1)."""
+    return membership_strength(factor_A, factor_C, weights, max_elements)[0]
+
+
+def assignment_changes(assignments, device_labels=None, time_labels=None):
+    """DataFrame (CHANGE_COLUMNS) with one row per device and time step whose community differs from the step before."""
+    devices, steps = np.nonzero(assignments[:, 1:] != assignments[:, :-1])
+    steps = steps + 1
+    return pd.DataFrame({
+        'device': devices if device_labels is None else np.asarray(device_labels)[devices],
+        'time': steps if time_labels is None else np.asarray(time_labels)[steps],
+        'from_cluster': assignments[devices, steps - 1] + 1, # 1-based like the plots
+        'to_cluster': assignments[devices, steps] + 1,
+    }, columns=CHANGE_COLUMNS)
+
+
+def transition_counts(assignments, rank):
+    """(N, R, R) counts of step-to-step moves of each device from community [r] to [q] (the diagonal counts stays)."""
+    num_devices = assignments.shape[0]
+    flat = (np.arange(num_devices)[:, np.newaxis] * rank + assignments[:, :-1]) * rank + assignments[:, 1:]
+    return np.bincount(flat.ravel(), minlength=num_devices * rank * rank).reshape(num_devices, rank, rank)
+
+
+# --- Label Lookups ---
+def label_positions(labels, queries):
+    """Positions of queries in labels as an int array, -1 where a query is not a label.
+
+    Repeated labels resolve to their first position, as with list.index().
+    """
+    index = pd.Index(labels)
+    first = ~index.duplicated()
+    positions = index[first].get_indexer(pd.Index(queries))
+    return np.where(positions >= 0, np.flatnonzero(first)[positions], -1)
+
+
+def assignments_at(assignments, device_labels, time_labels, devices, times):
+    """Community (0-based) of each (device, time) event, -1 where the device or time is unknown."""
+    device_idx = label_positions(device_labels, devices)
+    time_idx = label_positions(time_labels, times)
+    known = (device_idx >= 0) & (time_idx >= 0)
+    result = np.full(len(device_idx), -1, dtype=np.int64)
+    result[known] = assignments[device_idx[known], time_idx[known]]
+    return result
@@ -0,0 +1,19 @@
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from scipy.optimize import linear_sum_assignment # For optimal column matching
+
+# --- Factor Matching ---
+# CP components come back in arbitrary order (and scale), so factors of two fits are compared
+# after matching their columns one-to-one by cosine similarity with the Hungarian algorithm.
+
+
+def align_components(reference_factors, factors, modes=(0, 1)):
+    """Column order of `factors` matching the components of `reference_factors`.
+
+    Both are lists of factor matrices of the same rank; the cosine similarities of the given
+    modes are averaged before matching. Returns (permutation, matched similarity per component),
+    so [factor[:, permutation] for factor in factors] lines up with the reference.
+    """
+    sim_matrix = np.mean([cosine_similarity(reference_factors[mode].T, factors[mode].T) for mode in modes], axis=0)
+    row_ind, col_ind = linear_sum_assignment(-sim_matrix)
+    return col_ind[np.argsort(row_ind)], sim_matrix[row_ind, col_ind]
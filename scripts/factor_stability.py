@@ -0,0 +1,180 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from cp_backends import decompose
+from rank_sweep import attach_tensor, share_tensor
+from cp_utils import relative_error, tensor_norm
+
+# --- Factor Stability Engine ---
+# Fits K random starts of one layer/rank in parallel (shared-memory tensor as in rank_sweep.py)
+# and keeps their factors stacked as (K, D, R) arrays per mode. All pairwise column cosine
+# similarities of a mode come from one einsum over the column-normalized stack, giving a
+# (K, K, R, R) array; each pair is then matched with the Hungarian algorithm (tiny R x R problems).
+# For per-component stability and the consensus, every run is aligned to the best-error run on the
+# product of its A, B and C similarities (as in the factor match score).
+
+MODES = ('A', 'B', 'C')
+STABILITY_FILE_SUFFIX = "_stability_runs.npz"
+
+# Shared tensor of a worker process: (SharedMemory, read-only view, norm)
+_worker_tensor = None
+
+
+def _init_worker(spec):
+    global _worker_tensor
+    block, view = attach_tensor(spec)
+    _worker_tensor = (block, view, tensor_norm(view))
+
+
+def fit_run(rank, seed, cpd_params, tensor=None, norm_tensor=None):
+    """One NNCP fit (of the worker's shared tensor unless one is given).
+
+    Returns (weights, factors, error, seconds), or (None, None, NaN, seconds) when it fails.
+    """
+    if tensor is None:
+        _, tensor, norm_tensor = _worker_tensor
+    start = time.time()
+    try:
+        weights, factors = decompose(tensor, rank=rank, random_state=seed, **cpd_params)
+        return np.asarray(weights), [np.asarray(factor) for factor in factors], \
+            relative_error(tensor, weights, factors, norm_tensor), time.time() - start
+    except Exception as e:
+        print(f"    Run with seed {seed} FAILED during decomposition: {e}")
+        return None, None, np.nan, time.time() - start
+
+
+def run_stability_fits(tensor, rank, seeds, cpd_params, num_workers=None, progress=print):
+    """Fits one run per seed in parallel. Returns the successful runs as a stability dict (see stack_runs);
+    raises RuntimeError when none succeeds."""
+    tensor = np.asarray(tensor, dtype=np.float64)
+    num_workers = max(1, min(num_workers or os.cpu_count() or 1, len(seeds)))
+    if num_workers > 1:
+        block, spec = share_tensor(tensor)
+        try:
+            with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(spec,)) as executor:
+                results = list(executor.map(fit_run, [rank] * len(seeds), seeds, [cpd_params] * len(seeds)))
+        finally:
+            block.close()
+            block.unlink()
+    else:
+        norm_tensor = tensor_norm(tensor)
+        results = [fit_run(rank, seed, cpd_params, tensor, norm_tensor) for seed in seeds]
+    for seed, (_, _, error, seconds) in zip(seeds, results):
+        progress(f"    Run with seed {seed}: error {error:.6f} ({seconds:.2f}s)")
+    successful = [(seed,) + result for seed, result in zip(seeds, results) if result[1] is not None]
+    if not successful:
+        raise RuntimeError("Every stability run failed.")
+    return stack_runs(successful)
+
+
+def stack_runs(runs):
+    """Stability dict of [(seed, weights, factors, error, ...)]: seeds (K,), errors (K,), weights (K, R) and A, B, C (K, D, R)."""
+    return {
+        'seeds': np.array([run[0] for run in runs]),
+        'errors': np.array([run[3] for run in runs], dtype=np.float64),
+        'weights': np.stack([run[1] for run in runs]),
+        **{mode: np.stack([run[2][index] for run in runs]) for index, mode in enumerate(MODES)},
+    }
+
+
+def save_runs(path, runs):
+    np.savez(path, **runs)
+
+
+def load_runs(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+# --- Similarity and Matching ---
+def _unit_columns(stacked):
+    norms = np.linalg.norm(stacked, axis=1, keepdims=True)
+    return stacked / np.where(norms > 0, norms, 1.0)
+
+
+def column_similarities(stacked):
+    """(K, K, R, R) cosine similarity of column r of run k with column q of run l, for a (K, D, R) stack."""
+    unit = _unit_columns(stacked)
+    return np.einsum('kdr,ldq->klrq', unit, unit)
+
+
+def pairwise_matched_similarity(similarities):
+    """(K, K) average similarity of optimally matched columns for every pair of runs (diagonal 1)."""
+    num_runs = similarities.shape[0]
+    result = np.eye(num_runs)
+    for k, l in zip(*np.triu_indices(num_runs, 1)):
+        rows, cols = linear_sum_assignment(-similarities[k, l])
+        result[k, l] = result[l, k] = similarities[k, l][rows, cols].mean()
+    return result
+
+
+def align_to_reference(runs, reference):
+    """Permutations (K, R) putting every run's components in the order of run `reference`.
+
+    Matches on the product of the A, B and C column similarities with the reference run.
+    """
+    combined = np.ones((runs['A'].shape[0],) + (runs['A'].shape[2],) * 2) # (K, R of reference, R of run)
+    for mode in MODES:
+        unit = _unit_columns(runs[mode])
+        combined *= np.einsum('dr,kdq->krq', unit[reference], unit)
+    permutations = np.empty(combined.shape[:2], dtype=np.int64)
+    for k in range(combined.shape[0]):
+        rows, cols = linear_sum_assignment(-combined[k])
+        permutations[k, rows] = cols
+    return permutations
+
+
+def aligned_runs(runs, permutations):
+    """Copy of runs with the components of each run reordered by its permutation."""
+    aligned = dict(runs)
+    index = permutations[:, np.newaxis, :]
+    for mode in MODES:
+        aligned[mode] = np.take_along_axis(runs[mode], np.broadcast_to(index, runs[mode].shape), axis=2)
+    aligned['weights'] = np.take_along_axis(runs['weights'], permutations, axis=1)
+    return aligned
+
+
+def component_stability(aligned, threshold=0.8):
+    """DataFrame per component: mean pairwise similarity of each mode across runs (after alignment) and
+    the share of run pairs in which all three modes exceed threshold."""
+    num_runs = aligned['A'].shape[0]
+    upper = np.triu_indices(num_runs, 1)
+    table = {'component': np.arange(aligned['A'].shape[2]) + 1}
+    all_above = True
+    for mode in MODES:
+        diagonal = np.diagonal(column_similarities(aligned[mode]), axis1=2, axis2=3)[upper] # (pairs, R)
+        table[f'similarity_{mode}'] = diagonal.mean(axis=0) if len(diagonal) else np.ones(aligned[mode].shape[2])
+        all_above = all_above & (diagonal > threshold)
+    table['stable_pair_share'] = np.mean(all_above, axis=0) if num_runs > 1 else np.ones(aligned['A'].shape[2])
+    return pd.DataFrame(table)
+
+
+def consensus_factors(aligned):
+    """Consensus (weights, [A, B, C]) of aligned runs: element-wise median of the unit-norm B and C
+    columns and of A carrying each component's full scale (weights all ones)."""
+    scale = aligned['weights'][:, np.newaxis, :].copy()
+    normalized = {}
+    for mode in ('B', 'C'):
+        norms = np.linalg.norm(aligned[mode], axis=1, keepdims=True)
+        norms = np.where(norms > 0, norms, 1.0)
+        normalized[mode] = aligned[mode] / norms
+        scale = scale * norms
+    normalized['A'] = aligned['A'] * scale
+    factors = [np.median(normalized[mode], axis=0) for mode in MODES]
+    return np.ones(factors[0].shape[1]), factors
+
+
+def stability_report(runs, threshold=0.8):
+    """Everything analyze_factor_similarity.py prints, for a stability dict.
+
+    Returns {'pairwise': {mode: (K, K) matched similarity}, 'components': DataFrame,
+    'reference': index of the best-error run, 'consensus': (weights, factors)}.
+    """
+    pairwise = {mode: pairwise_matched_similarity(column_similarities(runs[mode])) for mode in MODES}
+    reference = int(np.nanargmin(runs['errors'])) if np.isfinite(runs['errors']).any() else 0
+    aligned = aligned_runs(runs, align_to_reference(runs, reference))
+    return {'pairwise': pairwise, 'components': component_stability(aligned, threshold), 'reference': reference,
+            'consensus': consensus_factors(aligned)}
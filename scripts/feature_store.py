@@ -0,0 +1,153 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from layer_aggregation import factorize_values
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # Optional: only needed when the feature store is enabled
+    pa = None
+    pq = None
+
+# --- Columnar Per-Packet Feature Store ---
+# One Parquet file per day (hive layout: <store_dir>/date=YYYY-MM-DD/part-0.parquet) holding every
+# IP packet's source MAC, destination IP, protocol name (dictionary encoded), destination category
+# code, ports, frame length and timestamp. Layer matrices can then be rebuilt from the store after
+# a change of layers, GATEWAY_IP or metric without running tshark over the raw captures again.
+
+# tshark field name -> store column name
+STORE_COLUMNS = {
+    'sll.src.eth': 'src_mac',
+    'ip.dst': 'dst_ip',
+    '_ws.col.protocol': 'protocol',
+    'tcp.dstport': 'tcp_dstport',
+    'udp.dstport': 'udp_dstport',
+    'frame.len': 'frame_len',
+    'frame.time_epoch': 'time_epoch',
+}
+CATEGORY_COLUMN = 'dst_category' # Index into ip_categorizer.ALL_CATEGORIES at extraction time
+CATEGORIZER_KEY_METADATA = b'categorizer_key'
+PARTITION_FILENAME = "part-0.parquet"
+_PARTITION_PATTERN = re.compile(r'^date=(\d{4}-\d{2}-\d{2})$')
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The feature store needs pyarrow (pip install pyarrow).")
+
+
+def store_schema():
+    _require_pyarrow()
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('src_mac', dictionary), ('dst_ip', dictionary), ('protocol', dictionary),
+        (CATEGORY_COLUMN, pa.int8()),
+        ('tcp_dstport', pa.int32()), ('udp_dstport', pa.int32()),
+        ('frame_len', pa.int32()), ('time_epoch', pa.float64()),
+    ])
+
+
+def categorizer_key(categorizer):
+    """Identifies the categorizer settings the stored category codes were computed with."""
+    networks = ','.join(str(network) for network in categorizer.local_networks)
+    return f"{categorizer.gateway_ip}|{networks}|{categorizer.broadcast_ip}"
+
+
+def partition_path(store_dir, date):
+    return os.path.join(store_dir, f"date={date}", PARTITION_FILENAME)
+
+
+def store_dates(store_dir):
+    """Sorted dates that have a complete partition in the store."""
+    if not os.path.isdir(store_dir):
+        return []
+    dates = []
+    for name in os.listdir(store_dir):
+        match = _PARTITION_PATTERN.match(name)
+        if match and os.path.isfile(os.path.join(store_dir, name, PARTITION_FILENAME)):
+            dates.append(match.group(1))
+    return sorted(dates)
+
+
+def day_row_count(store_dir, date):
+    """Number of packets stored for one day (from the Parquet footer, no data is read)."""
+    _require_pyarrow()
+    return pq.ParquetFile(partition_path(store_dir, date)).metadata.num_rows
+
+
+def _dictionary_array(values):
+    codes, uniques = factorize_values(values)
+    labels = [None if pd.isna(value) else str(value) for value in uniques]
+    return pa.DictionaryArray.from_arrays(pa.array(codes.astype(np.int32), mask=codes < 0), pa.array(labels, type=pa.string()))
+
+
+def _int_array(values):
+    values = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+    missing = np.isnan(values)
+    return pa.array(np.where(missing, 0, values).astype(np.int32), mask=missing)
+
+
+def packet_table(df, category_codes):
+    """Arrow table in store layout from a parsed packet frame (tshark column names)."""
+    _require_pyarrow()
+    num_rows = len(df)
+    time_epoch = df['frame.time_epoch'] if 'frame.time_epoch' in df.columns else np.full(num_rows, np.nan)
+    time_values = pd.to_numeric(pd.Series(time_epoch), errors='coerce').to_numpy(dtype=np.float64)
+    arrays = [
+        _dictionary_array(df['sll.src.eth']), _dictionary_array(df['ip.dst']), _dictionary_array(df['_ws.col.protocol']),
+        pa.array(np.asarray(category_codes, dtype=np.int8)),
+        _int_array(df['tcp.dstport']), _int_array(df['udp.dstport']),
+        _int_array(df['frame.len']), pa.array(time_values, mask=np.isnan(time_values)),
+    ]
+    return pa.Table.from_arrays(arrays, schema=store_schema())
+
+
+class DayFeatureWriter:
+    """Appends packet chunks of one day to its partition; the file only appears once closed successfully."""
+
+    def __init__(self, store_dir, date, categorizer_key_value):
+        _require_pyarrow()
+        self.path = partition_path(store_dir, date)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._temp_path = f"{self.path}.tmp{os.getpid()}"
+        schema = store_schema().with_metadata({CATEGORIZER_KEY_METADATA: categorizer_key_value.encode('utf-8')})
+        self._writer = pq.ParquetWriter(self._temp_path, schema, compression='zstd')
+        self.rows_written = 0
+
+    def write_chunk(self, df, category_codes):
+        table = packet_table(df, category_codes)
+        self._writer.write_table(table.replace_schema_metadata(self._writer.schema.metadata))
+        self.rows_written += len(df)
+
+    def close(self):
+        self._writer.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        self._writer.close()
+        if os.path.exists(self._temp_path): os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None: self.close()
+        else: self.abort()
+
+
+def read_day(store_dir, date, columns=None, filters=None):
+    """One day's packets as a DataFrame with tshark column names (plus 'dst_category').
+
+    columns (store names) limits what is read; filters are pyarrow predicates pushed down into the
+    Parquet scan, e.g. [('src_mac', 'in', known_macs)]. Returns (df, categorizer key of the codes).
+    """
+    _require_pyarrow()
+    path = partition_path(store_dir, date)
+    table = pq.read_table(path, columns=columns, filters=filters)
+    metadata = pq.read_schema(path).metadata or {}
+    stored_key = metadata.get(CATEGORIZER_KEY_METADATA, b'').decode('utf-8')
+    store_to_tshark = {store_name: field for field, store_name in STORE_COLUMNS.items()}
+    df = table.to_pandas().rename(columns=store_to_tshark)
+    return df, stored_key
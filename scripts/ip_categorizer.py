@@ -0,0 +1,163 @@
+import ipaddress
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from layer_aggregation import DESTINATION_CATEGORIES, factorize_values
+
+# --- Array-Based Destination IP Categorizer ---
+# A day's traffic hits only a few thousand distinct destinations, so the ip.dst column is
+# factorized, each distinct IP is classified once (canonical IPv4 strings with integer range
+# checks on packed uint32s, everything else via ipaddress) and the category codes are
+# broadcast back to the packets. Results are kept in a bounded LRU shared across days.
+
+BROADCAST_IP_STR = '255.255.255.255'
+
+# Every label categorize_destination() can return; cached codes index into this list
+ALL_CATEGORIES = [
+    "Gateway", "External", "Other Local IP", "Broadcast", "Multicast",
+    "Loopback", "Link-Local", "Unspecified", "Other/Unknown IP", "Non-IP/Invalid",
+]
+_CODE = {category: i for i, category in enumerate(ALL_CATEGORIES)}
+
+# Canonical dotted quad (no leading zeros), the only form handled by the integer fast path
+IPV4_PATTERN = r'(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(?:\.(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3}'
+
+# Superset of the IPv4 ranges any Python version treats as not is_global (IANA special-purpose
+# blocks). Addresses outside it are global; addresses inside it are decided by ipaddress.
+IPV4_SPECIAL_PURPOSE_NETWORKS = [
+    ipaddress.ip_network(net) for net in (
+        '0.0.0.0/8', '10.0.0.0/8', '100.64.0.0/10', '127.0.0.0/8', '169.254.0.0/16', '172.16.0.0/12',
+        '192.0.0.0/24', '192.0.2.0/24', '192.88.99.0/24', '192.168.0.0/16', '198.18.0.0/15',
+        '198.51.100.0/24', '203.0.113.0/24', '240.0.0.0/4',
+    )
+]
+
+
+def _in_networks(packed, networks):
+    """Boolean mask of packed IPv4 uint32s falling inside any of the given IPv4 networks."""
+    mask = np.zeros(packed.shape, dtype=bool)
+    for network in networks:
+        if network.version != 4: continue
+        mask |= (packed & np.uint32(int(network.netmask))) == np.uint32(int(network.network_address))
+    return mask
+
+
+def pack_ipv4(ip_strings):
+    """Packs canonical dotted-quad strings into uint32s (input must match IPV4_PATTERN)."""
+    octets = pd.Series(ip_strings, dtype=object).str.split('.', expand=True).to_numpy(dtype=np.uint32)
+    if octets.size == 0:
+        return np.zeros(0, dtype=np.uint32)
+    return (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+
+
+class DestinationCategorizer:
+    """Classifies destination IP columns into category column codes, one classification per distinct IP.
+
+    Gives the same answers as categorize_destination() in the parsing scripts for both
+    IPv4 and IPv6 destinations. Create one instance per run and reuse it for every day.
+    """
+
+    def __init__(self, gateway_ip, local_networks, categories=DESTINATION_CATEGORIES,
+                 broadcast_ip=BROADCAST_IP_STR, max_cache_size=65536):
+        self.gateway_ip = gateway_ip
+        self.local_networks = list(local_networks)
+        self.broadcast_ip = broadcast_ip
+        self.max_cache_size = max_cache_size
+        self._cache = OrderedDict() # ip string -> index into ALL_CATEGORIES (LRU order)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Maps ALL_CATEGORIES codes to output column indices (-1 for untracked categories)
+        col_index = {category: i for i, category in enumerate(categories)}
+        self._code_to_col = np.array([col_index.get(category, -1) for category in ALL_CATEGORIES], dtype=np.int64)
+
+    # --- Slow path: one ipaddress object, same rules as categorize_destination() ---
+    def _classify_one(self, ip_str):
+        if not isinstance(ip_str, str) or not ip_str:
+            return _CODE["Non-IP/Invalid"]
+        try:
+            ip_addr = ipaddress.ip_address(ip_str)
+        except ValueError:
+            return _CODE["Non-IP/Invalid"]
+        if self.gateway_ip and ip_str == self.gateway_ip: return _CODE["Gateway"]
+        if ip_str == self.broadcast_ip: return _CODE["Broadcast"]
+        if ip_str.endswith('.255') and any(ip_addr in net for net in self.local_networks): return _CODE["Broadcast"]
+        if ip_addr.is_multicast: return _CODE["Multicast"]
+        if ip_addr.is_loopback: return _CODE["Loopback"]
+        if ip_addr.is_link_local: return _CODE["Link-Local"]
+        if ip_addr.is_unspecified: return _CODE["Unspecified"]
+        if any(ip_addr in net for net in self.local_networks): return _CODE["Other Local IP"]
+        return _CODE["External"] if ip_addr.is_global else _CODE["Other/Unknown IP"]
+
+    # --- Fast path: integer range checks over packed IPv4 addresses ---
+    def _classify_ipv4(self, ip_strings):
+        """Codes for canonical IPv4 strings; -1 where the slow path must decide (special-purpose ranges)."""
+        packed = pack_ipv4(ip_strings)
+        last_octet = packed & np.uint32(0xFF)
+        is_local = _in_networks(packed, self.local_networks)
+        conditions = [
+            ip_strings == self.gateway_ip if self.gateway_ip else np.zeros(packed.shape, dtype=bool),
+            ip_strings == self.broadcast_ip,
+            (last_octet == 255) & is_local,
+            (packed >> np.uint32(28)) == 0xE,                      # 224.0.0.0/4
+            (packed >> np.uint32(24)) == 127,                      # 127.0.0.0/8
+            (packed >> np.uint32(16)) == 0xA9FE,                   # 169.254.0.0/16
+            packed == 0,                                           # 0.0.0.0
+            is_local,
+            ~_in_networks(packed, IPV4_SPECIAL_PURPOSE_NETWORKS),  # Certainly is_global
+        ]
+        choices = [_CODE[c] for c in ("Gateway", "Broadcast", "Broadcast", "Multicast", "Loopback",
+                                      "Link-Local", "Unspecified", "Other Local IP", "External")]
+        return np.select(conditions, choices, default=-1)
+
+    def _classify_uniques(self, ip_strings):
+        codes = np.full(len(ip_strings), -1, dtype=np.int64)
+        is_string = np.array([isinstance(ip, str) for ip in ip_strings], dtype=bool)
+        is_ipv4 = np.zeros(len(ip_strings), dtype=bool)
+        if is_string.any():
+            is_ipv4[is_string] = pd.Series(ip_strings[is_string], dtype=object).str.fullmatch(IPV4_PATTERN).to_numpy(dtype=bool)
+        if is_ipv4.any():
+            codes[is_ipv4] = self._classify_ipv4(ip_strings[is_ipv4])
+        for i in np.flatnonzero(codes < 0): # IPv6, invalid strings and special-purpose IPv4
+            codes[i] = self._classify_one(ip_strings[i])
+        return codes
+
+    def _lookup(self, ip_strings):
+        """Category codes for distinct IP strings, consulting and refreshing the LRU cache."""
+        codes = np.empty(len(ip_strings), dtype=np.int64)
+        missing = []
+        for i, ip in enumerate(ip_strings):
+            code = self._cache.get(ip)
+            if code is None:
+                missing.append(i)
+            else:
+                self._cache.move_to_end(ip)
+                codes[i] = code
+        self.cache_hits += len(ip_strings) - len(missing)
+        self.cache_misses += len(missing)
+        if missing:
+            missing = np.array(missing, dtype=np.int64)
+            new_codes = self._classify_uniques(ip_strings[missing])
+            codes[missing] = new_codes
+            for ip, code in zip(ip_strings[missing], new_codes):
+                self._cache[ip] = int(code)
+            while len(self._cache) > self.max_cache_size:
+                self._cache.popitem(last=False)
+        return codes
+
+    def categorize(self, ip_str):
+        """Category label for a single IP string."""
+        return ALL_CATEGORIES[self._lookup(np.array([ip_str], dtype=object))[0]]
+
+    def category_codes(self, ip_values):
+        """Index into ALL_CATEGORIES per packet."""
+        codes, uniques = factorize_values(ip_values)
+        unique_codes = self._lookup(np.asarray(uniques, dtype=object))
+        return np.append(unique_codes, _CODE["Non-IP/Invalid"])[codes]
+
+    def column_codes(self, ip_values):
+        """Destination column index per packet (-1 for untracked categories), ready for aggregate_layers()."""
+        return self.columns_from_category_codes(self.category_codes(ip_values))
+
+    def columns_from_category_codes(self, category_codes):
+        """Destination column index per packet from precomputed ALL_CATEGORIES codes."""
+        return self._code_to_col[np.asarray(category_codes, dtype=np.int64)]
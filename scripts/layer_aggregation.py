@@ -0,0 +1,260 @@
+import numpy as np
+import pandas as pd
+from sparse_tensor import SparseTensor
+
+# --- Columnar Layer Aggregation ---
+# Replaces the per-packet df.iterrows() loop of the parsing scripts. MACs are mapped to
+# row indices, destination categories to column indices and the layer rules to boolean
+# masks over whole arrays; all layer matrices are then filled with one np.bincount scatter.
+
+# Destination category labels (column order of every daily matrix)
+DESTINATION_CATEGORIES = ["Gateway", "External", "Other Local IP", "Broadcast", "Multicast"]
+
+# Layers for which matrices are generated ('aggregated_ip' must stay first)
+LAYER_KEYS = [
+    'aggregated_ip',
+    'external_tcp_tls',
+    'external_udp_quic',
+    'local_discovery',
+    'gateway_dns',
+    'other_local_tcp'
+]
+
+
+# --- Protocol Predicates ---
+def default_protocol_flags(protocol):
+    """Layer protocol predicates for one upper-cased protocol name (parsing_all_new.py rules)."""
+    return {
+        'tcp_tls': "TCP" in protocol or "TLS" in protocol,
+        'udp_quic': protocol == "UDP" or "QUIC" in protocol,
+        'dns': protocol == "DNS",
+        'discovery': protocol == "SSDP" or protocol == "MDNS" or protocol == "DHCP",
+        'tcp': protocol == "TCP",
+    }
+
+
+def factorize_values(values):
+    """(codes, uniques) of a column; categorical columns (native pcap reader) reuse their codes.
+
+    Missing categorical values get code -1, which selects the trailing fill value appended by callers.
+    """
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        categorical = pd.Categorical(values)
+        return categorical.codes.astype(np.int64), np.asarray(categorical.categories, dtype=object)
+    return pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+
+
+def _lookup_codes(values, lookup_fn, fill_value=-1, dtype=np.int64):
+    """Applies lookup_fn once per distinct value and broadcasts the results back to all rows."""
+    codes, uniques = factorize_values(values)
+    unique_results = np.array([lookup_fn(value) for value in uniques], dtype=dtype)
+    # Trailing fill value so an empty input still indexes cleanly
+    return np.append(unique_results, np.array([fill_value], dtype=dtype))[codes]
+
+
+def device_codes(mac_values, mac_to_row_index):
+    """Row index per packet for known source MACs, -1 for everything else."""
+    return _lookup_codes(mac_values, lambda mac: mac_to_row_index.get(mac, -1))
+
+
+def destination_codes(ip_values, categorize_fn, gateway_ip, categories=DESTINATION_CATEGORIES):
+    """Column index per packet for tracked destination categories, -1 for everything else.
+
+    categorize_fn(ip_str, gateway_ip_str) is called once per distinct destination IP.
+    """
+    category_to_col_index = {category: i for i, category in enumerate(categories)}
+    return _lookup_codes(ip_values, lambda ip: category_to_col_index.get(categorize_fn(ip, gateway_ip), -1))
+
+
+def protocol_flag_arrays(protocol_values, protocol_flags=default_protocol_flags):
+    """Boolean array per protocol predicate, evaluated once per distinct protocol name."""
+    codes, uniques = factorize_values(protocol_values)
+    unique_flags = [protocol_flags(str(protocol).upper()) for protocol in uniques]
+    flag_names = list(protocol_flags("").keys())
+    flag_arrays = {}
+    for name in flag_names:
+        table = np.array([flags[name] for flags in unique_flags] + [False], dtype=bool)
+        flag_arrays[name] = table[codes]
+    return flag_arrays
+
+
+# --- Layer Assignment ---
+def layer_codes(col_codes, protocol_flag_dict, dst_port_tcp, dst_port_udp, categories=DESTINATION_CATEGORIES):
+    """Index into LAYER_KEYS of the (single) protocol layer each packet belongs to, 0 for none.
+
+    Mirrors the if/elif chain of the per-row loop, so the first matching layer wins.
+    """
+    col = {category: i for i, category in enumerate(categories)}
+    is_external = col_codes == col["External"]
+    is_bcast_mcast = (col_codes == col["Broadcast"]) | (col_codes == col["Multicast"])
+    is_gateway = col_codes == col["Gateway"]
+    is_other_local = col_codes == col["Other Local IP"]
+    is_dns = protocol_flag_dict['dns'] | (dst_port_udp == 53.0) | (dst_port_tcp == 53.0)
+
+    conditions = [
+        is_external & protocol_flag_dict['tcp_tls'],
+        is_external & protocol_flag_dict['udp_quic'],
+        is_bcast_mcast & protocol_flag_dict['discovery'],
+        is_gateway & is_dns,
+        is_other_local & protocol_flag_dict['tcp'],
+    ]
+    choices = [LAYER_KEYS.index(key) for key in
+               ('external_tcp_tls', 'external_udp_quic', 'local_discovery', 'gateway_dns', 'other_local_tcp')]
+    return np.select(conditions, choices, default=0)
+
+
+def empty_layer_matrices(num_devices, num_categories=len(DESTINATION_CATEGORIES)):
+    """Zeroed int64 N x M matrix per layer."""
+    return {key: np.zeros((num_devices, num_categories), dtype=np.int64) for key in LAYER_KEYS}
+
+
+def add_layer_matrices(matrix_dict_total, matrix_dict_partial):
+    """Folds one chunk's layer matrices into the running totals (in place)."""
+    for key, matrix_data in matrix_dict_partial.items():
+        matrix_dict_total[key] += matrix_data
+    return matrix_dict_total
+
+
+# Metrics the aggregation can produce per (device, category) cell of every layer
+AGGREGATION_METRICS = ['count', 'bytes', 'distinct_dst']
+
+
+def _layer_scatter_index(df, mac_to_row_index, num_devices, dest_col_codes, protocol_flags, num_categories):
+    """Flat (layer, device, category) index of every aggregated packet entry, plus the packet row it came from.
+
+    Every tracked packet lands in 'aggregated_ip' (layer 0) plus at most one protocol layer.
+    """
+    row_codes = device_codes(df['sll.src.eth'], mac_to_row_index)
+    col_codes = np.asarray(dest_col_codes, dtype=np.int64)
+    tracked = (row_codes >= 0) & (col_codes >= 0)
+
+    flags = protocol_flag_arrays(df['_ws.col.protocol'], protocol_flags)
+    dst_port_tcp = pd.to_numeric(df['tcp.dstport'], errors='coerce').to_numpy(dtype=np.float64)
+    dst_port_udp = pd.to_numeric(df['udp.dstport'], errors='coerce').to_numpy(dtype=np.float64)
+    layers = layer_codes(col_codes, flags, dst_port_tcp, dst_port_udp)
+
+    num_cells = num_devices * num_categories
+    tracked_rows = np.flatnonzero(tracked)
+    cell_index = row_codes[tracked_rows] * num_categories + col_codes[tracked_rows]
+    tracked_layers = layers[tracked_rows]
+    in_layer = tracked_layers > 0
+    scatter_index = np.concatenate([cell_index, tracked_layers[in_layer] * num_cells + cell_index[in_layer]])
+    packet_rows = np.concatenate([tracked_rows, tracked_rows[in_layer]])
+    return scatter_index, packet_rows, len(tracked_rows)
+
+
+def _split_layers(totals, num_devices, num_categories):
+    totals = totals.reshape(len(LAYER_KEYS), num_devices, num_categories)
+    return {key: totals[i].copy() for i, key in enumerate(LAYER_KEYS)}
+
+
+def aggregate_layers(df, mac_to_row_index, num_devices, dest_col_codes,
+                     protocol_flags=default_protocol_flags, num_categories=len(DESTINATION_CATEGORIES)):
+    """Builds every layer's N x M count matrix from a parsed tshark frame in one scatter.
+
+    dest_col_codes holds the destination column index per packet (-1 for untracked
+    categories), e.g. from destination_codes(). Returns (matrix_dict_count, packets_aggregated)
+    with the same contents the per-row loop produced.
+    """
+    scatter_index, _, packets_aggregated = _layer_scatter_index(
+        df, mac_to_row_index, num_devices, dest_col_codes, protocol_flags, num_categories)
+    totals = np.bincount(scatter_index, minlength=len(LAYER_KEYS) * num_devices * num_categories).astype(np.int64)
+    return _split_layers(totals, num_devices, num_categories), packets_aggregated
+
+
+class LayerMetricAccumulator:
+    """Accumulates several metrics for every layer over the chunks of one day in a single pass.
+
+    'count' is the number of packets, 'bytes' the sum of frame.len and 'distinct_dst' the number
+    of distinct destination IPs per cell. Counts and bytes are summed per chunk; distinct
+    destinations are kept as (cell, IP id) pairs so that IPs seen in several chunks count once.
+    With num_time_bins > 1 every packet is also assigned to a sub-daily bin (see time_bins.py).
+    Packets without a bin (-1, no timestamp) go to an extra slot after the last bin that only the day
+    totals include, so the day totals never depend on num_time_bins: per cell, the sum over the bins
+    plus the untimed packets is the day total. They are counted in packets_without_time.
+    """
+
+    def __init__(self, num_devices, metrics=('count',), num_categories=len(DESTINATION_CATEGORIES),
+                 protocol_flags=default_protocol_flags, num_time_bins=1):
+        unknown = [metric for metric in metrics if metric not in AGGREGATION_METRICS]
+        if unknown: raise ValueError(f"Unknown aggregation metric(s): {unknown}. Choose from {AGGREGATION_METRICS}.")
+        self.metrics = list(metrics)
+        self.num_devices = num_devices
+        self.num_categories = num_categories
+        self.protocol_flags = protocol_flags
+        self.num_time_bins = num_time_bins
+        self._day_entries = len(LAYER_KEYS) * num_devices * num_categories # Entries of one (layer, device, category) block
+        self._num_slots = num_time_bins + 1 if num_time_bins > 1 else 1 # The bins plus the untimed slot
+        num_entries = self._day_entries * self._num_slots # Bin-major: entry = bin * day_entries + layer entry
+        self._counts = np.zeros(num_entries, dtype=np.int64)
+        self._bytes = np.zeros(num_entries, dtype=np.int64)
+        self._ip_ids = {} # Destination IP string -> id, shared by all chunks of the day
+        self._distinct_keys = [] # Unique (entry, IP id) pairs per chunk
+        self.packets_aggregated = 0
+        self.packets_without_time = 0
+
+    def add(self, df, mac_to_row_index, dest_col_codes, time_bins=None):
+        """Folds one packet frame into the running totals. Returns the number of packets aggregated.
+
+        time_bins holds the bin index per packet (required when num_time_bins > 1).
+        """
+        scatter_index, packet_rows, packets_aggregated = _layer_scatter_index(
+            df, mac_to_row_index, self.num_devices, dest_col_codes, self.protocol_flags, self.num_categories)
+        if self.num_time_bins > 1:
+            bins = np.asarray(time_bins, dtype=np.int64)[packet_rows]
+            untimed = bins < 0
+            self.packets_without_time += int(np.count_nonzero(untimed[:packets_aggregated])) # The first entries are one per packet
+            bins[untimed] = self.num_time_bins # The day-only slot
+            scatter_index = scatter_index + bins * self._day_entries
+        num_entries = len(self._counts)
+        self._counts += np.bincount(scatter_index, minlength=num_entries)
+        if 'bytes' in self.metrics:
+            frame_len = pd.to_numeric(df['frame.len'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+            # Integer weights are summed exactly as long as a cell stays below 2**53 bytes
+            self._bytes += np.bincount(scatter_index, weights=frame_len[packet_rows], minlength=num_entries).astype(np.int64)
+        if 'distinct_dst' in self.metrics:
+            ip_codes, ip_uniques = factorize_values(df['ip.dst'])
+            unique_ids = np.array([self._ip_ids.setdefault(ip, len(self._ip_ids)) for ip in ip_uniques], dtype=np.int64)
+            ip_ids = unique_ids[ip_codes[packet_rows]] # Tracked packets always have a destination
+            self._distinct_keys.append(np.unique(np.stack([scatter_index, ip_ids], axis=1), axis=0))
+        self.packets_aggregated += packets_aggregated
+        return packets_aggregated
+
+    def _distinct_totals(self, per_bin):
+        pairs = np.concatenate(self._distinct_keys) if self._distinct_keys else np.zeros((0, 2), dtype=np.int64)
+        if not per_bin:
+            pairs = np.stack([pairs[:, 0] % self._day_entries, pairs[:, 1]], axis=1) # An IP counts once per day
+        pairs = np.unique(pairs, axis=0)
+        return np.bincount(pairs[:, 0], minlength=len(self._counts) if per_bin else self._day_entries).astype(np.int64)
+
+    def _binned_layers(self, totals):
+        """{layer_key: N x M x num_time_bins SparseTensor} of the nonzero timed entries (no dense N x M x B array)."""
+        entries = np.flatnonzero(totals[:self.num_time_bins * self._day_entries])
+        bins, layers, devices, categories = np.unravel_index(
+            entries, (self.num_time_bins, len(LAYER_KEYS), self.num_devices, self.num_categories))
+        order = np.lexsort((bins, categories, devices)) # C order of each layer's N x M x B array
+        entries, bins, layers, devices, categories = (array[order] for array in (entries, bins, layers, devices, categories))
+        shape = (self.num_devices, self.num_categories, self.num_time_bins)
+        return {key: SparseTensor(np.stack([devices[layers == i], categories[layers == i], bins[layers == i]]),
+                                  totals[entries[layers == i]], shape)
+                for i, key in enumerate(LAYER_KEYS)}
+
+    def result(self, per_bin=False):
+        """{metric: {layer_key: int64 matrix}} for every configured metric.
+
+        Matrices are N x M day totals (untimed packets included), or with per_bin=True N x M x num_time_bins
+        SparseTensors (sparse_tensor.py) of the timed packets.
+        """
+        results = {}
+        for metric in self.metrics:
+            if metric == 'distinct_dst':
+                totals = self._distinct_totals(per_bin)
+            else:
+                totals = self._counts if metric == 'count' else self._bytes
+                if not per_bin:
+                    totals = totals.reshape(self._num_slots, self._day_entries).sum(axis=0)
+            if per_bin:
+                results[metric] = self._binned_layers(totals)
+            else:
+                results[metric] = _split_layers(totals, self.num_devices, self.num_categories)
+        return results
@@ -4,12 +4,28 @@ import re
 import numpy as np
 import pandas as pd
 import sys
+from build_manifest import clear_stale_tensor, stale_tensor_layers
+from time_bins import binned_dir_name, day_start_epoch, load_binned_day, load_binned_day_coo
+from sparse_tensor import SparseTensor, sparse_path_for
 
 # --- Configuration ---
-LAYER_CSV_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\layer_other_local_tcp_count" 
+AGGREGATION_METRIC = 'count' # 'count', 'bytes' or 'distinct_dst' (see AGGREGATION_METRICS in parsing_all_new.py)
+LAYER_CSV_DIR = rf"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\layer_other_local_tcp_{AGGREGATION_METRIC}"
 
 # Output file path for the resulting tensor
-OUTPUT_TENSOR_FILENAME = "local_tcp_count_tensor.npy" # <--- CHANGE THIS based on the layer being processed
+OUTPUT_TENSOR_FILENAME = f"local_tcp_{AGGREGATION_METRIC}_tensor.npy" # <--- CHANGE THIS based on the layer being processed
+
+# Sub-daily resolution: stack the sparse <layer dir>_<bin>min/YYYY-MM-DD.npz days written by parsing_all_new.py
+# (TIME_BIN_MINUTES there) into an N x M x (days * bins) tensor. None stacks the daily CSVs.
+TIME_BIN_MINUTES = None
+TIME_BIN_TIMEZONE = 'Australia/Melbourne' # Only used for the slice start times in the time index CSV
+if TIME_BIN_MINUTES:
+    LAYER_CSV_DIR = binned_dir_name(LAYER_CSV_DIR, TIME_BIN_MINUTES)
+    OUTPUT_TENSOR_FILENAME = OUTPUT_TENSOR_FILENAME.replace("_tensor.npy", f"_{TIME_BIN_MINUTES}min_tensor.npy")
+# 'dense' writes the .npy, 'sparse' only the COO <name>_tensor.npz of the nonzeros (see sparse_tensor.py;
+# the full N x M x T array is never built, which matters for sub-daily tensors), 'both' writes both
+TENSOR_FORMAT = 'dense'
+SPARSE_ONLY = TENSOR_FORMAT == 'sparse'
 OUTPUT_TENSOR_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\tensors" # Directory to save the tensor file
 
 # Expected dimensions (verify these match your data)
@@ -21,33 +37,35 @@ os.makedirs(OUTPUT_TENSOR_DIR, exist_ok=True)
 output_tensor_path = os.path.join(OUTPUT_TENSOR_DIR, OUTPUT_TENSOR_FILENAME)
 
 # --- Find and Sort CSV Files ---
-print(f"Scanning for daily CSV files in: {LAYER_CSV_DIR}")
-csv_files = glob.glob(os.path.join(LAYER_CSV_DIR, "*.csv"))
+file_extension = "npz" if TIME_BIN_MINUTES else "csv"
+print(f"Scanning for daily {file_extension.upper()} files in: {LAYER_CSV_DIR}")
+csv_files = glob.glob(os.path.join(LAYER_CSV_DIR, f"*.{file_extension}"))
 
 if not csv_files:
-    print(f"FATAL ERROR: No CSV files found in the specified directory.")
+    print(f"FATAL ERROR: No {file_extension.upper()} files found in the specified directory.")
     sys.exit(1)
 
 # Extract dates and sort
 file_info_list = []
 for f_path in csv_files:
     filename = os.path.basename(f_path)
-    match = re.match(r'(\d{4}-\d{2}-\d{2})\.csv', filename) # Match YYYY-MM-DD.csv exactly
+    match = re.match(rf'(\d{{4}}-\d{{2}}-\d{{2}})\.{file_extension}$', filename) # Match YYYY-MM-DD.<ext> exactly (no temp files)
     if match:
         file_info_list.append({"path": f_path, "date": match.group(1)})
     else:
         print(f"Warning: Skipping file with unexpected name format: {filename}")
 
 if not file_info_list:
-    print(f"FATAL ERROR: No CSV files with format YYYY-MM-DD.csv found.")
+    print(f"FATAL ERROR: No files with format YYYY-MM-DD.{file_extension} found.")
     sys.exit(1)
 
 file_info_list.sort(key=lambda x: x['date'])
 num_time_steps = len(file_info_list)
-print(f"Found {num_time_steps} daily CSV files to stack.")
+print(f"Found {num_time_steps} daily {file_extension.upper()} files to stack.")
 
 # --- Load Matrices and Stack into Tensor ---
 daily_matrices = []
+slice_starts = [] # (date, window start) per time step of a sub-daily tensor, for its time index CSV
 expected_shape = (EXPECTED_NUM_DEVICES, EXPECTED_NUM_CATEGORIES)
 
 print("Loading and stacking matrices...")
@@ -55,6 +73,27 @@ for i, file_info in enumerate(file_info_list):
     f_path = file_info['path']
     date = file_info['date']
     # print(f"  Loading {os.path.basename(f_path)}...") # Optional verbose print
+    if TIME_BIN_MINUTES:
+        # Sparse N x M x B day, expanded to dense bins (one day at a time keeps memory bounded)
+        # or, for a sparse tensor, kept as its nonzeros
+        try:
+            if SPARSE_ONLY:
+                coords, values, shape, bin_minutes = load_binned_day_coo(f_path)
+                binned_day = SparseTensor(coords, values.astype(np.int64), shape)
+            else:
+                binned_day, bin_minutes = load_binned_day(f_path)
+        except Exception as e:
+            print(f"  ERROR processing file {os.path.basename(f_path)}: {e}. Skipping.")
+            continue
+        if binned_day.shape[:2] != expected_shape or bin_minutes != TIME_BIN_MINUTES:
+            print(f"  WARNING: Skipping {os.path.basename(f_path)}. Expected shape {expected_shape} x bins of "
+                  f"{TIME_BIN_MINUTES} min, but got {binned_day.shape} with {bin_minutes} min bins.")
+            continue
+        daily_matrices.append(binned_day if SPARSE_ONLY else binned_day.astype(np.int64))
+        day_start = day_start_epoch(date, TIME_BIN_TIMEZONE)
+        slice_starts += [(date, pd.Timestamp(day_start + b * bin_minutes * 60, unit='s', tz='UTC').tz_convert(TIME_BIN_TIMEZONE))
+                         for b in range(binned_day.shape[2])]
+        continue
     try:
         # index_col=0 assumes the first column is the MAC Address/Identifier index
         df = pd.read_csv(f_path, index_col=0)
@@ -64,7 +103,7 @@ for i, file_info in enumerate(file_info_list):
             print(f"  WARNING: Skipping {os.path.basename(f_path)}. Expected shape {expected_shape}, but got {df.shape}.")
             continue # Skip this file if shape is wrong
 
-        # Ensure data is numeric (it should be integers for counts)
+        # Ensure data is numeric (integers for every metric: counts, bytes, distinct destinations)
         # Convert to numeric, coercing errors (though should ideally be clean)
         df_numeric = df.apply(pd.to_numeric, errors='coerce')
         if df_numeric.isnull().values.any():
@@ -73,7 +112,7 @@ for i, file_info in enumerate(file_info_list):
 
         # Extract NumPy array and ensure correct dtype
         matrix = df_numeric.values.astype(np.int64) # Or float64 if needed later
-        daily_matrices.append(matrix)
+        daily_matrices.append(SparseTensor.from_dense(matrix[:, :, np.newaxis]) if SPARSE_ONLY else matrix)
 
     except Exception as e:
         print(f"  ERROR processing file {os.path.basename(f_path)}: {e}. Skipping.")
@@ -93,8 +132,14 @@ try:
         # Add more debug here to find the offending file/shape if needed
         sys.exit(1)
 
-    tensor = np.stack(daily_matrices, axis=2)
+    if SPARSE_ONLY:
+        tensor = SparseTensor.concatenate(daily_matrices, axis=2) # Days (of B bins each) in date order
+    elif TIME_BIN_MINUTES:
+        tensor = np.concatenate(daily_matrices, axis=2) # Days of B bins each, in date order
+    else:
+        tensor = np.stack(daily_matrices, axis=2)
     print(f"Successfully stacked matrices into tensor with shape: {tensor.shape}")
+    if SPARSE_ONLY: print(f"  {tensor.nnz} nonzeros (density {tensor.density:.4f})")
     # Expected shape: (N, M, T) -> (24, 5, num_loaded_files)
 
 except Exception as e:
@@ -103,10 +148,23 @@ except Exception as e:
 
 
 # --- Save the Tensor ---
-print(f"\nSaving tensor to: {output_tensor_path}")
 try:
-    np.save(output_tensor_path, tensor)
-    print("Tensor saved successfully.")
+    if not SPARSE_ONLY:
+        print(f"\nSaving tensor to: {output_tensor_path}")
+        np.save(output_tensor_path, tensor)
+        print("Tensor saved successfully.")
+    if TENSOR_FORMAT in ('sparse', 'both'):
+        sparse_tensor = tensor if SPARSE_ONLY else SparseTensor.from_dense(tensor)
+        sparse_tensor.save(sparse_path_for(output_tensor_path))
+        print(f"Sparse tensor ({sparse_tensor.nnz} nonzeros) saved to: {sparse_path_for(output_tensor_path)}")
+    if TIME_BIN_MINUTES: # Which date / window each time slice covers
+        time_index_path = os.path.splitext(output_tensor_path)[0] + "_time_index.csv"
+        pd.DataFrame(slice_starts, columns=['date', 'slice_start']).to_csv(time_index_path, index_label='time_step')
+        print(f"Time index saved to: {time_index_path}")
+    # This layer's tensor is current again (see build_manifest.py / parsing_all_new.py)
+    clear_stale_tensor(OUTPUT_TENSOR_DIR, os.path.basename(os.path.normpath(LAYER_CSV_DIR)))
+    still_stale = sorted(stale_tensor_layers(OUTPUT_TENSOR_DIR))
+    if still_stale: print(f"Note: Tensors still flagged stale for: {', '.join(still_stale)}")
 except Exception as e:
     print(f"FATAL ERROR saving tensor: {e}")
     sys.exit(1)
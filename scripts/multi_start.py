@@ -0,0 +1,213 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from cp_backends import decompose, fit_objective
+from rank_sweep import attach_tensor, share_tensor
+from sparse_tensor import SparseTensor
+
+# --- Multi-Start NNCP with Early Abandonment ---
+# Runs K random starts of a non-negative CPD solver (cp_backends.py, multiplicative updates by
+# default) in parallel, in lockstep rounds of checkpoint_iters iterations (MU and HALS updates only
+# depend on the current factors, so chunking follows the same trajectory as one long run, including where
+# it stops: the tol check between a round's first iteration and the previous round's last, which the
+# solver cannot make, is made by fit_continued. ADMM restarts its dual variables and CP-APR its Phi
+# (whose entries > 1 decide the scooching) at every round, so their chunked runs only approximate one
+# long run). After each round the error trajectories are checked: once
+# past warmup_iters, a run is abandoned when even a linear extrapolation of its last round's
+# improvement over the remaining iterations stays more than abandon_margin above the best error
+# at the same iteration. Decisions only depend on the trajectories, so results are reproducible.
+# Runs are compared by the solver's own objective (cp_backends.fit_objective): the relative error, or
+# for CP-APR the Poisson deviance of each checkpoint, so Poisson fits are never ranked by least squares.
+# Dense tensors are shared with the workers through shared memory (rank_sweep.py), sparse ones
+# (sparse_tensor.py) are pickled once per worker.
+
+RUN_COLUMNS = ['run', 'seed', 'status', 'iterations', 'error', 'deviance', 'wall_time_s']
+
+# Tensor of a worker process, set by _init_worker
+_worker_tensor = None
+
+
+def _init_worker(tensor_or_spec):
+    global _worker_tensor
+    if isinstance(tensor_or_spec, SparseTensor):
+        _worker_tensor = tensor_or_spec
+    else:
+        block, view = attach_tensor(tensor_or_spec)
+        _worker_tensor = (block, view) # Keeps the block mapped for the worker's lifetime
+
+
+def _release_worker_tensor():
+    global _worker_tensor
+    if _worker_tensor is not None and not isinstance(_worker_tensor, SparseTensor):
+        _worker_tensor[0].close()
+    _worker_tensor = None
+
+
+def _current_tensor():
+    return _worker_tensor if isinstance(_worker_tensor, SparseTensor) else _worker_tensor[1]
+
+
+def _converged(previous_objective, objective, tol, solver):
+    """The solver's stopping test: absolute change of the relative error, relative change of CP-APR's deviance."""
+    return abs(previous_objective - objective) < (tol * previous_objective if solver == 'cp_apr' else tol)
+
+
+def fit_continued(tensor, rank, init, n_iter, tol, seed, solver='mu', previous_objective=None):
+    """n_iter iterations of a cp_backends solver from init ('random' or (weights, factors)), stopping as one long
+    run would when init continues a run whose objective was previous_objective.
+
+    The solvers only compare iterations within one call, so a run converging at the first iteration after init
+    is cut back to that iteration here: the least-squares solvers' first error is checked after the call (and
+    the iteration refitted), CP-APR's first deviance by fitting it on its own first.
+    Returns (weights, factors, relative errors of the iterations run, objective of the final factors, converged).
+    """
+    def fit(iterations):
+        (weights, factors), errors = decompose(tensor, rank=rank, solver=solver, init=init, n_iter_max=iterations,
+                                               tol=tol, random_state=seed, return_errors=True)
+        # The last error already is the least-squares objective; only CP-APR's deviance costs an extra pass
+        objective = fit_objective(tensor, weights, factors, solver) if solver == 'cp_apr' else errors[-1]
+        return np.asarray(weights), [np.asarray(factor) for factor in factors], [float(error) for error in errors], float(objective)
+
+    check_first = bool(tol) and previous_objective is not None
+    if check_first and solver == 'cp_apr':
+        first = fit(1)
+        if _converged(previous_objective, first[3], tol, solver):
+            return (*first, True)
+    result = fit(n_iter)
+    if check_first and solver != 'cp_apr' and _converged(previous_objective, result[2][0], tol, solver):
+        return (*(fit(1) if n_iter > 1 else result), True)
+    return (*result, bool(tol) and len(result[2]) < n_iter)
+
+
+def fit_chunk(rank, init, n_iter, tol, seed, solver='mu', previous_objective=None):
+    """fit_continued on the worker's tensor."""
+    return fit_continued(_current_tensor(), rank, init, n_iter, tol, seed, solver, previous_objective)
+
+
+def timed_fit_chunk(rank, init, n_iter, tol, seed, solver='mu', previous_objective=None):
+    """fit_chunk plus its duration in the worker: ((weights, factors, errors, objective, converged), seconds)."""
+    start = time.time()
+    result = fit_chunk(rank, init, n_iter, tol, seed, solver, previous_objective)
+    return result, time.time() - start
+
+
+def projected_objective(checkpoints, remaining_iters):
+    """Optimistic final objective of a run from its (iterations, objective) checkpoints: the last chunk's
+    average decrease per iteration continued for remaining_iters."""
+    if len(checkpoints) < 2:
+        return checkpoints[-1][1]
+    (previous_iters, previous), (iters, current) = checkpoints[-2], checkpoints[-1]
+    return current - max(previous - current, 0.0) / max(iters - previous_iters, 1) * remaining_iters
+
+
+def run_multi_start(tensor, rank, seeds, n_iter_max=500, tol=1e-8, init='random', num_workers=None,
+                    checkpoint_iters=25, warmup_iters=100, abandon_margin=0.01, early_abandon=True, progress=print,
+                    solver='mu'):
+    """Best-of-len(seeds) non-negative CPD of a dense array or SparseTensor with a cp_backends solver.
+
+    Returns (weights, factors, best error, runs DataFrame with RUN_COLUMNS, {run: error trajectory}).
+    The best run is the one with the lowest fit_objective (Poisson deviance for 'cp_apr', filled in the
+    'deviance' column; relative error otherwise). Run status is 'converged' (error change below tol),
+    'max_iter', 'abandoned' or 'failed: ...'.
+    """
+    num_workers = max(1, min(num_workers or os.cpu_count() or 1, len(seeds)))
+    sparse = isinstance(tensor, SparseTensor)
+    block = None
+    if sparse:
+        worker_arg = tensor.astype(np.float64)
+    else:
+        block, worker_arg = share_tensor(tensor)
+
+    trajectories = {run: [] for run in range(len(seeds))}
+    checkpoints = {run: [] for run in range(len(seeds))} # run -> [(iterations, objective)] after every chunk
+    states = {} # run -> (weights, factors) after its last chunk
+    runs = {run: {'run': run + 1, 'seed': seed, 'status': 'running', 'iterations': 0, 'error': np.nan, 'deviance': np.nan,
+                  'wall_time_s': 0.0} for run, seed in enumerate(seeds)}
+
+    def finish(run, status):
+        runs[run]['status'] = status
+        if status != 'converged' and status != 'max_iter':
+            states.pop(run, None)
+        deviance = f", deviance {runs[run]['deviance']:.6g}" if solver == 'cp_apr' else ''
+        progress(f"    Run {run + 1} (seed {seeds[run]}) {status} after {runs[run]['iterations']} iterations, "
+                 f"error {runs[run]['error']:.6f}{deviance}, {runs[run]['wall_time_s']:.2f}s")
+
+    def record_chunk(run, result, duration):
+        """Stores a chunk's result; returns True when the run converged within it."""
+        weights, factors, errors, objective, converged = result
+        trajectory = trajectories[run]
+        trajectory.extend(errors)
+        checkpoints[run].append((len(trajectory), objective))
+        states[run] = (weights, factors)
+        runs[run].update(iterations=len(trajectory), error=trajectory[-1] if trajectory else np.nan,
+                         deviance=objective if solver == 'cp_apr' else np.nan, wall_time_s=runs[run]['wall_time_s'] + duration)
+        return converged
+
+    executor = None
+    try:
+        if num_workers > 1:
+            executor = ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(worker_arg,))
+        else:
+            _init_worker(worker_arg)
+        alive = list(range(len(seeds)))
+        done_iters = 0
+        while alive:
+            chunk_size = min(checkpoint_iters, n_iter_max - done_iters)
+            chunk_args = [(rank, states.get(run, init), chunk_size, tol, seeds[run], solver,
+                           checkpoints[run][-1][1] if checkpoints[run] else None) for run in alive]
+            if executor is not None:
+                futures = [executor.submit(timed_fit_chunk, *args) for args in chunk_args]
+                outcomes = [future.exception() or future.result() for future in futures]
+            else:
+                outcomes = []
+                for args in chunk_args:
+                    try:
+                        outcomes.append(timed_fit_chunk(*args))
+                    except Exception as e:
+                        outcomes.append(e)
+            done_iters += chunk_size
+            still_alive = []
+            for run, outcome in zip(alive, outcomes):
+                if isinstance(outcome, Exception):
+                    finish(run, f"failed: {outcome}")
+                elif record_chunk(run, *outcome):
+                    finish(run, 'converged')
+                elif done_iters >= n_iter_max:
+                    finish(run, 'max_iter')
+                else:
+                    still_alive.append(run)
+            alive = still_alive
+
+            # --- Early abandonment (after every run reached done_iters or finished) ---
+            if early_abandon and alive and done_iters >= warmup_iters:
+                candidates = [run for run in checkpoints if checkpoints[run] and runs[run]['status'] in ('running', 'converged', 'max_iter')]
+                reference = min(checkpoints[run][-1][1] for run in candidates) # Objective at done_iters, or final
+                for run in list(alive):
+                    if projected_objective(checkpoints[run], n_iter_max - done_iters) > reference * (1 + abandon_margin):
+                        alive.remove(run)
+                        finish(run, 'abandoned')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        else:
+            _release_worker_tensor()
+        if block is not None:
+            block.close()
+            block.unlink()
+
+    runs_table = pd.DataFrame([runs[run] for run in range(len(seeds))], columns=RUN_COLUMNS)
+    finished = [run for run in states if runs[run]['status'] in ('converged', 'max_iter')]
+    if not finished:
+        return None, None, np.inf, runs_table, trajectories
+    best_run = min(finished, key=lambda run: checkpoints[run][-1][1])
+    weights, factors = states[best_run]
+    return weights, factors, trajectories[best_run][-1], runs_table, trajectories
+
+
+def trajectories_frame(trajectories, runs_table):
+    """Long-format (run, seed, iteration, error) table of the checkpointed error trajectories."""
+    rows = [(run + 1, runs_table.loc[run, 'seed'], iteration, error)
+            for run, trajectory in trajectories.items() for iteration, error in enumerate(trajectory, start=1)]
+    return pd.DataFrame(rows, columns=['run', 'seed', 'iteration', 'error'])
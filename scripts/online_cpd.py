@@ -0,0 +1,175 @@
+import hashlib
+import os
+import numpy as np
+import tensorly as tl
+from tensorly.decomposition import non_negative_parafac
+from tensorly.solvers.nnls import hals_nnls
+from cp_utils import mttkrp, relative_error
+from sparse_tensor import SparseTensor, non_negative_parafac_sparse
+
+# --- Online Non-Negative CPD ---
+# Keeps an (N, M, T) decomposition current as daily N x M slices arrive, without refitting the
+# whole tensor (OnlineCP-style). Besides the factors it keeps the sufficient statistics of the
+# device and category least-squares problems:
+#   P_A = X_(1) (C kr B)   Q_A = (C^T C) * (B^T B)   P_B = X_(2) (C kr A)   Q_B = (C^T C) * (A^T A)
+# A new slice X_t gets its time row c_t by NNLS against the current A, B; each statistic then gets
+# X_t's term only (computed with the current A, B, so all terms of a statistic stay on the same
+# scale), and A and B are refined by NNLS against them. Past rows of C are kept. The cost per day
+# is O(N M R + (N + M) R^2), independent of T. Older terms keep the A, B of their day, so the model
+# drifts slowly; full_refit() restarts from the whole tensor (warm-started from the current
+# factors) and recomputes the statistics exactly. The saved state records a fingerprint of the factors
+# it belongs to, so factors rewritten by another fit (same rank) do not reuse stale statistics.
+# The state also keeps the error of every day (day_errors: per-day errors of the last full fit, then
+# each fold-in error), so drift is judged against recent days of the same scale (drift_baseline),
+# not against the whole-tensor error.
+
+STATE_KEYS = ('P_A', 'Q_A', 'P_B', 'Q_B', 'slices_since_refit', 'refit_error', 'day_errors', 'fingerprint')
+
+
+def factors_fingerprint(factors):
+    """Hex SHA-256 of A, B (weights folded in) and the number of rows of C."""
+    A, B, C = factors
+    digest = hashlib.sha256(f"{A.shape}|{B.shape}|{C.shape[0]}".encode('utf-8'))
+    for factor in (A, B):
+        digest.update(np.ascontiguousarray(factor, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def fold_weights(weights, factors):
+    """Factors with the weights multiplied into the first one (the online updates keep weights at 1)."""
+    weights = np.ones(factors[0].shape[1]) if weights is None else np.asarray(weights, dtype=np.float64)
+    factors = [np.asarray(factor, dtype=np.float64) for factor in factors]
+    return [factors[0] * weights[np.newaxis, :]] + factors[1:]
+
+
+def day_errors(tensor, factors):
+    """||X_t - A diag(c_t) B^T|| / ||X_t|| of every day t of a dense array or SparseTensor for factors [A, B, C]
+    (weights folded in), from one time-mode MTTKRP (NaN for all-zero days)."""
+    A, B, C = factors
+    if isinstance(tensor, SparseTensor):
+        values = tensor.values.astype(np.float64)
+        norms_squared = np.bincount(tensor.coords[2], weights=values * values, minlength=tensor.shape[2])
+    else:
+        tensor = np.asarray(tensor, dtype=np.float64)
+        norms_squared = np.einsum('nmt,nmt->t', tensor, tensor)
+    inner = np.sum(C * mttkrp(tensor, factors, 2), axis=1)
+    model_squared = np.einsum('tr,rs,ts->t', C, (A.T @ A) * (B.T @ B), C)
+    errors = np.full(len(norms_squared), np.nan)
+    nonzero = norms_squared > 0
+    errors[nonzero] = np.sqrt(np.abs(norms_squared - 2 * inner + model_squared)[nonzero] / norms_squared[nonzero])
+    return errors
+
+
+def drift_baseline(state, days):
+    """Median error of the last `days` days with data (NaN when there are none)."""
+    recent = state['day_errors'][-days:]
+    recent = recent[~np.isnan(recent)]
+    return float(np.median(recent)) if len(recent) else np.nan
+
+
+def init_state(tensor, factors, refit_error=np.nan):
+    """Exact sufficient statistics and per-day errors of factors [A, B, C] fitted to tensor (whose T must equal C's rows)."""
+    A, B, C = factors
+    return {
+        'P_A': mttkrp(tensor, factors, 0),
+        'Q_A': (C.T @ C) * (B.T @ B),
+        'P_B': mttkrp(tensor, factors, 1),
+        'Q_B': (C.T @ C) * (A.T @ A),
+        'slices_since_refit': 0,
+        'refit_error': float(refit_error),
+        'day_errors': day_errors(tensor, factors),
+    }
+
+
+def fold_in_slice(day_slice, A, B, c_init=None, nnls_iters=100):
+    """Non-negative time row c minimizing ||X_t - A diag(c) B^T|| for fixed A, B."""
+    gram = (A.T @ A) * (B.T @ B)
+    projection = np.einsum('nr,nm,mr->r', A, day_slice, B)[:, np.newaxis] # diag(A^T X_t B)
+    V = None if c_init is None else np.maximum(np.asarray(c_init, dtype=np.float64), 0)[:, np.newaxis]
+    return tl.to_numpy(hals_nnls(projection, gram, V, n_iter_max=nnls_iters))[:, 0]
+
+
+def slice_error(day_slice, A, B, c):
+    """||X_t - A diag(c) B^T|| / ||X_t|| (NaN for an all-zero day)."""
+    norm = np.linalg.norm(day_slice)
+    if norm == 0:
+        return np.nan
+    return float(np.linalg.norm(day_slice - (A * c[np.newaxis, :]) @ B.T) / norm)
+
+
+def online_update(factors, state, day_slice, nnls_iters=100):
+    """Appends one day to factors [A, B, C] (weights folded in) and refines A and B.
+
+    day_slice is the N x M matrix of the new day. Returns (new factors, new state, slice error).
+    """
+    A, B, C = factors
+    day_slice = np.asarray(day_slice, dtype=np.float64)
+    c_init = C[-1] if len(C) else None
+    c = fold_in_slice(day_slice, A, B, c_init, nnls_iters)
+
+    state = dict(state)
+    state['P_A'] = state['P_A'] + (day_slice @ B) * c[np.newaxis, :]
+    state['Q_A'] = state['Q_A'] + np.outer(c, c) * (B.T @ B)
+    state['P_B'] = state['P_B'] + (day_slice.T @ A) * c[np.newaxis, :]
+    state['Q_B'] = state['Q_B'] + np.outer(c, c) * (A.T @ A)
+    state['slices_since_refit'] = int(state['slices_since_refit']) + 1
+
+    A = tl.to_numpy(hals_nnls(state['P_A'].T, state['Q_A'], A.T.copy(), n_iter_max=nnls_iters)).T
+    B = tl.to_numpy(hals_nnls(state['P_B'].T, state['Q_B'], B.T.copy(), n_iter_max=nnls_iters)).T
+    c = fold_in_slice(day_slice, A, B, c, nnls_iters) # Time row consistent with the refined A, B
+    error = slice_error(day_slice, A, B, c)
+    state['day_errors'] = np.append(state['day_errors'], error)
+    return [A, B, np.vstack([C, c[np.newaxis, :]])], state, error
+
+
+def full_refit(tensor, factors, n_iter_max=100, tol=1e-8):
+    """Warm-started NNCP of the whole tensor from the current factors. Returns (factors, state, error)."""
+    solver = non_negative_parafac_sparse if isinstance(tensor, SparseTensor) else non_negative_parafac
+    weights, refitted = solver(tensor, rank=factors[0].shape[1], init=(np.ones(factors[0].shape[1]), factors),
+                               n_iter_max=n_iter_max, tol=tol)
+    refitted = fold_weights(weights, refitted)
+    error = relative_error(tensor, None, refitted)
+    return refitted, init_state(tensor, refitted, error), error
+
+
+# --- Persistence ---
+def save_factors(paths, factors):
+    """Saves factors [A, B, C] and unit weights to paths (A, B, C, W path): all four are written to temp files
+    first and only renamed into place once every write succeeded, so a failed save keeps the previous set."""
+    arrays = list(factors) + [np.ones(factors[0].shape[1])]
+    temp_paths = [f"{path}.tmp{os.getpid()}.npy" for path in paths]
+    try:
+        for temp_path, array in zip(temp_paths, arrays):
+            np.save(temp_path, array)
+        for temp_path, path in zip(temp_paths, paths):
+            os.replace(temp_path, path)
+    finally:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path): os.remove(temp_path)
+
+
+def save_state(path, state, factors):
+    """Saves the state together with the fingerprint of the factors it belongs to."""
+    temp_path = f"{path}.tmp{os.getpid()}.npz"
+    state = dict(state, fingerprint=factors_fingerprint(factors))
+    try:
+        np.savez(temp_path, **{key: state[key] for key in STATE_KEYS})
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path): os.remove(temp_path)
+
+
+def load_state(path, factors):
+    """Saved state, or None if missing or saved for other factors (e.g. rewritten by performing_clustering.py)."""
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as data:
+        if any(key not in data.files for key in STATE_KEYS):
+            return None # Saved before fingerprints (or per-day errors) were recorded
+        state = {key: data[key] for key in STATE_KEYS}
+    if str(state['fingerprint']) != factors_fingerprint(factors):
+        return None
+    state['slices_since_refit'] = int(state['slices_since_refit'])
+    state['refit_error'] = float(state['refit_error'])
+    state['day_errors'] = np.asarray(state['day_errors'], dtype=np.float64)
+    return state
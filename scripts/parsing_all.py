@@ -2,13 +2,14 @@ import os
 import subprocess
 import pandas as pd
 import numpy as np
-from collections import Counter, defaultdict
 import io
 import ipaddress # To help check IP ranges
 import sys # To exit gracefully on error
 import re # For filename date parsing
 import glob # To find all pcap files
 import time # For timing
+from layer_aggregation import DESTINATION_CATEGORIES, LAYER_KEYS, aggregate_layers
+from ip_categorizer import DestinationCategorizer
 
 # --- Configuration ---
 PCAP_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\28013234\pcapIoT"
@@ -25,26 +26,9 @@ BROADCAST_IP_STR = '255.255.255.255'
 GATEWAY_IP = "192.168.1.1" # Set manually
 AGGREGATION_METRIC = 'count'
 
-# --- Helper Function: Categorize Destination IP ---
-def categorize_destination(ip_str, gateway_ip_str):
-    """Categorizes an IP address string."""
-    if not isinstance(ip_str, str) or not ip_str:
-        return "Non-IP/Invalid"
-    try:
-        ip_addr = ipaddress.ip_address(ip_str)
-        if gateway_ip_str and ip_str == gateway_ip_str: return "Gateway"
-        if ip_str == BROADCAST_IP_STR: return "Broadcast"
-        if ip_str.endswith('.255') and any(ip_addr in net for net in LOCAL_NETWORKS): return "Broadcast"
-        if ip_addr.is_multicast: return "Multicast"
-        if ip_addr.is_loopback: return "Loopback"
-        if ip_addr.is_link_local: return "Link-Local"
-        if ip_addr.is_unspecified: return "Unspecified"
-        for network in LOCAL_NETWORKS:
-            if ip_addr in network: return "Other Local IP"
-        if ip_addr.is_global: return "External"
-        else: return "Other/Unknown IP"
-    except ValueError:
-        return "Non-IP/Invalid"
+# --- Destination IP Categorizer ---
+# Classifies each distinct destination IP once and caches it for the whole run (see ip_categorizer.py)
+ip_categorizer = DestinationCategorizer(GATEWAY_IP, LOCAL_NETWORKS, DESTINATION_CATEGORIES, broadcast_ip=BROADCAST_IP_STR)
 
 # --- Load Metadata (Once Before Loop) ---
 print(f"Loading metadata from {MAC_ADDRESS_FILE}...")
@@ -73,18 +57,11 @@ except Exception as e:
     sys.exit(1)
 
 # --- Define Output Matrix Structure (Once Before Loop) ---
-destination_categories = ["Gateway", "External", "Other Local IP", "Broadcast", "Multicast"]
+destination_categories = DESTINATION_CATEGORIES
 category_to_col_index = {category: i for i, category in enumerate(destination_categories)}
 num_categories = len(destination_categories)
 
-layer_keys = [ # Layers for which matrices will be generated
-    'aggregated_ip',
-    'external_tcp_tls',
-    'external_udp_quic',
-    'local_discovery',
-    'gateway_dns',
-    'other_local_tcp'
-]
+layer_keys = LAYER_KEYS # Layers for which matrices will be generated (see layer_aggregation.py)
 
 # --- Find and Sort PCAP Files ---
 print(f"\nScanning for pcap files in {PCAP_DIR}...")
@@ -117,9 +94,6 @@ for i, file_info in enumerate(pcap_files_info):
     print(f"\nProcessing file {i+1}/{total_files}: {filename} (Date: {file_date})")
     start_time_file = time.time()
 
-    # Initialize Output Matrices for THIS DAY
-    matrix_dict_count = {key: np.zeros((num_iot_devices, num_categories), dtype=np.int64) for key in layer_keys}
-
     # Run tshark
     tshark_cmd = [
         'tshark','-r', pcap_file_to_analyze, '-T', 'fields',
@@ -155,44 +129,9 @@ for i, file_info in enumerate(pcap_files_info):
         print(f"  ERROR parsing tshark output for {filename}: {e}. Skipping file.")
         continue
 
-    # Aggregate Data into Matrices
-    packets_aggregated_this_file = 0
-    for _, row in df.iterrows():
-        src_mac = row['sll.src.eth']
-        dst_ip = row['ip.dst']
-        row_index = mac_to_row_index.get(src_mac)
-
-        if row_index is not None: # If source is a known IoT device
-            category = categorize_destination(dst_ip, GATEWAY_IP)
-            col_index = category_to_col_index.get(category)
-
-            if col_index is not None: # If destination category is one we track
-                protocol = str(row['_ws.col.protocol']).upper()
-                dst_port_tcp = row['tcp.dstport'] # is float or NaN
-                dst_port_udp = row['udp.dstport'] # is float or NaN
-                value_to_add_count = 1
-
-                # Aggregate into Overall Matrix
-                matrix_dict_count['aggregated_ip'][row_index, col_index] += value_to_add_count
-                packets_aggregated_this_file += 1 # Count only packets successfully categorized
-
-                # Aggregate into Layer Matrices
-                # Ensure ports are not NaN before comparison
-                is_tcp_tls = "TCP" in protocol or "TLS" in protocol
-                is_udp_quic = protocol == "UDP" or "QUIC" in protocol
-                is_dns = protocol == "DNS" or (dst_port_udp == 53.0) or (dst_port_tcp == 53.0)
-                is_discovery = protocol == "SSDP" or protocol == "MDNS" or protocol == "DHCP"
-
-                if category == "External" and is_tcp_tls:
-                    matrix_dict_count['external_tcp_tls'][row_index, col_index] += value_to_add_count
-                elif category == "External" and is_udp_quic:
-                    matrix_dict_count['external_udp_quic'][row_index, col_index] += value_to_add_count
-                elif (category == "Broadcast" or category == "Multicast") and is_discovery:
-                     matrix_dict_count['local_discovery'][row_index, col_index] += value_to_add_count
-                elif category == "Gateway" and is_dns:
-                     matrix_dict_count['gateway_dns'][row_index, col_index] += value_to_add_count
-                elif category == "Other Local IP" and protocol == "TCP":
-                     matrix_dict_count['other_local_tcp'][row_index, col_index] += value_to_add_count
+    # Aggregate Data into Matrices (columnar, one scatter for all layers)
+    dest_col_codes = ip_categorizer.column_codes(df['ip.dst'])
+    matrix_dict_count, packets_aggregated_this_file = aggregate_layers(df, mac_to_row_index, num_iot_devices, dest_col_codes)
 
     # --- Save All Result Matrices for THIS DAY using Pandas ---
     identifier_column_name = "MAC_Address"
@@ -1,14 +1,22 @@
 import os
-import subprocess
 import pandas as pd
 import numpy as np
-from collections import Counter, defaultdict
-import io
 import ipaddress # To help check IP ranges
 import sys # To exit gracefully on error
 import re # For filename date parsing
 import glob # To find all pcap files
 import time # For timing
+from concurrent.futures import ProcessPoolExecutor # For parallel day processing
+from layer_aggregation import (
+    DESTINATION_CATEGORIES, LAYER_KEYS, LayerMetricAccumulator,
+    default_protocol_flags, layer_codes
+)
+from ip_categorizer import DestinationCategorizer
+from tshark_reader import TSHARK_FIELDS, TSHARK_DISPLAY_FILTER, build_tshark_cmd, read_tshark_buffered, iter_tshark_chunks
+from pcap_reader import iter_pcap_chunks
+from feature_store import DayFeatureWriter, categorizer_key, partition_path, read_day, day_row_count, store_dates
+from time_bins import bins_per_day, day_start_epoch, time_bin_codes, binned_dir_name, save_binned_day
+from build_manifest import BuildManifest, file_sha256, settings_fingerprint, mark_tensors_stale
 
 # --- Configuration ---
 # Using raw strings for Windows paths
@@ -33,214 +41,423 @@ GATEWAY_IP = "192.168.1.1" # <--- VERIFY OR ADJUST
 if not GATEWAY_IP:
     print("Warning: GATEWAY_IP is not set. Categorization will be less accurate.")
 
-# Aggregation metric
-AGGREGATION_METRIC = 'count' # Change to 'bytes' and adjust aggregation logic if needed
+# Aggregation metrics, all computed in the same pass over the packets (see layer_aggregation.py):
+# 'count' (packets), 'bytes' (sum of frame.len), 'distinct_dst' (distinct destination IPs per cell).
+# Each metric is written to its own layer_<key>_<metric> directories.
+AGGREGATION_METRICS = ['count', 'bytes']
+
+# Sub-daily resolution: packets are additionally binned by frame.time_epoch into TIME_BIN_MINUTES windows
+# (e.g. 15 or 60) of the capture day in TIME_BIN_TIMEZONE and stored sparsely as
+# layer_<key>_<metric>_<bin>min/YYYY-MM-DD.npz (see time_bins.py). None writes the daily CSVs only.
+# Packets without a timestamp stay in the daily CSVs (which do not depend on this setting) but are in no bin.
+TIME_BIN_MINUTES = None
+TIME_BIN_TIMEZONE = 'Australia/Melbourne' # <--- VERIFY: local time of the captures / activeInteractions.csv
+
+# Also extract IPv6 packets (ipv6.dst fills ip.dst). Off by default to keep the IPv4-only daily matrices
+INCLUDE_IPV6 = False
+
+# Packet ingest: 'streaming' reads tshark stdout in chunks of STREAM_CHUNK_ROWS packets (bounded memory),
+# 'buffered' captures the whole tshark output before parsing (original behaviour),
+# 'native' decodes classic .pcap files directly without tshark (see pcap_reader.py; protocol names are
+# port-based approximations of tshark's). .pcapng files always fall back to 'streaming'.
+INGEST_MODE = 'streaming'
+STREAM_CHUNK_ROWS = 500_000
+
+# Parallel day processing: each worker handles one day at a time, so at most NUM_WORKERS tshark
+# processes run at once. 1 keeps the original sequential loop in this process.
+NUM_WORKERS = 1
+# A day's outputs are all written to temp files and only renamed into place once every write succeeded;
+# OUTPUT_BASE_DIR/<COMPLETED_DAYS_DIR_NAME>/YYYY-MM-DD.done is written after the last rename (and removed
+# before the first), so a day without it may hold a mix of old and new files and is re-parsed next run.
+COMPLETED_DAYS_DIR_NAME = "completed_days"
+
+# Incremental runs: pcaps whose layer CSVs are up to date according to the build manifest are skipped
+INCREMENTAL = True
+MANIFEST_HASH_CONTENT = False # True hashes pcap contents instead of trusting size + mtime (slower)
+TENSOR_DIR = os.path.join(OUTPUT_BASE_DIR, "tensors") # Tensors built from the layer CSVs (flagged stale on changes)
+
+# Per-packet feature store (Parquet, needs pyarrow; see feature_store.py)
+# WRITE_FEATURE_STORE: also store every parsed day's IP packets under FEATURE_STORE_DIR
+# AGGREGATE_FROM_STORE: rebuild the layer CSVs from the stored days instead of parsing pcaps
+WRITE_FEATURE_STORE = False
+AGGREGATE_FROM_STORE = False
+FEATURE_STORE_DIR = os.path.join(OUTPUT_BASE_DIR, "feature_store")
+
+# --- Destination IP Categorizer ---
+# Classifies each distinct destination IP once and caches it for the whole run (see ip_categorizer.py)
+# With NUM_WORKERS > 1 every worker process keeps its own cache across the days it handles
+ip_categorizer = DestinationCategorizer(GATEWAY_IP, LOCAL_NETWORKS, DESTINATION_CATEGORIES, broadcast_ip=BROADCAST_IP_STR)
+
+# --- Define Output Matrix Structure ---
+destination_categories = DESTINATION_CATEGORIES
+category_to_col_index = {category: i for i, category in enumerate(destination_categories)}
+num_categories = len(destination_categories)
 
-# --- Helper Function: Categorize Destination IP ---
-def categorize_destination(ip_str, gateway_ip_str):
-    """Categorizes an IP address string."""
-    if not isinstance(ip_str, str) or not ip_str:
-        return "Non-IP/Invalid"
-    try:
-        ip_addr = ipaddress.ip_address(ip_str)
-        if gateway_ip_str and ip_str == gateway_ip_str: return "Gateway"
-        if ip_str == BROADCAST_IP_STR: return "Broadcast"
-        if ip_str.endswith('.255') and any(ip_addr in net for net in LOCAL_NETWORKS): return "Broadcast"
-        if ip_addr.is_multicast: return "Multicast"
-        if ip_addr.is_loopback: return "Loopback"
-        if ip_addr.is_link_local: return "Link-Local"
-        if ip_addr.is_unspecified: return "Unspecified"
-        for network in LOCAL_NETWORKS:
-            if ip_addr in network: return "Other Local IP"
-        if ip_addr.is_global: return "External"
-        else: return "Other/Unknown IP"
-    except ValueError:
-        return "Non-IP/Invalid"
-
-# --- Load Metadata (Once Before Loop) ---
-print(f"Loading metadata from {MAC_ADDRESS_FILE}...")
-mac_to_name = {}
-try:
+layer_keys = LAYER_KEYS # Layers for which matrices will be generated (see layer_aggregation.py)
+
+# Device metadata, set by init_device_metadata() in the main process and in every worker
+known_macs = []
+mac_to_row_index = {}
+num_iot_devices = 0
+
+# --- Helper Function: Load Metadata ---
+def load_device_metadata():
+    """Reads the ordered MAC list (and device names) from MAC_ADDRESS_FILE."""
     mac_df = pd.read_csv(MAC_ADDRESS_FILE)
     mac_column_name = 'MAC Address' # Verify this column exists
     if mac_column_name not in mac_df.columns: raise ValueError(f"Column '{mac_column_name}' not found")
-    known_macs = mac_df[mac_column_name].str.lower().tolist() # Ordered list needed for saving
-    known_macs_set = set(known_macs)
-    mac_to_row_index = {mac: i for i, mac in enumerate(known_macs)}
-    num_iot_devices = len(known_macs)
+    macs = mac_df[mac_column_name].str.lower().tolist() # Ordered list needed for saving
+    if len(macs) == 0: raise ValueError("No MAC addresses loaded from metadata.")
 
+    mac_to_name = {}
     device_name_column = 'Device Name' # Verify this column exists
     if device_name_column in mac_df.columns:
         mac_to_name = pd.Series(mac_df[device_name_column].values, index=mac_df[mac_column_name].str.lower()).to_dict()
         print(f"Loaded names from '{device_name_column}' column.")
     else:
         print(f"Warning: Column '{device_name_column}' not found for device names.")
+    return macs, mac_to_name
 
-    if num_iot_devices == 0: raise ValueError("No MAC addresses loaded from metadata.")
-    print(f"Identified {num_iot_devices} IoT devices.")
-
-except Exception as e:
-    print(f"FATAL ERROR loading metadata: {e}")
-    sys.exit(1)
+def init_device_metadata(macs):
+    """Sets the module-level device lookups (also used as the process pool initializer)."""
+    global known_macs, mac_to_row_index, num_iot_devices
+    known_macs = list(macs)
+    mac_to_row_index = {mac: i for i, mac in enumerate(known_macs)}
+    num_iot_devices = len(known_macs)
 
-# --- Define Output Matrix Structure (Once Before Loop) ---
-destination_categories = ["Gateway", "External", "Other Local IP", "Broadcast", "Multicast"]
-category_to_col_index = {category: i for i, category in enumerate(destination_categories)}
-num_categories = len(destination_categories)
+# --- Helper Function: Output Locations ---
+def layer_output_dir_name(layer_key, metric):
+    return f"layer_{layer_key}_{metric}"
+
+def daily_output_dir_names():
+    """Every layer/metric directory of daily CSVs written by this run."""
+    return [layer_output_dir_name(layer_key, metric) for metric in AGGREGATION_METRICS for layer_key in layer_keys]
+
+def output_dir_names():
+    """Every output directory name written by this run (daily CSVs plus sub-daily .npz if enabled)."""
+    dir_names = daily_output_dir_names()
+    if TIME_BIN_MINUTES:
+        dir_names += [binned_dir_name(dir_name, TIME_BIN_MINUTES) for dir_name in daily_output_dir_names()]
+    return dir_names
+
+def day_output_paths(file_date):
+    """{output dir name: file path} of one day's outputs."""
+    daily_dir_names = set(daily_output_dir_names())
+    return {dir_name: os.path.join(OUTPUT_BASE_DIR, dir_name, f"{file_date}.csv" if dir_name in daily_dir_names else f"{file_date}.npz")
+            for dir_name in output_dir_names()}
+
+def day_marker_path(file_date):
+    """Completion marker of one day's outputs."""
+    return os.path.join(OUTPUT_BASE_DIR, COMPLETED_DAYS_DIR_NAME, f"{file_date}.done")
+
+def processing_settings_hash():
+    """Fingerprint of everything besides the pcap itself that changes a day's layer CSVs."""
+    settings = {
+        'mac_address_file_sha256': file_sha256(MAC_ADDRESS_FILE),
+        'gateway_ip': GATEWAY_IP,
+        'local_networks': [str(network) for network in LOCAL_NETWORKS],
+        'broadcast_ip': BROADCAST_IP_STR,
+        'destination_categories': destination_categories,
+        'layer_keys': layer_keys,
+        'aggregation_metrics': AGGREGATION_METRICS,
+        'time_bin_minutes': TIME_BIN_MINUTES,
+        'time_bin_timezone': TIME_BIN_TIMEZONE if TIME_BIN_MINUTES else None,
+        'include_ipv6': INCLUDE_IPV6,
+        'native_ingest': INGEST_MODE == 'native', # Protocol labels may differ slightly from tshark's
+    }
+    return settings_fingerprint(settings, functions=(default_protocol_flags, layer_codes, LayerMetricAccumulator, DestinationCategorizer))
+
+# --- Helper Function: Save One Day Atomically ---
+def save_day_matrices(metric_matrices, file_date, log, binned_metric_matrices=None):
+    """Writes every layer/metric CSV (and sub-daily .npz) of one day to temp files, then renames them all into
+    place and writes the day's completion marker. Returns False, leaving the previous outputs untouched,
+    if any write fails."""
+    identifier_column_name = "MAC_Address"
+    csv_column_headers = destination_categories
+    output_paths = day_output_paths(file_date)
+    marker_path = day_marker_path(file_date)
 
-layer_keys = [ # Layers for which matrices will be generated
-    'aggregated_ip',
-    'external_tcp_tls',
-    'external_udp_quic',
-    'local_discovery',
-    'gateway_dns',
-    'other_local_tcp'
-]
+    pending = [] # (temp_path, final_path)
+    try:
+        for metric, matrix_dict in metric_matrices.items():
+            for layer_key, matrix_data in matrix_dict.items():
+                output_path = output_paths[layer_output_dir_name(layer_key, metric)]
+                temp_path = output_path + f".tmp{os.getpid()}"
+                pending.append((temp_path, output_path))
+                pd.DataFrame(
+                    matrix_data,
+                    index=pd.Index(known_macs, name=identifier_column_name),
+                    columns=csv_column_headers
+                ).to_csv(temp_path, index=True, header=True)
+        for metric, matrix_dict in (binned_metric_matrices or {}).items():
+            for layer_key, binned_data in matrix_dict.items():
+                output_path = output_paths[binned_dir_name(layer_output_dir_name(layer_key, metric), TIME_BIN_MINUTES)]
+                temp_path = output_path + f".tmp{os.getpid()}"
+                pending.append((temp_path, output_path))
+                save_binned_day(temp_path, binned_data, TIME_BIN_MINUTES)
+    except Exception as e:
+        log(f"  ERROR saving {pending[-1][1] if pending else file_date}: {e}. Keeping the previous outputs of {file_date}.")
+        for temp_path, _ in pending:
+            if os.path.exists(temp_path): os.remove(temp_path)
+        return False
+
+    if os.path.exists(marker_path): os.remove(marker_path)
+    for temp_path, output_path in pending:
+        os.replace(temp_path, output_path)
+    temp_path = marker_path + f".tmp{os.getpid()}"
+    with open(temp_path, 'w') as f:
+        f.write("\n".join(output_path for _, output_path in pending) + "\n")
+    os.replace(temp_path, marker_path)
+    return True
+
+# --- Helper Function: Aggregate One Packet Frame ---
+def new_day_accumulator():
+    num_time_bins = bins_per_day(TIME_BIN_MINUTES) if TIME_BIN_MINUTES else 1
+    return LayerMetricAccumulator(num_iot_devices, AGGREGATION_METRICS, num_time_bins=num_time_bins)
+
+def packet_time_bins(df, file_date):
+    """Sub-daily bin index per packet (None when binning is off)."""
+    if not TIME_BIN_MINUTES:
+        return None
+    time_epoch = df['frame.time_epoch'] if 'frame.time_epoch' in df.columns else np.full(len(df), np.nan)
+    return time_bin_codes(time_epoch, day_start_epoch(file_date, TIME_BIN_TIMEZONE), TIME_BIN_MINUTES)
+
+def aggregate_packets(df, accumulator, file_date, store_writer=None):
+    """Folds one packet frame into the day's layer metrics; also appends it to the day's feature store partition if given."""
+    category_codes = ip_categorizer.category_codes(df['ip.dst'])
+    if store_writer is not None:
+        store_writer.write_chunk(df, category_codes)
+    dest_col_codes = ip_categorizer.columns_from_category_codes(category_codes)
+    return accumulator.add(df, mac_to_row_index, dest_col_codes, packet_time_bins(df, file_date))
+
+# --- Helper Function: Parse and Aggregate One pcap ---
+def ingest_pcap(pcap_file_to_analyze, filename, file_date, log, store_writer=None):
+    """Extracts the IP packets of one pcap and aggregates them. Returns (status, LayerMetricAccumulator or None)."""
+    tshark_fields = list(TSHARK_FIELDS)
+    display_filter = TSHARK_DISPLAY_FILTER
+    if INCLUDE_IPV6:
+        tshark_fields.insert(tshark_fields.index('ip.dst') + 1, 'ipv6.dst')
+        display_filter = '(ip or ipv6) and (sll or eth)'
+    tshark_cmd = build_tshark_cmd(pcap_file_to_analyze, tshark_fields, display_filter)
+    ingest_mode = INGEST_MODE
+    if ingest_mode == 'native' and pcap_file_to_analyze.lower().endswith('.pcapng'):
+        ingest_mode = 'streaming' # Native reader only handles classic pcap
+
+    accumulator = new_day_accumulator()
+    if ingest_mode in ('streaming', 'native'):
+        # Parse and aggregate chunk by chunk (while tshark is still running, or straight from the mapped file)
+        rows_read = 0
+        if ingest_mode == 'native':
+            chunks = iter_pcap_chunks(pcap_file_to_analyze, STREAM_CHUNK_ROWS, include_ipv6=INCLUDE_IPV6)
+        else:
+            chunks = iter_tshark_chunks(tshark_cmd, STREAM_CHUNK_ROWS)
+        try:
+            for chunk in chunks:
+                rows_read += len(chunk)
+                aggregate_packets(chunk, accumulator, file_date, store_writer)
+        except Exception as e:
+            log(f"  ERROR streaming {'pcap records' if ingest_mode == 'native' else 'tshark output'} for {filename}: {e}. Skipping file.")
+            return 'failed', None
+        if rows_read == 0:
+            log(f"  Warning: No valid IP packet data extracted for {filename}. Skipping aggregation.")
+            return 'empty', None
+        return 'ok', accumulator
 
-# --- Find and Sort PCAP Files ---
-print(f"\nScanning for pcap files in {PCAP_DIR}...")
-pcap_files_info = []
-try:
-    potential_files = glob.glob(os.path.join(PCAP_DIR, "*.pcap")) + \
-                      glob.glob(os.path.join(PCAP_DIR, "*.pcapng"))
-    for filepath in potential_files:
-        filename = os.path.basename(filepath)
-        match = re.search(r'(\d{4}-\d{2}-\d{2})', filename)
-        if match:
-            pcap_files_info.append({"path": filepath, "date": match.group(1), "filename": filename})
-        else: print(f"Warning: Could not parse date from filename: {filename}. Skipping.")
-    if not pcap_files_info: raise FileNotFoundError(f"No pcap files with parsable dates found in {PCAP_DIR}.")
-    pcap_files_info.sort(key=lambda x: x['date'])
-    print(f"Found {len(pcap_files_info)} pcap files to process.")
-except Exception as e:
-    print(f"FATAL ERROR finding pcap files: {e}")
-    sys.exit(1)
-
-# --- Main Processing Loop ---
-total_files = len(pcap_files_info)
-start_time_total = time.time()
-processed_count = 0 # Keep track of files actually processed
-skipped_count = 0
-print(f"\n--- Starting processing loop for {total_files} files, beginning from date {START_PROCESSING_DATE} ---")
-
-for i, file_info in enumerate(pcap_files_info):
+    try:
+        df = read_tshark_buffered(tshark_cmd)
+        if df is None:
+             log(f"  Warning: No valid IP packet data extracted by tshark for {filename}. Skipping aggregation.")
+             return 'empty', None
+        # Aggregate Data into Matrices (columnar, one scatter per metric for all layers)
+        aggregate_packets(df, accumulator, file_date, store_writer)
+    except Exception as e:
+        log(f"  ERROR running or parsing tshark on {filename}: {e}. Skipping file.")
+        return 'failed', None
+    return 'ok', accumulator
+
+# --- Helper Function: Aggregate One Day from the Feature Store ---
+def aggregate_day_from_store(file_date):
+    """Rebuilds one day's layer metrics from its feature store partition. Returns None for a day without packets."""
+    if day_row_count(FEATURE_STORE_DIR, file_date) == 0:
+        return None
+    # Only the columns the layers need, and only rows of known devices (pushed down into the Parquet scan)
+    df, stored_key = read_day(FEATURE_STORE_DIR, file_date,
+                              columns=['src_mac', 'dst_ip', 'protocol', 'dst_category', 'tcp_dstport', 'udp_dstport', 'frame_len', 'time_epoch'],
+                              filters=[('src_mac', 'in', known_macs)])
+    if stored_key == categorizer_key(ip_categorizer):
+        dest_col_codes = ip_categorizer.columns_from_category_codes(df['dst_category'])
+    else: # Stored codes were computed with other GATEWAY_IP / LOCAL_NETWORKS settings
+        dest_col_codes = ip_categorizer.column_codes(df['ip.dst'])
+    accumulator = new_day_accumulator()
+    accumulator.add(df, mac_to_row_index, dest_col_codes, packet_time_bins(df, file_date))
+    return accumulator
+
+# --- Helper Function: Process One Day ---
+def process_day(file_info):
+    """Runs tshark (or the native reader / feature store) + aggregation for one day and saves its layer CSVs.
+
+    Returns a summary dict whose 'log' lines are printed by the main process in date order.
+    """
     pcap_file_to_analyze = file_info['path']
     file_date = file_info['date']
     filename = file_info['filename']
-
-    # --- Skip files before the start date ---
-    if file_date < START_PROCESSING_DATE:
-        skipped_count += 1
-        continue # Go to the next file in the loop
-    # --- End Skip Check ---
-
-    processed_count += 1 # Increment count only if not skipped
-    print(f"\nProcessing file {i+1}/{total_files} (Actual Processed: {processed_count}): {filename} (Date: {file_date})")
+    log_lines = []
+    log = log_lines.append
+    summary = {'date': file_date, 'filename': filename, 'status': 'failed', 'packets': 0, 'log': log_lines}
     start_time_file = time.time()
 
-    # Initialize Output Matrices for THIS DAY
-    matrix_dict_count = {key: np.zeros((num_iot_devices, num_categories), dtype=np.int64) for key in layer_keys}
-
-    # Run tshark
-    tshark_cmd = [
-        'tshark','-r', pcap_file_to_analyze, '-T', 'fields',
-        '-e', 'sll.src.eth','-e', 'ip.dst','-e', '_ws.col.protocol',
-        '-e', 'tcp.dstport','-e', 'udp.dstport','-e', 'frame.len',
-        '-E', 'header=y', '-E', 'separator=,', '-E', 'quote=d', '-E', 'occurrence=f',
-        '-Y', 'ip and (sll or eth)'
-    ]
-    try:
-        process = subprocess.run(tshark_cmd, capture_output=True, text=True, check=True, encoding='utf-8')
-        tshark_output = process.stdout
-        if not tshark_output or len(tshark_output.splitlines()) <= 1:
-             print(f"  Warning: No valid IP packet data extracted by tshark for {filename}. Skipping aggregation.")
-             continue
-    except Exception as e:
-        print(f"  ERROR running tshark on {filename}: {e}. Skipping file.")
-        continue
+    if AGGREGATE_FROM_STORE:
+        try:
+            accumulator = aggregate_day_from_store(file_date)
+        except Exception as e:
+            log(f"  ERROR reading feature store partition for {file_date}: {e}. Skipping day.")
+            return summary
+        if accumulator is None:
+            log(f"  Warning: Feature store partition for {file_date} holds no packets. Skipping aggregation.")
+            summary['status'] = 'empty'
+            return summary
+    else:
+        store_writer = None
+        if WRITE_FEATURE_STORE:
+            try:
+                store_writer = DayFeatureWriter(FEATURE_STORE_DIR, file_date, categorizer_key(ip_categorizer))
+            except Exception as e:
+                log(f"  Warning: Could not open feature store partition for {file_date} ({e}). Not storing packets.")
+        status, accumulator = ingest_pcap(pcap_file_to_analyze, filename, file_date, log, store_writer)
+        if store_writer is not None:
+            if status == 'failed': store_writer.abort() # Never leave a partial day in the store
+            else: store_writer.close()
+        if status != 'ok':
+            summary['status'] = status
+            return summary
+
+    # --- Save All Result Matrices for THIS DAY ---
+    if accumulator.packets_without_time:
+        log(f"  Warning: {accumulator.packets_without_time} packets of {filename} have no timestamp; they are in the daily matrices but in no time bin.")
+    log(f"  Saving matrices for date {file_date}...")
+    if not save_day_matrices(accumulator.result(), file_date, log, accumulator.result(per_bin=True) if TIME_BIN_MINUTES else None):
+        return summary
+    packets_aggregated_this_file = accumulator.packets_aggregated
 
-    # Parse tshark output
+    # --- End of Day Processing ---
+    file_duration = time.time() - start_time_file
+    log(f"  Finished processing {filename} in {file_duration:.2f}s. Aggregated {packets_aggregated_this_file} packet entries.")
+    summary.update(status='ok', packets=packets_aggregated_this_file, seconds=file_duration)
+    return summary
+
+if __name__ == "__main__":
+    # --- Load Metadata (Once Before Loop) ---
+    print(f"Loading metadata from {MAC_ADDRESS_FILE}...")
     try:
-        df = pd.read_csv(io.StringIO(tshark_output), low_memory=False)
-        df['sll.src.eth'] = df['sll.src.eth'].fillna('').astype(str).str.lower()
-        df['ip.dst'] = df['ip.dst'].fillna('').astype(str)
-        for port_col in ['tcp.dstport', 'udp.dstport']:
-             if port_col in df.columns: df[port_col] = pd.to_numeric(df[port_col], errors='coerce')
-             else: df[port_col] = np.nan
-        if 'frame.len' in df.columns: df['frame.len'] = pd.to_numeric(df['frame.len'], errors='coerce').fillna(0).astype(np.int64)
-        else: df['frame.len'] = 0
+        macs, mac_to_name = load_device_metadata()
+        init_device_metadata(macs)
+        print(f"Identified {num_iot_devices} IoT devices.")
     except Exception as e:
-        print(f"  ERROR parsing tshark output for {filename}: {e}. Skipping file.")
-        continue
-
-    # Aggregate Data into Matrices
-    packets_aggregated_this_file = 0
-    for _, row in df.iterrows():
-        src_mac = row['sll.src.eth']
-        dst_ip = row['ip.dst']
-        row_index = mac_to_row_index.get(src_mac)
-
-        if row_index is not None: # If source is a known IoT device
-            category = categorize_destination(dst_ip, GATEWAY_IP)
-            col_index = category_to_col_index.get(category)
-
-            if col_index is not None: # If destination category is one we track
-                protocol = str(row['_ws.col.protocol']).upper()
-                dst_port_tcp = row['tcp.dstport']
-                dst_port_udp = row['udp.dstport']
-                value_to_add_count = 1
-
-                # Aggregate into Overall Matrix
-                matrix_dict_count['aggregated_ip'][row_index, col_index] += value_to_add_count
-                packets_aggregated_this_file += 1
-
-                # Aggregate into Layer Matrices
-                is_tcp_tls = "TCP" in protocol or "TLS" in protocol
-                is_udp_quic = protocol == "UDP" or "QUIC" in protocol
-                is_dns = protocol == "DNS" or (dst_port_udp == 53.0) or (dst_port_tcp == 53.0)
-                is_discovery = protocol == "SSDP" or protocol == "MDNS" or protocol == "DHCP"
-
-                if category == "External" and is_tcp_tls:
-                    matrix_dict_count['external_tcp_tls'][row_index, col_index] += value_to_add_count
-                elif category == "External" and is_udp_quic:
-                    matrix_dict_count['external_udp_quic'][row_index, col_index] += value_to_add_count
-                elif (category == "Broadcast" or category == "Multicast") and is_discovery:
-                     matrix_dict_count['local_discovery'][row_index, col_index] += value_to_add_count
-                elif category == "Gateway" and is_dns:
-                     matrix_dict_count['gateway_dns'][row_index, col_index] += value_to_add_count
-                elif category == "Other Local IP" and protocol == "TCP":
-                     matrix_dict_count['other_local_tcp'][row_index, col_index] += value_to_add_count
-
-    # --- Save All Result Matrices for THIS DAY using Pandas ---
-    identifier_column_name = "MAC_Address"
-    csv_column_headers = destination_categories
-
-    print(f"  Saving matrices for date {file_date}...")
-    for layer_key, matrix_data in matrix_dict_count.items():
-        layer_output_dir = os.path.join(OUTPUT_BASE_DIR, f"layer_{layer_key}_{AGGREGATION_METRIC}")
-        # --- Removed os.makedirs --- assumes folder exists ---
-        output_filename = f"{file_date}.csv"
-        output_path = os.path.join(layer_output_dir, output_filename)
-
-        # Optional safety check before saving
-        if not os.path.isdir(layer_output_dir):
-             print(f"  ERROR: Output directory does not exist: {layer_output_dir}. Skipping save for layer {layer_key}.")
-             continue # Skip saving this layer if folder missing
-
+        print(f"FATAL ERROR loading metadata: {e}")
+        sys.exit(1)
+
+    # --- Find and Sort PCAP Files (or stored days when aggregating from the feature store) ---
+    pcap_files_info = []
+    if AGGREGATE_FROM_STORE:
+        print(f"\nScanning feature store {FEATURE_STORE_DIR}...")
+        for store_date in store_dates(FEATURE_STORE_DIR):
+            pcap_files_info.append({"path": partition_path(FEATURE_STORE_DIR, store_date), "date": store_date,
+                                    "filename": f"feature store {store_date}"})
+        if not pcap_files_info:
+            print(f"FATAL ERROR: No stored days found in {FEATURE_STORE_DIR}. Run once with WRITE_FEATURE_STORE = True.")
+            sys.exit(1)
+        print(f"Found {len(pcap_files_info)} stored days to aggregate.")
+    else:
+        print(f"\nScanning for pcap files in {PCAP_DIR}...")
         try:
-            df_to_save = pd.DataFrame(
-                matrix_data,
-                index=pd.Index(known_macs, name=identifier_column_name),
-                columns=csv_column_headers
-            )
-            df_to_save.to_csv(output_path, index=True, header=True)
+            potential_files = glob.glob(os.path.join(PCAP_DIR, "*.pcap")) + \
+                              glob.glob(os.path.join(PCAP_DIR, "*.pcapng"))
+            for filepath in potential_files:
+                filename = os.path.basename(filepath)
+                match = re.search(r'(\d{4}-\d{2}-\d{2})', filename)
+                if match:
+                    pcap_files_info.append({"path": filepath, "date": match.group(1), "filename": filename})
+                else: print(f"Warning: Could not parse date from filename: {filename}. Skipping.")
+            if not pcap_files_info: raise FileNotFoundError(f"No pcap files with parsable dates found in {PCAP_DIR}.")
+            pcap_files_info.sort(key=lambda x: x['date'])
+            print(f"Found {len(pcap_files_info)} pcap files to process.")
         except Exception as e:
-            print(f"  ERROR saving matrix {output_path} using pandas: {e}")
+            print(f"FATAL ERROR finding pcap files: {e}")
+            sys.exit(1)
 
-    # --- End of Day Processing ---
-    file_duration = time.time() - start_time_file
-    print(f"  Finished processing {filename} in {file_duration:.2f}s. Aggregated {packets_aggregated_this_file} packet entries.")
+    # --- Skip files before the start date ---
+    total_files = len(pcap_files_info)
+    files_to_process = [info for info in pcap_files_info if info['date'] >= START_PROCESSING_DATE]
+    skipped_count = total_files - len(files_to_process)
+
+    # --- Skip days that are already up to date (incremental build) ---
+    manifest = None
+    up_to_date_count = 0
+    if INCREMENTAL:
+        try:
+            manifest = BuildManifest(OUTPUT_BASE_DIR, processing_settings_hash(), hash_content=MANIFEST_HASH_CONTENT)
+            # With WRITE_FEATURE_STORE, days whose store partition is missing are parsed again as well
+            pending_files = [info for info in files_to_process
+                             if not manifest.is_up_to_date(info['path'])
+                             or (WRITE_FEATURE_STORE and not AGGREGATE_FROM_STORE
+                                 and not os.path.isfile(partition_path(FEATURE_STORE_DIR, info['date'])))]
+            up_to_date_count = len(files_to_process) - len(pending_files)
+            files_to_process = pending_files
+            print(f"Incremental build: {up_to_date_count} days up to date, {len(files_to_process)} new or changed.")
+        except Exception as e:
+            print(f"Warning: Could not use build manifest ({e}). Processing all files.")
+            manifest = None
 
-# --- End Main Processing Loop ---
-total_duration = time.time() - start_time_total
-print(f"\n--- Completed processing. Skipped {skipped_count} files before {START_PROCESSING_DATE}. Processed {processed_count} files in {total_duration:.2f}s ---")
\ No newline at end of file
+    # --- Create output directories of newly enabled metrics / time bins (e.g. layer_<key>_bytes) ---
+    for dir_name in output_dir_names() + [COMPLETED_DAYS_DIR_NAME]:
+        layer_output_dir = os.path.join(OUTPUT_BASE_DIR, dir_name)
+        if not os.path.isdir(layer_output_dir):
+            os.makedirs(layer_output_dir)
+            print(f"Created output directory {layer_output_dir}")
+
+    # --- Main Processing Loop ---
+    start_time_total = time.time()
+    print(f"\n--- Starting processing loop for {total_files} files, beginning from date {START_PROCESSING_DATE} "
+          f"({len(files_to_process)} to process, {NUM_WORKERS} worker(s)) ---")
+
+    day_summaries = []
+    if NUM_WORKERS > 1:
+        with ProcessPoolExecutor(max_workers=NUM_WORKERS, initializer=init_device_metadata, initargs=(known_macs,)) as executor:
+            # map() yields in submission (date) order, so progress prints stay ordered
+            day_results = executor.map(process_day, files_to_process)
+            for processed_count, summary in enumerate(day_results, start=1):
+                print(f"\n[{processed_count}/{len(files_to_process)}] {summary['filename']} (Date: {summary['date']})")
+                for line in summary['log']: print(line)
+                day_summaries.append(summary)
+    else:
+        for processed_count, file_info in enumerate(files_to_process, start=1):
+            print(f"\nProcessing file {skipped_count + processed_count}/{total_files} (Actual Processed: {processed_count}): {file_info['filename']} (Date: {file_info['date']})")
+            summary = process_day(file_info)
+            for line in summary['log']: print(line)
+            day_summaries.append(summary)
+
+    # --- Update Build Manifest and Flag Dependent Tensors ---
+    if manifest is not None:
+        for summary, file_info in zip(day_summaries, files_to_process):
+            if summary['status'] == 'ok':
+                manifest.record(file_info['path'], file_info['date'],
+                                [*day_output_paths(file_info['date']).values(), day_marker_path(file_info['date'])])
+            elif summary['status'] == 'empty':
+                manifest.record(file_info['path'], file_info['date'], [])
+        manifest.save()
+    changed_dates = [summary['date'] for summary in day_summaries if summary['status'] == 'ok']
+    if changed_dates:
+        mark_tensors_stale(TENSOR_DIR, output_dir_names(), changed_dates)
+        print(f"\nFlagged tensors of {len(layer_keys)} layers x {len(AGGREGATION_METRICS)} metrics as stale in {TENSOR_DIR} (rerun build_tensors.py).")
+
+    # --- End Main Processing Loop ---
+    total_duration = time.time() - start_time_total
+    processed_count = len(day_summaries)
+    ok_days = [summary for summary in day_summaries if summary['status'] == 'ok']
+    failed_days = [summary['date'] for summary in day_summaries if summary['status'] == 'failed']
+    empty_days = [summary['date'] for summary in day_summaries if summary['status'] == 'empty']
+    print(f"\n--- Completed processing. Skipped {skipped_count} files before {START_PROCESSING_DATE}. Processed {processed_count} files in {total_duration:.2f}s ---")
+    if up_to_date_count: print(f"  Up to date (not reprocessed): {up_to_date_count} days")
+    print(f"  Saved: {len(ok_days)} days, {sum(summary['packets'] for summary in ok_days)} packet entries aggregated")
+    if empty_days: print(f"  No IP data: {', '.join(empty_days)}")
+    if failed_days: print(f"  FAILED: {', '.join(failed_days)}")
@@ -2,11 +2,12 @@ import os
 import subprocess
 import pandas as pd
 import numpy as np
-from collections import Counter, defaultdict
 import io
 import ipaddress # To help check IP ranges
 import sys # To exit gracefully on error
 import re # For filename date parsing
+from layer_aggregation import DESTINATION_CATEGORIES, LayerMetricAccumulator
+from ip_categorizer import DestinationCategorizer
 
 # --- Configuration ---
 # Using raw strings for Windows paths
@@ -28,38 +29,12 @@ GATEWAY_IP = "192.168.1.1" # <--- VERIFY OR ADJUST
 if not GATEWAY_IP:
     print("Warning: GATEWAY_IP is not set. Categorization will be less accurate.")
 
-# Aggregation metric
-AGGREGATION_METRIC = 'count' # Change to 'bytes' and uncomment relevant code if needed
+# Aggregation metrics, computed in one pass: 'count', 'bytes' (sum of frame.len), 'distinct_dst'
+AGGREGATION_METRICS = ['count', 'bytes']
 
-# --- Helper Function: Categorize Destination IP ---
-def categorize_destination(ip_str, gateway_ip_str):
-    """Categorizes an IP address string."""
-    # Categories: Gateway, External, Other Local IP, Broadcast, Multicast, Other/Unknown
-    if not isinstance(ip_str, str) or not ip_str:
-        return "Non-IP/Invalid"
-    try:
-        ip_addr = ipaddress.ip_address(ip_str)
-
-        if gateway_ip_str and ip_str == gateway_ip_str: return "Gateway"
-        if ip_str == BROADCAST_IP_STR: return "Broadcast"
-        # Check common local broadcast
-        if ip_str.endswith('.255') and any(ip_addr in net for net in LOCAL_NETWORKS): return "Broadcast"
-        if ip_addr.is_multicast: return "Multicast"
-        if ip_addr.is_loopback: return "Loopback"
-        if ip_addr.is_link_local: return "Link-Local"
-        if ip_addr.is_unspecified: return "Unspecified"
-
-        for network in LOCAL_NETWORKS:
-            if ip_addr in network:
-                return "Other Local IP"
-
-        if ip_addr.is_global:
-            return "External"
-        else:
-            return "Other/Unknown IP"
-
-    except ValueError:
-        return "Non-IP/Invalid"
+# --- Destination IP Categorizer ---
+# Classifies each distinct destination IP once and caches it for the whole run (see ip_categorizer.py)
+ip_categorizer = DestinationCategorizer(GATEWAY_IP, LOCAL_NETWORKS, DESTINATION_CATEGORIES, broadcast_ip=BROADCAST_IP_STR)
 
 # --- Load Metadata ---
 print(f"Loading metadata from {MAC_ADDRESS_FILE}...")
@@ -81,30 +56,21 @@ except Exception as e:
     sys.exit(1)
 
 # --- Define Output Matrix Structure ---
-destination_categories = ["Gateway", "External", "Other Local IP", "Broadcast", "Multicast"]
+destination_categories = DESTINATION_CATEGORIES
 category_to_col_index = {category: i for i, category in enumerate(destination_categories)}
 num_categories = len(destination_categories)
 
-# --- Initialize Output Matrices ---
-# Using dictionaries to hold matrices for different layers
-matrix_dict_count = {}
-# matrix_dict_bytes = {} # Uncomment if calculating bytes
-
-# Initialize Aggregated Matrix
-matrix_dict_count['aggregated_ip'] = np.zeros((num_iot_devices, num_categories), dtype=np.int64)
-# matrix_dict_bytes['aggregated_ip'] = np.zeros((num_iot_devices, num_categories), dtype=np.int64) # For bytes
-
-# Initialize Layer Matrices (add more or modify as needed)
-layer_keys = [
-    'external_tcp_tls',
-    'external_udp_quic',
-    'local_discovery',
-    'gateway_dns',
-    'other_local_tcp'
-]
-for key in layer_keys:
-    matrix_dict_count[key] = np.zeros((num_iot_devices, num_categories), dtype=np.int64)
-    # matrix_dict_bytes[key] = np.zeros((num_iot_devices, num_categories), dtype=np.int64)
+# --- Layer Protocol Rules ---
+# This script's original rules are stricter than parsing_all_new.py's (exact TCP / UDP / (G)QUIC names)
+def layer_protocol_flags(protocol):
+    """Layer protocol predicates for one upper-cased protocol name."""
+    return {
+        'tcp_tls': protocol == "TCP" or "TLS" in protocol,      # Layer 1: External TCP/TLS
+        'udp_quic': protocol == "UDP" or protocol == "GQUIC" or protocol == "QUIC", # Layer 2: External UDP/QUIC
+        'discovery': protocol == "SSDP" or protocol == "MDNS" or protocol == "DHCP", # Layer 3: Local Discovery (DHCP might go to gateway too)
+        'dns': protocol == "DNS",                                # Layer 4: Gateway DNS (port 53 also counts)
+        'tcp': protocol == "TCP",                                # Layer 5: TCP to Other Local IP
+    }
 
 # --- Run tshark ---
 print(f"\nRunning tshark on {os.path.basename(PCAP_FILE_TO_ANALYZE)}...")
@@ -169,61 +135,13 @@ except Exception as e:
     sys.exit(1)
 
 # --- Aggregate Data into Matrices ---
+# Columnar aggregation: every layer matrix of a metric is filled in one scatter (see layer_aggregation.py)
+# Bytes use frame.len as the scatter weight instead of 1 per packet
 print("\nAggregating data into matrices...")
-packets_aggregated_total = 0
-for _, row in df.iterrows():
-    src_mac = row['sll.src.eth']
-    dst_ip = row['ip.dst']
-
-    # Check if source is a known IoT device
-    row_index = mac_to_row_index.get(src_mac)
-    if row_index is not None:
-        # Categorize the destination IP
-        category = categorize_destination(dst_ip, GATEWAY_IP)
-        col_index = category_to_col_index.get(category) # Get index 0-4 or None
-
-        # Only proceed if destination category is one we track
-        if col_index is not None:
-            protocol = str(row['_ws.col.protocol']).upper()
-            dst_port_tcp = row['tcp.dstport'] # Already numeric or NaN
-            dst_port_udp = row['udp.dstport'] # Already numeric or NaN
-            frame_len = row['frame.len']
-            value_to_add_count = 1
-            value_to_add_bytes = frame_len # Use pre-processed frame_len
-
-            # --- Aggregate into Overall Matrix ---
-            matrix_dict_count['aggregated_ip'][row_index, col_index] += value_to_add_count
-            # matrix_dict_bytes['aggregated_ip'][row_index, col_index] += value_to_add_bytes # Uncomment for bytes
-            packets_aggregated_total += 1 # Count packets added to *any* matrix
-
-            # --- Aggregate into Layer Matrices ---
-            # Layer 1: External TCP/TLS
-            if category == "External" and (protocol == "TCP" or "TLS" in protocol):
-                matrix_dict_count['external_tcp_tls'][row_index, col_index] += value_to_add_count
-                # matrix_dict_bytes['external_tcp_tls'][row_index, col_index] += value_to_add_bytes
-
-            # Layer 2: External UDP/QUIC
-            elif category == "External" and (protocol == "UDP" or protocol == "GQUIC" or protocol == "QUIC"):
-                matrix_dict_count['external_udp_quic'][row_index, col_index] += value_to_add_count
-                # matrix_dict_bytes['external_udp_quic'][row_index, col_index] += value_to_add_bytes
-
-            # Layer 3: Local Discovery (SSDP/MDNS/DHCP -> Bcast/Mcast)
-            # Note: DHCP might go to gateway too, adjust if needed
-            elif (category == "Broadcast" or category == "Multicast") and \
-                 (protocol == "SSDP" or protocol == "MDNS" or protocol == "DHCP"):
-                 # Destination column might be Broadcast or Multicast for this layer
-                 matrix_dict_count['local_discovery'][row_index, col_index] += value_to_add_count
-                 # matrix_dict_bytes['local_discovery'][row_index, col_index] += value_to_add_bytes
-
-            # Layer 4: Gateway Interaction (DNS to Gateway IP)
-            elif category == "Gateway" and (protocol == "DNS" or dst_port_udp == 53 or dst_port_tcp == 53):
-                 matrix_dict_count['gateway_dns'][row_index, col_index] += value_to_add_count
-                 # matrix_dict_bytes['gateway_dns'][row_index, col_index] += value_to_add_bytes
-
-            # Layer 5: Specific Local Interaction (TCP to Other Local IP)
-            elif category == "Other Local IP" and protocol == "TCP":
-                 matrix_dict_count['other_local_tcp'][row_index, col_index] += value_to_add_count
-                 # matrix_dict_bytes['other_local_tcp'][row_index, col_index] += value_to_add_bytes
+dest_col_codes = ip_categorizer.column_codes(df['ip.dst'])
+accumulator = LayerMetricAccumulator(num_iot_devices, AGGREGATION_METRICS, protocol_flags=layer_protocol_flags)
+packets_aggregated_total = accumulator.add(df, mac_to_row_index, dest_col_codes)
+metric_matrices = accumulator.result()
 
 print(f"Finished aggregation. Processed {packets_aggregated_total} relevant packet entries.")
 
@@ -245,9 +163,11 @@ if 'known_macs' not in locals() or len(known_macs) != num_iot_devices:
 
 # --- CHANGE: Loop and save using Pandas ---
 print("\nSaving matrices using Pandas...")
-for layer_key, matrix_data in matrix_dict_count.items():
+layer_matrices = [(metric, layer_key, matrix_data) for metric, matrix_dict in metric_matrices.items()
+                  for layer_key, matrix_data in matrix_dict.items()]
+for metric, layer_key, matrix_data in layer_matrices:
     # Create specific output directory for this layer/metric
-    layer_output_dir = os.path.join(OUTPUT_BASE_DIR, f"layer_{layer_key}_{AGGREGATION_METRIC}")
+    layer_output_dir = os.path.join(OUTPUT_BASE_DIR, f"layer_{layer_key}_{metric}")
     os.makedirs(layer_output_dir, exist_ok=True)
 
     output_filename = f"{file_date}.csv" # Simple date filename within layer folder
@@ -0,0 +1,255 @@
+import ipaddress
+import mmap
+import struct
+import numpy as np
+import pandas as pd
+
+# --- Native pcap Fast Path ---
+# Reads classic libpcap files without tshark or scapy: the file is memory-mapped, record headers
+# are walked once, and only the fields the layer aggregation needs are decoded in bulk with NumPy
+# (link-layer source MAC, IPv4/IPv6 destination, L4 protocol and ports, frame length, timestamp).
+# The result uses the tshark column names, so it feeds aggregate_layers() unchanged.
+#
+# _ws.col.protocol is approximated from the IP protocol and well-known ports (DNS, MDNS, SSDP,
+# DHCP, QUIC, TLS, HTTP, NTP, ...); tshark's dissectors can label some packets differently,
+# so totals per layer are close to, but not guaranteed identical with, the tshark path.
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+# Magic number -> (struct byte order, timestamp fraction unit in seconds)
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6), b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9), b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+PCAPNG_MAGIC = b'\x0a\x0d\x0d\x0a'
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = 0x8100
+IPPROTO_ICMP, IPPROTO_IGMP, IPPROTO_TCP, IPPROTO_UDP, IPPROTO_ICMPV6 = 1, 2, 6, 17, 58
+
+DEFAULT_CHUNK_PACKETS = 1_000_000
+
+# Protocol labels in the style of tshark's _ws.col.protocol
+PROTOCOL_LABELS = ["TCP", "TLSv1.2", "HTTP", "DNS", "UDP", "MDNS", "SSDP", "DHCP", "QUIC", "NTP",
+                   "ICMP", "IGMPv2", "ICMPv6", "IPv4", "IPv6"]
+_LABEL = {label: i for i, label in enumerate(PROTOCOL_LABELS)}
+UDP_PORT_LABELS = [(53, "DNS"), (5353, "MDNS"), (1900, "SSDP"), (67, "DHCP"), (68, "DHCP"), (443, "QUIC"), (123, "NTP")]
+TCP_PORT_LABELS = [(53, "DNS"), (443, "TLSv1.2"), (8443, "TLSv1.2"), (8883, "TLSv1.2"), (80, "HTTP"), (8080, "HTTP")]
+
+
+# --- Bulk Field Gathers (network byte order) ---
+def _gather(buf, index, width, valid):
+    """Big-endian unsigned integer of `width` bytes at buf[index] (0 where not valid)."""
+    safe_index = np.where(valid, index, 0)
+    value = np.zeros(len(index), dtype=np.uint64)
+    for i in range(width):
+        value = (value << np.uint64(8)) | buf[safe_index + i].astype(np.uint64)
+    return np.where(valid, value, 0)
+
+
+def _format_macs(mac_values):
+    """Categorical of colon-separated lower-case MAC strings from packed 48-bit integers."""
+    uniques, codes = np.unique(mac_values, return_inverse=True)
+    labels = [':'.join(f"{b:02x}" for b in int(mac).to_bytes(6, 'big')) for mac in uniques]
+    return pd.Categorical.from_codes(codes.reshape(-1), categories=labels)
+
+
+def _format_ipv4(packed):
+    uniques, codes = np.unique(packed, return_inverse=True)
+    return [str(ipaddress.IPv4Address(int(ip))) for ip in uniques], codes.reshape(-1)
+
+
+def _format_ipv6(address_bytes):
+    uniques, codes = np.unique(address_bytes, axis=0, return_inverse=True)
+    return [str(ipaddress.IPv6Address(bytes(row))) for row in uniques], codes.reshape(-1)
+
+
+def _protocol_codes(ip_proto, src_port, dst_port, has_ports, tcp_payload, is_ipv6):
+    """Label index into PROTOCOL_LABELS per packet, approximating tshark's dissector naming."""
+    is_tcp = (ip_proto == IPPROTO_TCP) & has_ports
+    is_udp = (ip_proto == IPPROTO_UDP) & has_ports
+    conditions, choices = [], []
+    for port, label in UDP_PORT_LABELS: # Destination port takes precedence over source port
+        conditions.append(is_udp & (dst_port == port)); choices.append(_LABEL[label])
+    for port, label in UDP_PORT_LABELS:
+        conditions.append(is_udp & (src_port == port)); choices.append(_LABEL[label])
+    for port, label in TCP_PORT_LABELS:
+        needs_payload = label != "DNS"
+        matches = (dst_port == port) | (src_port == port)
+        conditions.append(is_tcp & matches & ((tcp_payload > 0) | (not needs_payload))); choices.append(_LABEL[label])
+    conditions += [is_tcp, is_udp, ip_proto == IPPROTO_ICMP, ip_proto == IPPROTO_IGMP, ip_proto == IPPROTO_ICMPV6, is_ipv6]
+    choices += [_LABEL["TCP"], _LABEL["UDP"], _LABEL["ICMP"], _LABEL["IGMPv2"], _LABEL["ICMPv6"], _LABEL["IPv6"]]
+    return np.select(conditions, choices, default=_LABEL["IPv4"])
+
+
+class PcapReader:
+    """Memory-mapped reader for classic .pcap files (Linux cooked SLL/SLL2 or Ethernet link types)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty file cannot be mapped
+            self._file.close()
+            raise ValueError(f"Empty capture file: {path}")
+        magic = self._mm[:4]
+        if magic == PCAPNG_MAGIC:
+            self.close()
+            raise ValueError(f"pcapng is not supported by the native reader (use tshark ingest): {path}")
+        if magic not in PCAP_MAGIC or len(self._mm) < 24:
+            self.close()
+            raise ValueError(f"Not a pcap file: {path}")
+        self.endian, self.ts_unit = PCAP_MAGIC[magic]
+        self.linktype = struct.unpack_from(self.endian + 'I', self._mm, 20)[0] & 0x0FFFFFFF
+        if self.linktype not in (LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_LINUX_SLL2):
+            self.close()
+            raise ValueError(f"Unsupported link type {self.linktype} in {path}")
+        self._buf = np.frombuffer(self._mm, dtype=np.uint8)
+
+    def close(self):
+        self._buf = None
+        if getattr(self, '_mm', None) is not None and not self._mm.closed:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _record_offsets(self, start, max_records):
+        """Walks record headers from `start`; returns (header offsets, next start). Stops at a truncated record."""
+        incl_len_at = struct.Struct(self.endian + 'I').unpack_from
+        mm, size = self._mm, len(self._mm)
+        offsets = []
+        pos = start
+        while len(offsets) < max_records and pos + 16 <= size:
+            incl_len = incl_len_at(mm, pos + 8)[0]
+            if pos + 16 + incl_len > size:
+                break
+            offsets.append(pos)
+            pos += 16 + incl_len
+        return np.array(offsets, dtype=np.int64), pos
+
+    def _header_fields(self, offsets):
+        """(ts_sec, ts_frac, incl_len, orig_len) arrays for the given record header offsets."""
+        dtype = np.dtype(self.endian + 'u4')
+        words = self._buf[offsets[:, None] + np.arange(16)].copy().view(dtype)
+        return words[:, 0], words[:, 1], words[:, 2].astype(np.int64), words[:, 3].astype(np.int64)
+
+    def decode(self, offsets, include_ipv6=False):
+        """DataFrame (tshark column names) of the IP packets among the records at `offsets`."""
+        buf = self._buf
+        if len(offsets) == 0:
+            return _empty_frame()
+        ts_sec, ts_frac, incl_len, orig_len = self._header_fields(offsets)
+        data = offsets + 16
+        always = np.ones(len(offsets), dtype=bool)
+
+        # --- Link layer ---
+        if self.linktype == LINKTYPE_LINUX_SLL:
+            link_ok = incl_len >= 16
+            src_mac = _gather(buf, data + 6, 6, link_ok)
+            ethertype = _gather(buf, data + 14, 2, link_ok)
+            l3 = data + 16
+        elif self.linktype == LINKTYPE_LINUX_SLL2:
+            link_ok = incl_len >= 20
+            src_mac = _gather(buf, data + 12, 6, link_ok)
+            ethertype = _gather(buf, data, 2, link_ok)
+            l3 = data + 20
+        else:
+            link_ok = incl_len >= 14
+            src_mac = _gather(buf, data + 6, 6, link_ok)
+            ethertype = _gather(buf, data + 12, 2, link_ok)
+            is_vlan = (ethertype == ETHERTYPE_VLAN) & (incl_len >= 18)
+            ethertype = np.where(is_vlan, _gather(buf, data + 16, 2, is_vlan), ethertype)
+            l3 = np.where(is_vlan, data + 18, data + 14)
+        l3_len = incl_len - (l3 - data)
+
+        version = np.where(l3_len >= 1, buf[np.where(l3_len >= 1, l3, 0)] >> 4, 0)
+        is_ipv4 = link_ok & (ethertype == ETHERTYPE_IPV4) & (l3_len >= 20) & (version == 4)
+        is_ipv6 = link_ok & (ethertype == ETHERTYPE_IPV6) & (l3_len >= 40) & (version == 6) & include_ipv6
+        keep = is_ipv4 | is_ipv6
+        (ts_sec, ts_frac, incl_len, orig_len, data, src_mac, l3, l3_len, is_ipv4, is_ipv6) = (
+            a[keep] for a in (ts_sec, ts_frac, incl_len, orig_len, data, src_mac, l3, l3_len, is_ipv4, is_ipv6))
+        if len(l3) == 0:
+            return _empty_frame()
+        always = always[:len(l3)]
+
+        # --- Network layer ---
+        ihl = (buf[l3] & 0x0F).astype(np.int64) * 4
+        ip_proto = np.where(is_ipv4, buf[l3 + 9], buf[np.where(is_ipv6, l3 + 6, l3)]).astype(np.int64)
+        ip_total_len = np.where(is_ipv4, _gather(buf, l3 + 2, 2, always), _gather(buf, l3 + 4, 2, always) + 40).astype(np.int64)
+        fragment_offset = np.where(is_ipv4, _gather(buf, l3 + 6, 2, always) & 0x1FFF, 0)
+        l4 = np.where(is_ipv4, l3 + ihl, l3 + 40)
+        l4_avail = l3_len - (l4 - l3)
+
+        # --- Transport layer ---
+        has_ports = (fragment_offset == 0) & (l4_avail >= 4) & ((ip_proto == IPPROTO_TCP) | (ip_proto == IPPROTO_UDP))
+        src_port = _gather(buf, l4, 2, has_ports).astype(np.int64)
+        dst_port = _gather(buf, l4 + 2, 2, has_ports).astype(np.int64)
+        has_tcp_header = has_ports & (ip_proto == IPPROTO_TCP) & (l4_avail >= 13)
+        tcp_header_len = np.where(has_tcp_header, buf[np.where(has_tcp_header, l4 + 12, 0)] >> 4, 0).astype(np.int64) * 4
+        tcp_payload = np.where(has_tcp_header, ip_total_len - (l4 - l3) - tcp_header_len, 0)
+
+        # --- Destination addresses (formatted once per distinct address) ---
+        ipv4_labels, ipv4_codes = _format_ipv4(_gather(buf, l3 + 16, 4, is_ipv4)[is_ipv4])
+        ip_codes = np.zeros(len(l3), dtype=np.int64)
+        ip_codes[is_ipv4] = ipv4_codes
+        ip_labels = ipv4_labels
+        if is_ipv6.any():
+            ipv6_bytes = buf[l3[is_ipv6][:, None] + 24 + np.arange(16)]
+            ipv6_labels, ipv6_codes = _format_ipv6(ipv6_bytes)
+            ip_codes[is_ipv6] = ipv6_codes + len(ipv4_labels)
+            ip_labels = ipv4_labels + ipv6_labels
+
+        protocol = _protocol_codes(ip_proto, src_port, dst_port, has_ports, tcp_payload, is_ipv6)
+        is_tcp = has_ports & (ip_proto == IPPROTO_TCP)
+        is_udp = has_ports & (ip_proto == IPPROTO_UDP)
+        return pd.DataFrame({
+            'sll.src.eth': _format_macs(src_mac),
+            'ip.dst': pd.Categorical.from_codes(ip_codes, categories=ip_labels),
+            '_ws.col.protocol': pd.Categorical.from_codes(protocol, categories=PROTOCOL_LABELS),
+            'tcp.dstport': np.where(is_tcp, dst_port, np.nan),
+            'udp.dstport': np.where(is_udp, dst_port, np.nan),
+            'frame.len': orig_len,
+            'frame.time_epoch': ts_sec.astype(np.float64) + ts_frac.astype(np.float64) * self.ts_unit,
+        })
+
+    def iter_chunks(self, chunk_packets=DEFAULT_CHUNK_PACKETS, include_ipv6=False):
+        """Yields decoded DataFrames covering at most chunk_packets capture records each."""
+        pos = 24
+        while True:
+            offsets, pos = self._record_offsets(pos, chunk_packets)
+            if len(offsets) == 0:
+                break
+            yield self.decode(offsets, include_ipv6)
+
+
+def _empty_frame():
+    return pd.DataFrame({
+        'sll.src.eth': pd.Categorical([]), 'ip.dst': pd.Categorical([]), '_ws.col.protocol': pd.Categorical([]),
+        'tcp.dstport': np.zeros(0), 'udp.dstport': np.zeros(0),
+        'frame.len': np.zeros(0, dtype=np.int64), 'frame.time_epoch': np.zeros(0),
+    })
+
+
+def iter_pcap_chunks(pcap_path, chunk_packets=DEFAULT_CHUNK_PACKETS, include_ipv6=False):
+    """Yields IP-packet DataFrames from a pcap file, chunk_packets records at a time."""
+    with PcapReader(pcap_path) as reader:
+        for chunk in reader.iter_chunks(chunk_packets, include_ipv6):
+            if len(chunk):
+                yield chunk
+
+
+def read_pcap(pcap_path, include_ipv6=False):
+    """All IP packets of a pcap file as one DataFrame."""
+    chunks = list(iter_pcap_chunks(pcap_path, include_ipv6=include_ipv6))
+    if not chunks:
+        return _empty_frame()
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
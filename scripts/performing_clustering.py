@@ -1,9 +1,12 @@
 import os
 import numpy as np
 import tensorly as tl
-from tensorly.decomposition import non_negative_parafac
 import sys
 import time
+from sparse_tensor import load_dense_tensor, load_sparse_tensor
+from multi_start import run_multi_start, trajectories_frame
+from cp_backends import SPARSE_SOLVERS, use_sparse_tensor
+from cp_utils import relative_error
 
 # --- Configuration ---
 TENSOR_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\tensors"
@@ -11,117 +14,145 @@ FACTOR_OUTPUT_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\outp
 
 # --- CHOOSE THE LAYER AND ITS RANK ---
 # Example: Process the aggregated layer with Rank 5
-TENSOR_FILENAME = "local_tcp_count_tensor.npy"
+AGGREGATION_METRIC = 'count' # 'count', 'bytes' or 'distinct_dst' tensor built by load_tensor.py
+TENSOR_FILENAME = f"local_tcp_{AGGREGATION_METRIC}_tensor.npy"
 CHOSEN_RANK = 2 # Set this based on your rank estimation analysis for this tensor
-LAYER_NAME = "local_tcp_count" # Used for output filenames
+LAYER_NAME = f"local_tcp_{AGGREGATION_METRIC}" # Used for output filenames
 # --- END CHOOSE ---
 
 
 # --- CPD Parameters for Final Decomposition ---
 # Use settings that aim for good convergence
+CPD_SOLVER = 'mu'          # cp_backends.py: 'mu', 'hals', 'hals_numpy', 'admm' or Poisson 'cp_apr' (see benchmark_cp_solvers.py, benchmark_cp_apr.py)
 CPD_INIT = 'random'        # Random initialization is standard
 CPD_TOL = 1e-8             # Use a stricter tolerance for final run
 CPD_N_ITER_MAX = 500       # Allow more iterations for convergence
 CPD_RANDOM_STATE = 42      # Use a fixed state for reproducibility of this specific run
 NUM_RUNS_FOR_BEST = 5      # Optional: Run multiple times and keep best fit
 
-# --- Construct Paths ---
-tensor_path = os.path.join(TENSOR_DIR, TENSOR_FILENAME)
-os.makedirs(FACTOR_OUTPUT_DIR, exist_ok=True)
-
-# --- Load the Tensor ---
-print(f"Loading tensor: {tensor_path}")
-try:
-    tensor = np.load(tensor_path)
-    # Ensure tensor is float for decomposition algorithms
-    tensor = tl.tensor(tensor, dtype=tl.float64)
-    print(f"Tensor loaded successfully. Shape: {tensor.shape}")
-    N, M, T = tensor.shape # Get dimensions N=devices, M=categories, T=time
-except FileNotFoundError:
-    print(f"FATAL ERROR: Tensor file not found at {tensor_path}")
-    sys.exit(1)
-except Exception as e:
-    print(f"FATAL ERROR loading tensor: {e}")
-    sys.exit(1)
-
-# --- Perform Non-Negative CPD ---
-print(f"\nPerforming Non-Negative CPD with Rank R={CHOSEN_RANK}...")
-print(f"  Max iterations: {CPD_N_ITER_MAX}, Tolerance: {CPD_TOL}")
-
-best_error = float('inf')
-best_weights = None
-best_factors = None
-start_time_cpd = time.time()
-
-# Optional: Run multiple initializations and keep the best result
-print(f"  Running {NUM_RUNS_FOR_BEST} initializations to find best fit...")
-for run in range(NUM_RUNS_FOR_BEST):
-    current_start_time = time.time()
-    print(f"    Starting run {run+1}/{NUM_RUNS_FOR_BEST} (random_state={CPD_RANDOM_STATE + run})...")
+# --- Parallel Multi-Start (see multi_start.py) ---
+NUM_WORKERS = min(NUM_RUNS_FOR_BEST, os.cpu_count() or 1) # Starts run in parallel; 1 runs them one after another here
+EARLY_ABANDON = True       # Stop starts that cannot catch up with the best one
+WARMUP_ITERS = 100         # Iterations every start gets before it can be abandoned
+CHECKPOINT_ITERS = 25      # Starts advance in rounds of this many iterations, after which their errors are compared
+ABANDON_MARGIN = 0.01      # Abandon when even the extrapolated final error is more than 1% above the best error so far
+
+# --- Sparse Decomposition ---
+# True: decompose the COO tensor (<name>_tensor.npz from load_tensor.py, or built from the .npy) with the
+# sparse MTTKRP solver in sparse_tensor.py; False: dense tensorly. Only the cp_backends.SPARSE_SOLVERS take a
+# sparse tensor: for those, 'auto' goes sparse when a .npz exists or the tensor is below SPARSE_DENSITY_THRESHOLD
+# (and always for CPD_SOLVER = 'cp_apr', which only reads the nonzeros); other solvers always get the dense
+# tensor. Both give the same factors for the same random_state.
+USE_SPARSE_TENSOR = 'auto'
+SPARSE_DENSITY_THRESHOLD = 0.1
+
+# --- Run ---
+if __name__ == "__main__": # Guard needed: the multi-start worker processes re-import this module on Windows
+    # --- Construct Paths ---
+    tensor_path = os.path.join(TENSOR_DIR, TENSOR_FILENAME)
+    os.makedirs(FACTOR_OUTPUT_DIR, exist_ok=True)
+
+    if USE_SPARSE_TENSOR is True and CPD_SOLVER not in SPARSE_SOLVERS:
+        print(f"FATAL ERROR: USE_SPARSE_TENSOR = True needs a sparse solver ({', '.join(SPARSE_SOLVERS)}), not CPD_SOLVER = '{CPD_SOLVER}'")
+        sys.exit(1)
+
+    # --- Load the Tensor ---
+    print(f"Loading tensor: {tensor_path}")
     try:
-        weights, factors = non_negative_parafac(
+        use_sparse = use_sparse_tensor(tensor_path, CPD_SOLVER, USE_SPARSE_TENSOR, SPARSE_DENSITY_THRESHOLD)
+        if use_sparse:
+            tensor = load_sparse_tensor(tensor_path).astype(np.float64)
+            print(f"Sparse tensor loaded successfully. Shape: {tensor.shape}, {tensor.nnz} nonzeros (density {tensor.density:.4f})")
+        else:
+            tensor = load_dense_tensor(tensor_path) # Memory-mapped .store or .npy (see tensor_store.py), else the densified .npz
+            # Ensure tensor is float for decomposition algorithms
+            tensor = tl.tensor(tensor, dtype=tl.float64)
+            print(f"Tensor loaded successfully. Shape: {tensor.shape}")
+        N, M, T = tensor.shape # Get dimensions N=devices, M=categories, T=time
+    except FileNotFoundError:
+        print(f"FATAL ERROR: Tensor file not found at {tensor_path}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"FATAL ERROR loading tensor: {e}")
+        sys.exit(1)
+
+    # --- Perform Non-Negative CPD ---
+    print(f"\nPerforming Non-Negative CPD with Rank R={CHOSEN_RANK}...")
+    print(f"  Max iterations: {CPD_N_ITER_MAX}, Tolerance: {CPD_TOL}, Solver: {CPD_SOLVER} ({'sparse' if use_sparse else 'dense'} tensor)")
+    start_time_cpd = time.time()
+
+    # Run multiple initializations in parallel and keep the best result
+    seeds = [CPD_RANDOM_STATE + run for run in range(NUM_RUNS_FOR_BEST)] # Vary seed for each run
+    print(f"  Running {NUM_RUNS_FOR_BEST} initializations on {NUM_WORKERS} worker(s) to find best fit"
+          f"{f' (abandoning poor runs after {WARMUP_ITERS} iterations)' if EARLY_ABANDON else ''}...")
+    try:
+        best_weights, best_factors, best_error, runs, trajectories = run_multi_start(
             tensor,
             rank=CHOSEN_RANK,
-            init=CPD_INIT,
+            seeds=seeds,
             n_iter_max=CPD_N_ITER_MAX,
             tol=CPD_TOL,
-            random_state=CPD_RANDOM_STATE + run, # Vary seed for each run
-            verbose=False # Set to True or 1 to see convergence details per run
+            init=CPD_INIT,
+            num_workers=NUM_WORKERS,
+            checkpoint_iters=CHECKPOINT_ITERS,
+            warmup_iters=WARMUP_ITERS,
+            abandon_margin=ABANDON_MARGIN,
+            early_abandon=EARLY_ABANDON,
+            solver=CPD_SOLVER
         )
+    except Exception as e:
+        print(f"FATAL ERROR during CPD runs: {e}")
+        sys.exit(1)
+
+    cpd_duration = time.time() - start_time_cpd
 
-        # Calculate reconstruction error for this run
-        tensor_reconstructed = tl.cp_to_tensor((weights, factors))
-        error = tl.norm(tensor - tensor_reconstructed) / tl.norm(tensor)
-        run_duration = time.time() - current_start_time
-        print(f"    Run {run+1} finished in {run_duration:.2f}s. Reconstruction Error: {error:.6f}")
+    if best_factors is None:
+         print(f"\nFATAL ERROR: CPD Decomposition failed for all runs.")
+         sys.exit(1)
+    best_error = relative_error(tensor, best_weights, best_factors) # Of the saved factors (see cp_utils.py)
 
-        # Check if this run is better than the best found so far
-        if error < best_error:
-            print(f"    *** Found new best fit ***")
-            best_error = error
-            best_weights = weights
-            best_factors = factors
+    print(f"\nFinished CPD after {NUM_RUNS_FOR_BEST} runs in {cpd_duration:.2f}s "
+          f"({runs['iterations'].sum()} iterations in total, {int((runs['status'] == 'abandoned').sum())} runs abandoned).")
+    finished = runs[runs['status'].isin(['converged', 'max_iter'])]
+    best_run = finished.loc[finished['deviance' if CPD_SOLVER == 'cp_apr' else 'error'].idxmin()] # The run run_multi_start kept
+    if CPD_SOLVER == 'cp_apr':
+        print(f"Lowest Poisson deviance found: {best_run['deviance']:.6g} (run {int(best_run['run'])}, the model kept)")
+    print(f"Best Reconstruction Error found: {best_error:.6f} (run {int(best_run['run'])})")
+    print(f"Variance Explained by R={CHOSEN_RANK} model: {(1.0-best_error)*100:.2f}%")
+
+
+    # --- Save the Factor Matrices ---
+    factor_A = best_factors[0] # Shape: (N x R) -> Devices x Rank
+    factor_B = best_factors[1] # Shape: M x R -> Categories x Rank
+    factor_C = best_factors[2] # Shape: T x R -> Time x Rank
+
+    print("\nSaving factor matrices...")
+    try:
+        # Define output filenames clearly
+        base_output_name = f"{LAYER_NAME}_R{CHOSEN_RANK}"
+        path_A = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_factor_A.npy")
+        path_B = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_factor_B.npy")
+        path_C = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_factor_C.npy")
+        path_W = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_weights.npy") # Save weights too
+
+        np.save(path_A, factor_A)
+        print(f"  Saved Factor A (Devices x Rank) to: {path_A} (Shape: {factor_A.shape})")
+        np.save(path_B, factor_B)
+        print(f"  Saved Factor B (Categories x Rank) to: {path_B} (Shape: {factor_B.shape})")
+        np.save(path_C, factor_C)
+        print(f"  Saved Factor C (Time x Rank) to: {path_C} (Shape: {factor_C.shape})")
+        np.save(path_W, best_weights)
+        print(f"  Saved Weights (Rank,) to: {path_W} (Shape: {best_weights.shape})")
+
+        # Run diagnostics: status / iterations / error per start and their error trajectories
+        path_runs = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_runs.csv")
+        path_trajectories = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_error_trajectories.csv")
+        runs.to_csv(path_runs, index=False)
+        trajectories_frame(trajectories, runs).to_csv(path_trajectories, index=False)
+        print(f"  Saved run diagnostics to: {path_runs} and {path_trajectories}")
 
     except Exception as e:
-        # Handle potential errors during decomposition (e.g., convergence issues)
-        print(f"    Run {run+1} FAILED: {e}")
-
-cpd_duration = time.time() - start_time_cpd
-
-if best_factors is None:
-     print(f"\nFATAL ERROR: CPD Decomposition failed for all runs.")
-     sys.exit(1)
-
-print(f"\nFinished CPD after {NUM_RUNS_FOR_BEST} runs in {cpd_duration:.2f}s.")
-print(f"Best Reconstruction Error found: {best_error:.6f}")
-print(f"Variance Explained by R={CHOSEN_RANK} model: {(1.0-best_error)*100:.2f}%")
-
-
-# --- Save the Factor Matrices ---
-factor_A = best_factors[0] # Shape: (N x R) -> Devices x Rank
-factor_B = best_factors[1] # Shape: M x R -> Categories x Rank
-factor_C = best_factors[2] # Shape: T x R -> Time x Rank
-
-print("\nSaving factor matrices...")
-try:
-    # Define output filenames clearly
-    base_output_name = f"{LAYER_NAME}_R{CHOSEN_RANK}"
-    path_A = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_factor_A.npy")
-    path_B = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_factor_B.npy")
-    path_C = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_factor_C.npy")
-    path_W = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_weights.npy") # Save weights too
-
-    np.save(path_A, factor_A)
-    print(f"  Saved Factor A (Devices x Rank) to: {path_A} (Shape: {factor_A.shape})")
-    np.save(path_B, factor_B)
-    print(f"  Saved Factor B (Categories x Rank) to: {path_B} (Shape: {factor_B.shape})")
-    np.save(path_C, factor_C)
-    print(f"  Saved Factor C (Time x Rank) to: {path_C} (Shape: {factor_C.shape})")
-    np.save(path_W, best_weights)
-    print(f"  Saved Weights (Rank,) to: {path_W} (Shape: {best_weights.shape})")
-
-except Exception as e:
-    print(f"FATAL ERROR saving factor matrices: {e}")
-    sys.exit(1)
-
-print("\n--- Script Finished ---")
\ No newline at end of file
+        print(f"FATAL ERROR saving factor matrices: {e}")
+        sys.exit(1)
+
+    print("\n--- Script Finished ---")
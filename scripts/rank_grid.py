@@ -0,0 +1,127 @@
+import hashlib
+import io
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+from factor_stability import MODES, column_similarities, pairwise_matched_similarity
+from sparse_tensor import SparseTensor
+
+# --- Rank x Seed Grid with a Results Cache ---
+# Every fitted (tensor, CPD settings, rank, seed) cell is stored in a SQLite database keyed on the
+# SHA-256 of the tensor's contents and the settings, together with its factors, so a repeated or
+# extended sweep only fits the cells that are missing (a rebuilt but unchanged tensor keeps its
+# results, a changed one gets new ones). Per (layer, rank) the cached cells are summarized as fit,
+# core consistency (computed by the sweep, rank_sweep.py) and cross-seed factor similarity (factor_stability.py), and the
+# recommended rank is the highest one whose best model is still core consistent and reproducible.
+
+CACHE_FILENAME = "rank_grid_cache.sqlite"
+SUMMARY_COLUMNS = ['layer', 'rank', 'seeds', 'best_error', 'mean_error', 'core_consistency',
+                   'median_core_consistency', 'similarity_A', 'similarity_B', 'similarity_C', 'similarity']
+
+
+def tensor_content_hash(tensor, block_elements=1 << 22):
+    """Hex SHA-256 of a tensor's shape, dtype and values (memory-mapped tensors are read in blocks).
+
+    A SparseTensor is hashed by its nonzeros in C order, so it does not share cached cells with its dense file.
+    """
+    if isinstance(tensor, SparseTensor):
+        keep = tensor.values != 0
+        coords, values = tensor.coords[:, keep], tensor.values[keep]
+        order = np.lexsort(coords[::-1])
+        digest = hashlib.sha256(f"coo|{tensor.shape}|{values.dtype.str}".encode('utf-8'))
+        digest.update(np.ascontiguousarray(coords[:, order], dtype=np.int64).tobytes())
+        digest.update(np.ascontiguousarray(values[order]).tobytes())
+        return digest.hexdigest()
+    tensor = np.asarray(tensor)
+    digest = hashlib.sha256(f"{tensor.shape}|{tensor.dtype.str}".encode('utf-8'))
+    flat = tensor.reshape(-1) if tensor.flags.c_contiguous else np.ascontiguousarray(tensor).reshape(-1)
+    for start in range(0, flat.size, block_elements):
+        digest.update(flat[start:start + block_elements].tobytes())
+    return digest.hexdigest()
+
+
+def params_key(cpd_params):
+    return json.dumps(cpd_params, sort_keys=True, default=str)
+
+
+def _pack_factors(weights, factors):
+    buffer = io.BytesIO()
+    np.savez(buffer, weights=weights, **{mode: factor for mode, factor in zip(MODES, factors)})
+    return buffer.getvalue()
+
+
+def _unpack_factors(blob):
+    with np.load(io.BytesIO(blob)) as data:
+        return data['weights'], [data[mode] for mode in MODES]
+
+
+class ResultCache:
+    """SQLite store of fitted grid cells (error, core consistency, iterations, time and factors)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cells (tensor_hash TEXT, params TEXT, rank INTEGER, seed INTEGER, "
+            "error REAL, core_consistency REAL, iterations INTEGER, wall_time_s REAL, factors BLOB, "
+            "PRIMARY KEY (tensor_hash, params, rank, seed))")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def cached_cells(self, tensor_hash, params):
+        """{(rank, seed)} already stored for a tensor and settings."""
+        rows = self.connection.execute("SELECT rank, seed FROM cells WHERE tensor_hash = ? AND params = ?",
+                                       (tensor_hash, params))
+        return {(int(rank), int(seed)) for rank, seed in rows}
+
+    def store(self, tensor_hash, params, rank, seed, error, consistency, iterations, wall_time_s, weights, factors):
+        self.connection.execute("INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (tensor_hash, params, int(rank), int(seed), float(error), float(consistency),
+                                 int(iterations), float(wall_time_s), _pack_factors(weights, factors)))
+        self.connection.commit()
+
+    def load(self, tensor_hash, params, ranks, seeds):
+        """DataFrame (rank, seed, error, core_consistency, iterations, wall_time_s, weights, factors) of the cached
+        cells among ranks x seeds."""
+        rows = []
+        query = ("SELECT rank, seed, error, core_consistency, iterations, wall_time_s, factors FROM cells "
+                 "WHERE tensor_hash = ? AND params = ?")
+        wanted = {(int(rank), int(seed)) for rank in ranks for seed in seeds}
+        for rank, seed, error, consistency, iterations, wall_time_s, blob in self.connection.execute(query, (tensor_hash, params)):
+            if (rank, seed) in wanted:
+                weights, factors = _unpack_factors(blob)
+                rows.append({'rank': rank, 'seed': seed, 'error': error, 'core_consistency': consistency,
+                             'iterations': iterations, 'wall_time_s': wall_time_s, 'weights': weights, 'factors': factors})
+        columns = ['rank', 'seed', 'error', 'core_consistency', 'iterations', 'wall_time_s', 'weights', 'factors']
+        return pd.DataFrame(rows, columns=columns).sort_values(['rank', 'seed']).reset_index(drop=True)
+
+
+# --- Summary and Recommendation ---
+def summarize_rank(layer, rank, cells):
+    """One SUMMARY_COLUMNS row for the cached cells of one layer and rank."""
+    best = cells.loc[cells['error'].idxmin()]
+    row = {'layer': layer, 'rank': rank, 'seeds': len(cells), 'best_error': best['error'], 'mean_error': cells['error'].mean(),
+           'core_consistency': best['core_consistency'], 'median_core_consistency': cells['core_consistency'].median()}
+    for index, mode in enumerate(MODES):
+        if len(cells) > 1:
+            stacked = np.stack([factors[index] for factors in cells['factors']])
+            pairwise = pairwise_matched_similarity(column_similarities(stacked))
+            row[f'similarity_{mode}'] = pairwise[np.triu_indices(len(cells), 1)].mean()
+        else:
+            row[f'similarity_{mode}'] = np.nan
+    row['similarity'] = np.mean([row[f'similarity_{mode}'] for mode in MODES])
+    return row
+
+
+def recommend_rank(summary, min_core_consistency=80.0, min_similarity=0.8):
+    """Highest rank whose best-error model has core consistency >= min_core_consistency and whose
+    seeds agree (mean matched similarity >= min_similarity); the lowest rank when none qualifies.
+    Returns (rank, reason)."""
+    qualifying = summary[(summary['core_consistency'] >= min_core_consistency) & (summary['similarity'] >= min_similarity)]
+    if qualifying.empty:
+        return int(summary['rank'].min()), "no rank meets both thresholds; lowest rank"
+    rank = int(qualifying['rank'].max())
+    return rank, f"highest rank with core consistency >= {min_core_consistency:g} and similarity >= {min_similarity:g}"
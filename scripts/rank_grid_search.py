@@ -0,0 +1,119 @@
+import os
+import pandas as pd
+import sys
+import time
+from tensor_store import load_tensor_file
+from sparse_tensor import load_sparse_tensor
+from rank_sweep import find_layer_tensors, run_rank_sweep
+from rank_grid import (CACHE_FILENAME, SUMMARY_COLUMNS, ResultCache, tensor_content_hash, params_key,
+                       summarize_rank, recommend_rank)
+
+# --- Configuration ---
+TENSOR_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\tensors"
+AGGREGATION_METRIC = 'count' # 'count', 'bytes' or 'distinct_dst' tensors built by load_tensor.py
+LAYERS = None              # None: every <layer>_<metric> tensor in TENSOR_DIR; or e.g. ['local_tcp_count']
+CACHE_PATH = os.path.join(TENSOR_DIR, CACHE_FILENAME) # Fitted cells are reused across runs (see rank_grid.py)
+
+# --- Grid ---
+RANK_RANGE = range(2, 9)
+SEEDS_PER_RANK = 5         # Random initializations per rank (random_state = CPD_RANDOM_STATE + k)
+CPD_SOLVER = 'mu'          # cp_backends.py: 'mu', 'hals', 'hals_numpy', 'admm' or 'cp_apr' (Poisson); part of the cache key
+CPD_INIT = 'random'
+CPD_TOL = 1e-8
+CPD_N_ITER_MAX = 500
+CPD_RANDOM_STATE = 42
+NUM_WORKERS = os.cpu_count() # Processes fitting cells in parallel
+
+# --- Sparse Layers ---
+# The cp_backends.SPARSE_SOLVERS can fit a layer from its nonzeros (see sparse_tensor.py); 'auto' shares it with the
+# workers as COO when CPD_SOLVER = 'cp_apr', a <layer>_tensor.npz exists or it is below SPARSE_DENSITY_THRESHOLD
+# (as in performing_clustering.py). Other solvers always get the dense tensor.
+USE_SPARSE_TENSOR = 'auto'
+SPARSE_DENSITY_THRESHOLD = 0.1
+
+# --- Recommendation ---
+MIN_CORE_CONSISTENCY = 80.0 # Core consistency (%) of the best seed's model
+MIN_SIMILARITY = 0.8       # Mean matched cosine similarity of A, B and C across seeds
+
+# --- Run ---
+if __name__ == "__main__": # Guard needed: the sweep's worker processes re-import this module on Windows
+    layer_paths = find_layer_tensors(TENSOR_DIR, AGGREGATION_METRIC)
+    if LAYERS is not None:
+        layer_paths = {layer: layer_paths[layer] for layer in LAYERS if layer in layer_paths}
+    if not layer_paths:
+        print(f"FATAL ERROR: No *_{AGGREGATION_METRIC}_tensor.npy files found in {TENSOR_DIR}")
+        sys.exit(1)
+    ranks = list(RANK_RANGE)
+    seeds = [CPD_RANDOM_STATE + k for k in range(SEEDS_PER_RANK)]
+    cpd_params = {'solver': CPD_SOLVER, 'init': CPD_INIT, 'tol': CPD_TOL, 'n_iter_max': CPD_N_ITER_MAX}
+    params = params_key(cpd_params)
+    cache = ResultCache(CACHE_PATH)
+
+    # --- Find Missing Cells ---
+    print(f"Checking {len(layer_paths)} layers x {len(ranks)} ranks x {len(seeds)} seeds against cache {CACHE_PATH}...")
+    hashes, missing = {}, []
+    for layer, path in layer_paths.items():
+        try:
+            try:
+                tensor = load_tensor_file(path)
+            except FileNotFoundError: # Only stored sparse (<layer>_tensor.npz)
+                tensor = load_sparse_tensor(path)
+            hashes[layer] = tensor_content_hash(tensor)
+        except Exception as e:
+            print(f"FATAL ERROR loading tensor {path}: {e}")
+            sys.exit(1)
+        cached = cache.cached_cells(hashes[layer], params)
+        layer_missing = [(layer, rank, seed) for rank in ranks for seed in seeds if (rank, seed) not in cached]
+        missing += layer_missing
+        print(f"  {layer}: {len(ranks) * len(seeds) - len(layer_missing)} cells cached, {len(layer_missing)} to fit")
+
+    # --- Fit Missing Cells ---
+    if missing:
+        start_time = time.time()
+        missing_layers = {layer: layer_paths[layer] for layer in dict.fromkeys(layer for layer, _, _ in missing)}
+        try:
+            results = run_rank_sweep(missing_layers, ranks, seeds, cpd_params, num_workers=NUM_WORKERS,
+                                     cells=missing, return_factors=True, use_sparse=USE_SPARSE_TENSOR,
+                                     sparse_density_threshold=SPARSE_DENSITY_THRESHOLD)
+        except Exception as e:
+            print(f"FATAL ERROR during grid fits: {e}")
+            sys.exit(1)
+        for _, row in results[results['status'] == 'ok'].iterrows():
+            cache.store(hashes[row['layer']], params, row['rank'], row['seed'], row['error'], row['core_consistency'],
+                        row['iterations'], row['wall_time_s'], row['weights'], row['factors'])
+        failed = int((results['status'] != 'ok').sum())
+        print(f"Fitted {len(results)} cells in {time.time() - start_time:.2f}s{f' ({failed} failed)' if failed else ''}.")
+    else:
+        print("All cells cached; nothing to fit.")
+
+    # --- Summarize and Recommend ---
+    summary_rows, recommendations = [], []
+    for layer in layer_paths:
+        cells = cache.load(hashes[layer], params, ranks, seeds)
+        layer_summary = pd.DataFrame([summarize_rank(layer, rank, rank_cells) for rank, rank_cells in cells.groupby('rank')],
+                                     columns=SUMMARY_COLUMNS)
+        summary_rows.append(layer_summary)
+        if layer_summary.empty:
+            print(f"\n{layer}: no successful cells")
+            continue
+        rank, reason = recommend_rank(layer_summary, MIN_CORE_CONSISTENCY, MIN_SIMILARITY)
+        recommendations.append({'layer': layer, 'recommended_rank': rank, 'reason': reason})
+        print(f"\n{layer}: rank, best error, core consistency (best seed / median), cross-seed similarity")
+        for _, row in layer_summary.iterrows():
+            print(f"  R={int(row['rank'])}: {row['best_error']:.4f}, {row['core_consistency']:.1f} / {row['median_core_consistency']:.1f}, "
+                  f"{row['similarity']:.3f}{'  <-- recommended' if row['rank'] == rank else ''}")
+        print(f"  Recommended CHOSEN_RANK = {rank} ({reason})")
+    cache.close()
+
+    # --- Save Results ---
+    try:
+        summary_path = os.path.join(TENSOR_DIR, f"rank_grid_{AGGREGATION_METRIC}_summary.csv")
+        pd.concat(summary_rows, ignore_index=True).to_csv(summary_path, index=False)
+        recommendation_path = os.path.join(TENSOR_DIR, f"rank_grid_{AGGREGATION_METRIC}_recommended.csv")
+        pd.DataFrame(recommendations, columns=['layer', 'recommended_rank', 'reason']).to_csv(recommendation_path, index=False)
+        print(f"\nSaved grid summary to: {summary_path}")
+        print(f"Saved recommended ranks to: {recommendation_path}")
+    except Exception as e:
+        print(f"Error saving grid results: {e}")
+
+    print("\n--- Script Finished ---")
@@ -0,0 +1,333 @@
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import scipy.sparse
+import scipy.sparse.linalg
+import tensorly as tl
+from cp_backends import decompose, fit_objective, use_sparse_tensor
+from sparse_tensor import SparseTensor, khatri_rao_rows, load_dense_tensor, load_sparse_tensor
+from cp_utils import relative_error, core_consistency, mttkrp, tensor_norm
+
+# --- Parallel Rank x Seed Sweep ---
+# Fits a non-negative CPD (cp_backends.py) for every (layer, rank, seed) cell across a process pool. Each layer's
+# tensor is copied once into shared memory that the workers map read-only, so no tensor is
+# pickled per task, and the relative error is computed from the factors (cp_utils.py) instead
+# of materialising the reconstruction. Results come back as one row per cell.
+# For the cp_backends.SPARSE_SOLVERS a layer is shared as its COO coords and values instead
+# (use_sparse_tensor decides, as in performing_clustering.py), so CP-APR and sparse MU / HALS cells
+# work on the nonzeros without each building them from the dense tensor; layers stored only as a
+# <layer>_tensor.npz are swept too (densified once for the other solvers).
+# Warm sweeps fit the ranks of one (layer, seed) in increasing order as a chain, starting each rank
+# R+1 from the converged rank-R factors plus one new component, so most ranks converge in a
+# fraction of the iterations of a random start.
+# Every fitted cell also gets its core consistency (CORCONDIA, cp_utils.py): one pass of R-row mode
+# products over a dense tensor (about an MTTKRP), or O(nnz R^3) over the nonzeros of a shared sparse
+# layer, so it is computed for every rank and seed rather than for the chosen rank only.
+# CP-APR cells also get their Poisson deviance (the objective they minimize, NaN for the least-squares
+# solvers), by which their seeds should be compared instead of the least-squares error.
+
+RESULT_COLUMNS = ['layer', 'start', 'rank', 'seed', 'error', 'deviance', 'core_consistency', 'iterations', 'wall_time_s', 'status']
+NEW_COMPONENT_INITS = ('random', 'svd')
+_TENSOR_FILE_PATTERN = r'^(?!all_layers_)(.+_{metric})(?:_tensor\.npy|_tensor\.npz|\.store)$'
+
+# Shared tensors attached in a worker process: {layer: ([SharedMemory], ndarray view or SparseTensor, norm)}
+_worker_tensors = {}
+
+
+def find_layer_tensors(tensor_dir, metric):
+    """{layer name: <layer>_tensor.npy path} of every per-layer tensor (.npy, .store or sparse .npz) of one metric in tensor_dir.
+
+    The path is the .npy one even when only the .store or .npz exists; load it with load_dense_tensor or
+    load_sparse_tensor (sparse_tensor.py).
+    """
+    pattern = re.compile(_TENSOR_FILE_PATTERN.format(metric=re.escape(metric)))
+    layers = {}
+    for name in sorted(os.listdir(tensor_dir)):
+        match = pattern.match(name)
+        if match:
+            layers[match.group(1)] = os.path.join(tensor_dir, f"{match.group(1)}_tensor.npy")
+    return layers
+
+
+def extend_cp(tensor, weights, factors, new_component='random', random_state=None):
+    """Rank R+1 starting point: the rank-R factors plus one non-negative component.
+
+    'random' draws the new columns uniformly, 'svd' takes the leading singular vector of each
+    unfolding of the positive part of the residual. The component is scaled by the least-squares
+    fit to the residual (clipped at 0), so the starting error is never above the rank-R error.
+    """
+    rng = tl.check_random_state(random_state)
+    factors = [tl.to_numpy(factor) * (tl.to_numpy(weights)[np.newaxis, :] if mode == 0 else 1)
+               for mode, factor in enumerate(factors)] # Weights folded into the first factor
+    if new_component == 'svd' and isinstance(tensor, SparseTensor):
+        columns = _sparse_residual_columns(tensor, factors)
+    elif new_component == 'svd':
+        residual = np.clip(tl.to_numpy(tensor) - tl.cp_to_tensor((None, factors)), 0, None)
+        columns = [np.abs(np.linalg.svd(tl.unfold(residual, mode), full_matrices=False)[0][:, 0])
+                   for mode in range(residual.ndim)]
+    elif new_component == 'random':
+        columns = [rng.random_sample(factor.shape[0]) for factor in factors]
+    else:
+        raise ValueError(f"Unknown new component init '{new_component}' (use one of {NEW_COMPONENT_INITS}).")
+    columns = [np.maximum(column, 1e-12)[:, np.newaxis] for column in columns] # Zeros never move under MU
+    # <X - M, c> and ||c||^2 of the rank-one component c, from its columns only
+    model_inner = float(np.sum(np.prod([factor.T @ column for factor, column in zip(factors, columns)], axis=0)))
+    data_inner = float(np.sum(mttkrp(tensor, columns, tensor.ndim - 1) * columns[-1]))
+    component_norm = float(np.prod([column.T @ column for column in columns]))
+    scale = max((data_inner - model_inner) / component_norm, 1e-12)
+    columns[0] = columns[0] * scale
+    return np.ones(len(weights) + 1), [np.hstack([factor, column]) for factor, column in zip(factors, columns)]
+
+
+def _sparse_residual_columns(tensor, factors):
+    """extend_cp's 'svd' columns for a SparseTensor: the positive part of X - [[factors]] is only nonzero
+    where X is (the model is non-negative), so each unfolding is a scipy sparse matrix over X's nonzeros."""
+    values = np.clip(tensor.values - khatri_rao_rows(tensor, factors).sum(axis=1), 0, None)
+    columns = []
+    for mode in range(tensor.ndim):
+        others = [other for other in range(tensor.ndim) if other != mode]
+        other_shape = [tensor.shape[other] for other in others]
+        unfolded = scipy.sparse.csr_matrix((values, (tensor.coords[mode], np.ravel_multi_index(tuple(tensor.coords[others]), other_shape))),
+                                           shape=(tensor.shape[mode], int(np.prod(other_shape))))
+        if min(unfolded.shape) < 3 or unfolded.nnz == 0: # Too small (or empty) for the iterative solver
+            column = np.linalg.svd(unfolded.toarray(), full_matrices=False)[0][:, 0]
+        else:
+            column = scipy.sparse.linalg.svds(unfolded, k=1, v0=np.ones(min(unfolded.shape)))[0][:, 0]
+        columns.append(np.abs(column))
+    return columns
+
+
+# --- Shared Memory ---
+def _share_array(array):
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block
+
+
+def _attach_array(name, shape, dtype):
+    block = shared_memory.SharedMemory(name=name)
+    view = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    view.flags.writeable = False
+    return block, view
+
+
+def share_tensor(tensor):
+    """Copies a tensor into a new float64 shared-memory block. Returns (SharedMemory, spec for attach_tensor)."""
+    tensor = np.asarray(tensor, dtype=np.float64)
+    block = _share_array(tensor)
+    return block, (block.name, tensor.shape)
+
+
+def attach_tensor(spec):
+    """(SharedMemory, read-only ndarray view) of a block created by share_tensor."""
+    name, shape = spec
+    return _attach_array(name, shape, np.float64)
+
+
+def share_sparse_tensor(tensor):
+    """Copies a SparseTensor's int64 coords and float64 values into two new shared-memory blocks.
+    Returns ([SharedMemory], spec for attach_sparse_tensor)."""
+    coords = np.ascontiguousarray(tensor.coords, dtype=np.int64)
+    values = np.ascontiguousarray(tensor.values, dtype=np.float64)
+    blocks = [_share_array(coords), _share_array(values)]
+    return blocks, (blocks[0].name, blocks[1].name, tensor.shape, tensor.nnz)
+
+
+def attach_sparse_tensor(spec):
+    """([SharedMemory], SparseTensor over read-only views) of the blocks created by share_sparse_tensor."""
+    coords_name, values_name, shape, nnz = spec
+    coords_block, coords = _attach_array(coords_name, (len(shape), nnz), np.int64)
+    values_block, values = _attach_array(values_name, (nnz,), np.float64)
+    return [coords_block, values_block], SparseTensor(coords, values, shape)
+
+
+def _init_worker(tensor_specs):
+    for layer, (sparse, spec) in tensor_specs.items():
+        if sparse:
+            blocks, tensor = attach_sparse_tensor(spec)
+        else:
+            block, tensor = attach_tensor(spec)
+            blocks = [block]
+        _worker_tensors[layer] = (blocks, tensor, tensor_norm(tensor))
+
+
+def cell_core_consistency(tensor, weights, factors):
+    """core_consistency that returns NaN instead of failing (e.g. when the SVD of a factor does not converge)."""
+    try:
+        return core_consistency(tensor, weights, factors)
+    except Exception:
+        return np.nan
+
+
+def cell_deviance(tensor, weights, factors, cpd_params):
+    """Poisson deviance of a CP-APR fit (NaN for the least-squares solvers)."""
+    solver = cpd_params.get('solver', 'mu')
+    return fit_objective(tensor, weights, factors, solver) if solver == 'cp_apr' else np.nan
+
+
+def fit_cell(layer, rank, seed, cpd_params, return_factors=False):
+    """One non-negative CPD fit of a shared tensor. Returns a result row (with 'weights' and 'factors' if asked)."""
+    _, tensor, norm_tensor = _worker_tensors[layer]
+    start = time.time()
+    weights = factors = None
+    try:
+        (weights, factors), errors = decompose(tensor, rank=rank, random_state=seed, return_errors=True, **cpd_params)
+        error = relative_error(tensor, weights, factors, norm_tensor)
+        status = 'ok'
+    except Exception as e:
+        errors, error, status = [], np.nan, f"failed: {e}"
+    wall_time_s = time.time() - start # Fit only; the diagnostic is not part of the fit time
+    consistency = np.nan if status != 'ok' else cell_core_consistency(tensor, weights, factors)
+    deviance = np.nan if status != 'ok' else cell_deviance(tensor, weights, factors, cpd_params)
+    row = {'layer': layer, 'start': 'cold', 'rank': rank, 'seed': seed, 'error': error, 'deviance': deviance,
+           'core_consistency': consistency, 'iterations': len(errors), 'wall_time_s': wall_time_s, 'status': status}
+    if return_factors:
+        row['weights'] = None if weights is None else tl.to_numpy(weights)
+        row['factors'] = None if factors is None else [tl.to_numpy(factor) for factor in factors]
+    return row
+
+
+def cold_check(tensor, rank, seed, cpd_params, target, check_iters=25, warmup_iters=0):
+    """Cold fit of one cell (as fit_cell) in chunks of check_iters (multi_start.fit_continued, so it stops where
+    fit_cell would), given up once, past warmup_iters, even its extrapolated final objective
+    (multi_start.projected_objective, from two chunks on) stays above target.
+
+    Returns ((weights, factors, objective) or None when given up, relative errors of the iterations run).
+    """
+    from multi_start import fit_continued, projected_objective # multi_start imports this module
+    solver = cpd_params.get('solver', 'mu')
+    n_iter_max = cpd_params.get('n_iter_max', 100)
+    init = cpd_params.get('init', 'random')
+    errors, checkpoints, done = [], [], 0
+    while done < n_iter_max:
+        chunk = min(check_iters, n_iter_max - done)
+        weights, factors, chunk_errors, objective, converged = fit_continued(
+            tensor, rank, init, chunk, cpd_params.get('tol'), seed, solver, checkpoints[-1][1] if checkpoints else None)
+        init = (weights, factors)
+        done += chunk
+        errors += chunk_errors
+        checkpoints.append((done, objective))
+        if converged:
+            break
+        if done >= warmup_iters and len(checkpoints) >= 2 and projected_objective(checkpoints, n_iter_max - done) > target:
+            return None, errors
+    return (weights, factors, fit_objective(tensor, weights, factors, solver)), errors
+
+
+def fit_warm_chain(layer, ranks, seed, cpd_params, new_component='random', warm_n_iter_max=None, check_iters=25,
+                   check_warmup_iters=0):
+    """Fits ranks in increasing order, each from the previous rank's factors plus one new component.
+
+    The lowest rank starts from cpd_params' init; after a failed fit the next rank starts over from it.
+    Warm-started ranks are limited to warm_n_iter_max iterations when given (they start close to
+    convergence), then checked against the cold fit of the same seed (cold_check): the cold fit is kept,
+    and continues the chain, when it reaches a lower fit_objective, so a warm chain never stays in a worse
+    minimum than the cold start it can be compared with. Iterations and wall time include the check.
+    Returns one result row per rank.
+    """
+    _, tensor, norm_tensor = _worker_tensors[layer]
+    solver = cpd_params.get('solver', 'mu')
+    rng = np.random.RandomState(seed)
+    rows = []
+    previous = None # (rank, weights, factors) of the last successful fit
+    for rank in sorted(ranks):
+        start = time.time()
+        try:
+            params = dict(cpd_params)
+            if previous is not None:
+                weights, factors = previous[1], previous[2]
+                while len(weights) < rank: # Ranks may skip values; add one component per missing rank
+                    weights, factors = extend_cp(tensor, weights, factors, new_component, rng)
+                params['init'] = (weights, factors)
+                if warm_n_iter_max: params['n_iter_max'] = warm_n_iter_max
+            (weights, factors), errors = decompose(tensor, rank=rank, random_state=seed, return_errors=True, **params)
+            if previous is not None:
+                warm_objective = fit_objective(tensor, weights, factors, solver, norm_tensor)
+                cold, cold_errors = cold_check(tensor, rank, seed, cpd_params, warm_objective, check_iters,
+                                               check_warmup_iters)
+                errors = errors + cold_errors
+                if cold is not None and cold[2] < warm_objective:
+                    weights, factors = cold[0], cold[1]
+            error = relative_error(tensor, weights, factors, norm_tensor)
+            previous = (rank, weights, factors)
+            status = 'ok'
+        except Exception as e:
+            errors, error, status = [], np.nan, f"failed: {e}"
+            previous = None
+        wall_time_s = time.time() - start
+        consistency = np.nan if status != 'ok' else cell_core_consistency(tensor, weights, factors)
+        deviance = np.nan if status != 'ok' else cell_deviance(tensor, weights, factors, cpd_params)
+        rows.append({'layer': layer, 'start': 'warm', 'rank': rank, 'seed': seed, 'error': error, 'deviance': deviance,
+                     'core_consistency': consistency, 'iterations': len(errors), 'wall_time_s': wall_time_s, 'status': status})
+    return rows
+
+
+# --- Sweep ---
+def run_rank_sweep(tensor_paths, ranks, seeds, cpd_params, num_workers=None, progress=print,
+                   starts=('cold',), new_component='random', warm_n_iter_max=None, warm_check_iters=25, warm_check_warmup_iters=0,
+                   cells=None, return_factors=False, use_sparse='auto', sparse_density_threshold=0.1):
+    """Fits every (layer, rank, seed) of {layer: tensor path} in one process pool.
+
+    All layers' cells share the pool, so sweeps of several layers run concurrently. cpd_params
+    are passed to cp_backends.decompose (solver, init, n_iter_max, tol). starts selects independent
+    'cold' fits per cell and/or 'warm' chains per (layer, seed) (see fit_warm_chain; new_component
+    as in extend_cp, warm_check_iters and warm_check_warmup_iters as check_iters and warmup_iters of
+    cold_check). cells, a list of (layer, rank, seed), fits just those cells cold instead
+    (return_factors adds their 'weights' and 'factors' columns). Returns a DataFrame with
+    RESULT_COLUMNS sorted by layer, start, rank and seed.
+    use_sparse and sparse_density_threshold pick the sparse SparseTensor or dense tensor per layer as in
+    cp_backends.use_sparse_tensor.
+    """
+    blocks = []
+    try:
+        tensor_specs = {} # layer -> (sparse, spec)
+        for layer, path in tensor_paths.items():
+            if use_sparse_tensor(path, cpd_params.get('solver', 'mu'), use_sparse, sparse_density_threshold):
+                tensor = load_sparse_tensor(path)
+                layer_blocks, spec = share_sparse_tensor(tensor)
+                tensor_specs[layer] = (True, spec)
+                description = f"{tensor.shape} as {tensor.nnz} nonzeros"
+            else:
+                block, spec = share_tensor(load_dense_tensor(path))
+                layer_blocks = [block]
+                tensor_specs[layer] = (False, spec)
+                description = f"{spec[1]}"
+            blocks += layer_blocks
+            progress(f"  Shared {layer} tensor {description} ({sum(block.size for block in layer_blocks) / 1e6:.1f} MB)")
+        tasks = [] # (function, args, number of cells)
+        if cells is not None:
+            tasks = [(fit_cell, (layer, rank, seed, cpd_params, return_factors), 1) for layer, rank, seed in cells]
+            starts = ('cold',)
+        elif 'cold' in starts:
+            tasks += [(fit_cell, (layer, rank, seed, cpd_params), 1) for layer in tensor_paths for rank in ranks for seed in seeds]
+        if 'warm' in starts and cells is None:
+            tasks += [(fit_warm_chain, (layer, ranks, seed, cpd_params, new_component, warm_n_iter_max, warm_check_iters,
+                                            warm_check_warmup_iters), len(ranks))
+                      for layer in tensor_paths for seed in seeds]
+        num_cells = sum(task_cells for _, _, task_cells in tasks)
+        num_workers = max(1, min(num_workers or os.cpu_count() or 1, len(tasks)))
+        if cells is not None:
+            progress(f"  Fitting {num_cells} cells of {len(tensor_paths)} layers on {num_workers} workers...")
+        else:
+            progress(f"  Fitting {num_cells} cells ({len(tensor_paths)} layers x {len(ranks)} ranks x {len(seeds)} seeds, "
+                     f"{' + '.join(starts)} starts) as {len(tasks)} tasks on {num_workers} workers...")
+        rows = []
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(tensor_specs,)) as executor:
+            futures = [executor.submit(function, *args) for function, args, _ in tasks]
+            for future in as_completed(futures):
+                result = future.result()
+                for row in (result if isinstance(result, list) else [result]):
+                    rows.append(row)
+                    progress(f"    [{len(rows)}/{num_cells}] {row['layer']} {row['start']} R={row['rank']} seed={row['seed']}: "
+                             f"error {row['error']:.4f}, core consistency {row['core_consistency']:.1f}, "
+                             f"{row['iterations']} iterations, {row['wall_time_s']:.2f}s ({row['status']})")
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    columns = RESULT_COLUMNS + (['weights', 'factors'] if cells is not None and return_factors else [])
+    return pd.DataFrame(rows, columns=columns).sort_values(['layer', 'start', 'rank', 'seed']).reset_index(drop=True)
@@ -0,0 +1,137 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from tensorly.decomposition import non_negative_parafac
+from rank_sweep import attach_tensor, share_tensor
+from online_cpd import fold_weights, fold_in_slice
+from cp_utils import relative_error
+from factor_matching import align_components
+
+# --- Sliding-Window NNCP ---
+# Decomposes the days [start, start + window) of an (N, M, T) tensor for starts every `stride`
+# days, so community membership can change from window to window instead of coming from one
+# global A. The first window is fitted from a random start; every other window is warm-started:
+# A and B from the window before it, the C rows of the days both windows cover from its C, and the
+# C rows of new days folded in by NNLS against A and B (online_cpd.py). Warm fits get
+# warm_n_iter_max iterations, so the windows together cost about as much as one global fit.
+# For parallelism the remaining windows are split into one contiguous chain per worker, each
+# chain's first window starting from the first window's A and B. Components are then aligned
+# window to window with the Hungarian matching of factor_matching.py.
+
+WINDOW_COLUMNS = ['window', 'start', 'stop', 'error', 'iterations', 'wall_time_s', 'match_similarity']
+
+# Shared tensor of a worker process: (SharedMemory, read-only view)
+_worker_tensor = None
+
+
+def _init_worker(spec):
+    global _worker_tensor
+    _worker_tensor = attach_tensor(spec)
+
+
+def window_starts(num_days, window, stride):
+    """First day of every window; the last window is moved back to end on the last day if needed."""
+    if window > num_days:
+        raise ValueError(f"Window of {window} days is longer than the tensor ({num_days} days).")
+    starts = list(range(0, num_days - window + 1, stride))
+    if starts[-1] + window < num_days:
+        starts.append(num_days - window)
+    return starts
+
+
+def window_init(tensor, start, window, A, B, previous=None):
+    """Warm start (weights, factors) for days [start, start + window) from factors A, B.
+
+    previous is (start, C) of an earlier window; its C rows are reused for the days both cover.
+    """
+    C = np.empty((window, A.shape[1]))
+    for row, day in enumerate(range(start, start + window)):
+        if previous is not None and 0 <= day - previous[0] < len(previous[1]):
+            C[row] = previous[1][day - previous[0]]
+        else:
+            C[row] = fold_in_slice(np.asarray(tensor[:, :, day], dtype=np.float64), A, B)
+    C = np.maximum(C, 1e-12) # Zeros never move under multiplicative updates
+    return np.ones(A.shape[1]), [A, B, C]
+
+
+def fit_window(tensor, start, window, rank, init, n_iter_max, tol, random_state=None):
+    """NNCP of one window. Returns (factors with weights folded in, iterations, error, seconds)."""
+    begin = time.time()
+    window_tensor = tensor[:, :, start:start + window]
+    (weights, factors), errors = non_negative_parafac(window_tensor, rank=rank, init=init, n_iter_max=n_iter_max, tol=tol,
+                                                      random_state=random_state, return_errors=True)
+    factors = fold_weights(weights, factors)
+    return factors, len(errors), relative_error(window_tensor, None, factors), time.time() - begin
+
+
+def fit_window_chain(starts, window, rank, A, B, n_iter_max, tol, tensor=None):
+    """Fits windows in order, each warm-started from the one before (the first from A, B).
+
+    Uses the worker's shared tensor unless one is given. Returns [(start, factors, iterations, error, seconds)].
+    """
+    tensor = _worker_tensor[1] if tensor is None else tensor
+    results = []
+    previous = None
+    for start in starts:
+        init = window_init(tensor, start, window, A, B, previous)
+        factors, iterations, error, seconds = fit_window(tensor, start, window, rank, init, n_iter_max, tol)
+        results.append((start, factors, iterations, error, seconds))
+        A, B, previous = factors[0], factors[1], (start, factors[2])
+    return results
+
+
+def split_chains(items, num_chains):
+    """items split into at most num_chains contiguous, nearly equal parts."""
+    return [list(part) for part in np.array_split(items, min(num_chains, len(items))) if len(part)]
+
+
+def run_sliding_windows(tensor, rank, window, stride, n_iter_max=500, warm_n_iter_max=50, tol=1e-8, init='random',
+                        random_state=None, num_workers=None, progress=print):
+    """Sliding-window NNCP of a dense tensor with components aligned across windows.
+
+    Returns (DataFrame with WINDOW_COLUMNS, aligned factors [A (W, N, R), B (W, M, R), C (W, window, R)]
+    with the weights folded into A, assignments (W, N, window) of the component maximizing A[i, r] * C[t, r]).
+    """
+    starts = window_starts(tensor.shape[2], window, stride)
+    num_workers = max(1, min(num_workers or os.cpu_count() or 1, len(starts) - 1 or 1))
+
+    progress(f"  Window 1/{len(starts)} (days {starts[0] + 1}-{starts[0] + window}) from a random start...")
+    first = fit_window(tensor, starts[0], window, rank, init, n_iter_max, tol, random_state)
+    results = [(starts[0],) + first]
+    A0, B0 = first[0][0], first[0][1]
+
+    chains = split_chains(starts[1:], num_workers) if len(starts) > 1 else []
+    progress(f"  {len(starts) - 1} warm-started windows as {len(chains)} chain(s) on {num_workers} worker(s)...")
+    if num_workers > 1 and chains:
+        block, spec = share_tensor(tensor)
+        try:
+            with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(spec,)) as executor:
+                futures = [executor.submit(fit_window_chain, chain, window, rank, A0, B0, warm_n_iter_max, tol) for chain in chains]
+                for future in futures:
+                    results.extend(future.result())
+        finally:
+            block.close()
+            block.unlink()
+    else:
+        for chain in chains:
+            results.extend(fit_window_chain(chain, window, rank, A0, B0, warm_n_iter_max, tol, tensor=tensor))
+
+    # --- Align Components Window to Window ---
+    rows, aligned = [], []
+    for index, (start, factors, iterations, error, seconds) in enumerate(results):
+        similarity = np.nan
+        if aligned:
+            permutation, scores = align_components(aligned[-1], factors)
+            factors = [factor[:, permutation] for factor in factors]
+            similarity = float(np.mean(scores))
+        aligned.append(factors)
+        rows.append({'window': index + 1, 'start': start, 'stop': start + window, 'error': error,
+                     'iterations': iterations, 'wall_time_s': seconds, 'match_similarity': similarity})
+        progress(f"    Window {index + 1} (days {start + 1}-{start + window}): error {error:.4f}, {iterations} iterations, "
+                 f"{seconds:.2f}s, match similarity {similarity:.3f}")
+
+    stacked = [np.stack([factors[mode] for factors in aligned]) for mode in range(3)]
+    assignments = np.argmax(stacked[0][:, :, np.newaxis, :] * stacked[2][:, np.newaxis, :, :], axis=3) # (W, N, window)
+    return pd.DataFrame(rows, columns=WINDOW_COLUMNS), stacked, assignments
@@ -0,0 +1,115 @@
+import os
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import sys
+import re
+import glob
+import time
+from tensor_store import load_tensor_file
+from sliding_window import run_sliding_windows
+
+# --- Configuration ---
+TENSOR_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\tensors"
+FACTOR_OUTPUT_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\factors"
+# Directory of the layer's daily CSVs (only used to label windows with dates)
+CSV_LAYER_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\layer_other_local_tcp_count"
+
+# --- CHOOSE THE LAYER AND ITS RANK ---
+AGGREGATION_METRIC = 'count' # 'count', 'bytes' or 'distinct_dst' tensor built by load_tensor.py
+TENSOR_FILENAME = f"local_tcp_{AGGREGATION_METRIC}_tensor.npy"
+CHOSEN_RANK = 2
+LAYER_NAME = f"local_tcp_{AGGREGATION_METRIC}" # Used for output filenames
+# --- END CHOOSE ---
+
+# --- Sliding Windows (see sliding_window.py) ---
+WINDOW_DAYS = 28           # Days per window
+STRIDE_DAYS = 7            # Days between window starts
+CPD_INIT = 'random'        # Only the first window starts from CPD_INIT
+CPD_TOL = 1e-8
+CPD_N_ITER_MAX = 500       # Iterations of the first window
+WARM_N_ITER_MAX = 50       # Iterations of every warm-started window
+CPD_RANDOM_STATE = 42
+NUM_WORKERS = os.cpu_count() # Chains of windows fitted in parallel
+
+# --- Run ---
+if __name__ == "__main__": # Guard needed: the window worker processes re-import this module on Windows
+    tensor_path = os.path.join(TENSOR_DIR, TENSOR_FILENAME)
+    os.makedirs(FACTOR_OUTPUT_DIR, exist_ok=True)
+
+    # --- Load the Tensor ---
+    print(f"Loading tensor: {tensor_path}")
+    try:
+        tensor = np.asarray(load_tensor_file(tensor_path), dtype=np.float64)
+        N, M, T = tensor.shape
+        print(f"Tensor loaded successfully. Shape: {tensor.shape}")
+    except FileNotFoundError:
+        print(f"FATAL ERROR: Tensor file not found at {tensor_path}")
+        sys.exit(1)
+
+    # --- Dates of the Time Axis ---
+    dates = sorted(re.match(r'(\d{4}-\d{2}-\d{2})\.csv', os.path.basename(f)).group(1)
+                   for f in glob.glob(os.path.join(CSV_LAYER_DIR, "*.csv")) if re.match(r'\d{4}-\d{2}-\d{2}\.csv', os.path.basename(f)))
+    if len(dates) != T:
+        print(f"Warning: Found {len(dates)} dates for {T} time steps. Labelling windows with day numbers.")
+        dates = [f"day {t + 1}" for t in range(T)]
+
+    # --- Sliding-Window Decomposition ---
+    print(f"\nDecomposing {WINDOW_DAYS}-day windows every {STRIDE_DAYS} days with Rank R={CHOSEN_RANK}...")
+    start_time = time.time()
+    try:
+        windows, (factors_A, factors_B, factors_C), assignments = run_sliding_windows(
+            tensor, CHOSEN_RANK, WINDOW_DAYS, STRIDE_DAYS, n_iter_max=CPD_N_ITER_MAX, warm_n_iter_max=WARM_N_ITER_MAX,
+            tol=CPD_TOL, init=CPD_INIT, random_state=CPD_RANDOM_STATE, num_workers=NUM_WORKERS)
+    except Exception as e:
+        print(f"FATAL ERROR during sliding-window decomposition: {e}")
+        sys.exit(1)
+    windows['start_date'] = [dates[start] for start in windows['start']]
+    windows['end_date'] = [dates[stop - 1] for stop in windows['stop']]
+    print(f"\nFinished {len(windows)} windows in {time.time() - start_time:.2f}s "
+          f"({int(windows['iterations'].sum())} iterations over {len(windows) * WINDOW_DAYS} window-days; "
+          f"a global fit runs up to {CPD_N_ITER_MAX} iterations over {T} days).")
+    print(f"Mean window reconstruction error: {windows['error'].mean():.6f}")
+
+    # Community of each device per window: component with the largest A[i, r] * sum_t C[t, r]
+    window_membership = np.argmax(factors_A * factors_C.sum(axis=1)[:, np.newaxis, :], axis=2) # (W, N)
+
+    # --- Save Results ---
+    print("\nSaving window results...")
+    try:
+        base_output_name = f"{LAYER_NAME}_R{CHOSEN_RANK}_W{WINDOW_DAYS}_S{STRIDE_DAYS}"
+        path_factors = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_windows.npz")
+        path_windows = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_windows.csv")
+        path_membership = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_membership.csv")
+        path_plot = os.path.join(FACTOR_OUTPUT_DIR, f"{base_output_name}_membership.png")
+
+        # Aligned factors per window (weights folded into A) and the (window, device, day) assignment tensor
+        np.savez(path_factors, factor_A=factors_A, factor_B=factors_B, factor_C=factors_C, assignments=assignments,
+                 starts=windows['start'].to_numpy(), window_days=WINDOW_DAYS)
+        print(f"  Saved aligned window factors and assignments {assignments.shape} to: {path_factors}")
+        windows.to_csv(path_windows, index=False)
+        print(f"  Saved window summary to: {path_windows}")
+        membership = pd.DataFrame(window_membership.T + 1, columns=windows['start_date'])
+        membership.index.name = 'device'
+        membership.to_csv(path_membership)
+        print(f"  Saved per-window device communities to: {path_membership}")
+
+        plt.figure(figsize=(15, 8))
+        cmap = plt.get_cmap('viridis', CHOSEN_RANK)
+        im = plt.imshow(window_membership.T + 1, aspect='auto', cmap=cmap, interpolation='nearest', origin='lower',
+                        vmin=0.5, vmax=CHOSEN_RANK + 0.5)
+        plt.xticks(np.arange(len(windows)), windows['start_date'], rotation=45, ha='right')
+        plt.xlabel('Window start')
+        plt.ylabel('Device')
+        plt.title(f'Community per {WINDOW_DAYS}-day Window (R={CHOSEN_RANK}) - {LAYER_NAME}')
+        cbar = plt.colorbar(im, ticks=np.arange(CHOSEN_RANK) + 1)
+        cbar.set_ticklabels([f'Cluster {r+1}' for r in range(CHOSEN_RANK)])
+        plt.tight_layout()
+        plt.savefig(path_plot)
+        plt.close()
+        print(f"  Saved membership plot to: {path_plot}")
+    except Exception as e:
+        print(f"FATAL ERROR saving window results: {e}")
+        sys.exit(1)
+
+    print("\n--- Script Finished ---")
@@ -0,0 +1,206 @@
+import os
+import numpy as np
+from tensor_store import load_tensor_file
+
+# --- Sparse (COO) Layer Tensors ---
+# Most layer tensors are overwhelmingly zeros (a device talks to few categories on few days), so
+# they can be kept as coordinates + values of their nonzeros and decomposed without ever building
+# the dense N x M x T array: the MTTKRP, the only tensor-sized step of the multiplicative-update
+# NNCP, touches each nonzero once, and the reconstruction error follows from the factor Gram
+# matrices. Memory and time then scale with nnz * rank instead of N * M * T.
+# Files use the same coords / values / shape .npz layout as the sub-daily days of time_bins.py.
+
+SPARSE_SUFFIX = ".npz"
+
+
+def sparse_path_for(tensor_path):
+    """<dir>/<name>_tensor.npz for <dir>/<name>_tensor.npy."""
+    return os.path.splitext(tensor_path)[0] + SPARSE_SUFFIX
+
+
+class SparseTensor:
+    """Tensor in COO form: coords (ndim x nnz), values (nnz,) and the dense shape."""
+
+    def __init__(self, coords, values, shape):
+        self.coords = np.asarray(coords, dtype=np.int64).reshape(len(shape), -1)
+        self.values = np.asarray(values)
+        self.shape = tuple(int(size) for size in shape)
+        if self.coords.shape[1] != len(self.values):
+            raise ValueError(f"{self.coords.shape[1]} coordinates for {len(self.values)} values.")
+
+    @classmethod
+    def from_dense(cls, array):
+        array = np.asarray(array)
+        coords = np.nonzero(array)
+        return cls(np.stack(coords), array[coords], array.shape)
+
+    @classmethod
+    def concatenate(cls, tensors, axis=-1):
+        """Joins tensors along one axis (e.g. days along time); the other dimensions must agree."""
+        tensors = list(tensors)
+        if not tensors:
+            raise ValueError("Nothing to concatenate.")
+        ndim = tensors[0].ndim
+        axis = axis % ndim
+        other_dims = [tensor.shape[:axis] + tensor.shape[axis + 1:] for tensor in tensors]
+        if any(dims != other_dims[0] for dims in other_dims):
+            raise ValueError("All tensors must have the same shape outside the concatenation axis.")
+        offsets = np.cumsum([0] + [tensor.shape[axis] for tensor in tensors])
+        coords = []
+        for tensor, offset in zip(tensors, offsets):
+            shifted = tensor.coords.copy()
+            shifted[axis] += offset
+            coords.append(shifted)
+        shape = list(tensors[0].shape)
+        shape[axis] = int(offsets[-1])
+        return cls(np.concatenate(coords, axis=1), np.concatenate([tensor.values for tensor in tensors]), shape)
+
+    @property
+    def ndim(self): return len(self.shape)
+
+    @property
+    def nnz(self): return len(self.values)
+
+    @property
+    def dtype(self): return self.values.dtype
+
+    @property
+    def density(self):
+        size = int(np.prod(self.shape))
+        return self.nnz / size if size else 0.0
+
+    def astype(self, dtype):
+        return SparseTensor(self.coords, self.values.astype(dtype), self.shape)
+
+    def to_dense(self):
+        array = np.zeros(self.shape, dtype=self.values.dtype)
+        np.add.at(array, tuple(self.coords), self.values) # add.at: repeated coordinates are summed
+        return array
+
+    def norm(self):
+        values = self.values.astype(np.float64)
+        return float(np.sqrt(np.dot(values, values)))
+
+    # --- Persistence ---
+    def save(self, path):
+        """Compressed .npz (written to a temp file, then renamed into place)."""
+        index_dtype = np.uint16 if max(self.shape, default=0) < 2 ** 16 else np.int64
+        temp_path = f"{path}.tmp{os.getpid()}"
+        try:
+            with open(temp_path, 'wb') as f:
+                np.savez_compressed(f, coords=self.coords.astype(index_dtype), values=self.values, shape=np.array(self.shape))
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path): os.remove(temp_path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['coords'].astype(np.int64), data['values'], tuple(data['shape']))
+
+
+def load_sparse_tensor(tensor_path):
+    """SparseTensor for a <name>_tensor.npy path: its <name>_tensor.npz if present, else built from the dense tensor."""
+    sparse_path = sparse_path_for(tensor_path)
+    if os.path.isfile(sparse_path):
+        return SparseTensor.load(sparse_path)
+    return SparseTensor.from_dense(load_tensor_file(tensor_path))
+
+
+def load_dense_tensor(tensor_path):
+    """Dense tensor for a <name>_tensor.npy path: the .npy or .store (load_tensor_file), or the densified
+    <name>_tensor.npz when the layer is only stored sparse."""
+    try:
+        return load_tensor_file(tensor_path)
+    except FileNotFoundError:
+        if not os.path.isfile(sparse_path_for(tensor_path)):
+            raise
+        return SparseTensor.load(sparse_path_for(tensor_path)).to_dense()
+
+
+def tensor_density(tensor_path):
+    """Fraction of nonzero entries of a stored tensor (sparse .npz, tensor store or .npy)."""
+    sparse_path = sparse_path_for(tensor_path)
+    if os.path.isfile(sparse_path):
+        with np.load(sparse_path) as data:
+            return data['values'].size / max(int(np.prod(data['shape'])), 1)
+    tensor = load_tensor_file(tensor_path)
+    return np.count_nonzero(tensor) / max(tensor.size, 1)
+
+
+# --- Sparse CP Kernels ---
+def khatri_rao_rows(tensor, factors, skip_mode=None):
+    """(nnz x R) products of the factor rows each nonzero's coordinates select, skipping one mode."""
+    rank = factors[0].shape[1]
+    rows = np.ones((tensor.nnz, rank))
+    for mode, factor in enumerate(factors):
+        if mode != skip_mode:
+            rows *= factor[tensor.coords[mode]]
+    return rows
+
+
+def mttkrp(tensor, factors, mode):
+    """Sparse MTTKRP: unfold(X, mode) @ khatri_rao(other factors), in O(nnz * R).
+
+    Each nonzero adds value * (product of the other modes' factor rows) to its row of the result.
+    """
+    contributions = khatri_rao_rows(tensor, factors, skip_mode=mode) * tensor.values[:, np.newaxis]
+    index = tensor.coords[mode]
+    size = tensor.shape[mode]
+    return np.column_stack([np.bincount(index, weights=contributions[:, r], minlength=size)
+                            for r in range(contributions.shape[1])])
+
+
+def cp_inner(tensor, weights, factors):
+    """<X, [[weights; factors]]> over the nonzeros of X."""
+    return float(tensor.values @ (khatri_rao_rows(tensor, factors) @ weights))
+
+
+# --- Sparse Non-Negative CPD ---
+def non_negative_parafac_sparse(tensor, rank, n_iter_max=100, init='random', tol=10e-7,
+                                random_state=None, return_errors=False):
+    """Non-negative CPD of a SparseTensor with multiplicative updates.
+
+    The same algorithm, 'random' initialisation and stopping rule as tensorly's
+    non_negative_parafac (the absolute change of the relative error falls below tol), so for the
+    same random_state both give the same factors up to rounding. init may also be a
+    (weights, factors) pair to start from. Returns (weights, factors), or
+    ((weights, factors), errors) with return_errors.
+    """
+    from cp_utils import relative_error # cp_utils imports this module
+    epsilon = np.finfo(np.float64).eps
+    if isinstance(init, (tuple, list)):
+        weights, factors = init
+        factors = [np.array(factor, dtype=np.float64) for factor in factors]
+        if weights is not None and not np.all(weights == 1): # Fold the weights into the last factor, as tensorly does
+            factors[-1] = factors[-1] * np.reshape(weights, (1, -1))
+    elif init == 'random':
+        rng = random_state if isinstance(random_state, np.random.RandomState) else np.random.RandomState(random_state)
+        factors = [np.abs(rng.random_sample((size, rank))) for size in tensor.shape]
+    else:
+        raise ValueError(f"Initialization method '{init}' is not supported for sparse tensors (use 'random' or a CP tuple).")
+    weights = np.ones(rank)
+    values_tensor = tensor.astype(np.float64)
+    norm_tensor = values_tensor.norm()
+    if norm_tensor == 0:
+        raise ValueError("Cannot decompose an all-zero tensor.")
+
+    rec_errors = []
+    for iteration in range(n_iter_max):
+        for mode in range(tensor.ndim):
+            accum = np.ones((rank, rank))
+            for other in range(tensor.ndim):
+                if other != mode:
+                    accum = accum * (factors[other].T @ factors[other])
+            numerator = np.clip(mttkrp(values_tensor, factors, mode), epsilon, None)
+            denominator = np.clip(factors[mode] @ accum, epsilon, None)
+            factors[mode] = factors[mode] * numerator / denominator
+
+        if tol:
+            rec_errors.append(relative_error(values_tensor, weights, factors, norm_tensor))
+            if iteration >= 1 and abs(rec_errors[-2] - rec_errors[-1]) < tol:
+                break
+
+    if return_errors:
+        return (weights, factors), rec_errors
+    return weights, factors
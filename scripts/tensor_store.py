@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import numpy as np
+
+# --- Appendable Memory-Mapped Tensor Store ---
+# A directory <name>.store next to the .npy tensors holding:
+#   data.<generation>.bin  raw time-major slices (T, N, M), so a new day is appended as N*M values
+#   meta.json              shape, dtype, dates, devices, categories, version and the current data file
+# meta.json is replaced atomically after the data is on disk, and readers only map the first T slices
+# it lists, so a reader never sees a half-written day. Appending a day costs O(N*M); only changing
+# an existing day or inserting one out of order rewrites the data into a new generation file.
+
+META_FILENAME = "meta.json"
+STORE_SUFFIX = ".store"
+TENSOR_SUFFIX = "_tensor.npy"
+
+
+def store_path_for(tensor_path):
+    """<dir>/<name>.store for <dir>/<name>_tensor.npy."""
+    base = tensor_path[:-len(TENSOR_SUFFIX)] if tensor_path.endswith(TENSOR_SUFFIX) else os.path.splitext(tensor_path)[0]
+    return base + STORE_SUFFIX
+
+
+class TensorStore:
+    """Daily (N, M, T) tensor on disk that grows along T without rewriting earlier days."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILENAME), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+    # --- Creation / Metadata ---
+    @classmethod
+    def create(cls, path, devices, categories, dtype=np.int64):
+        os.makedirs(path, exist_ok=True)
+        meta = {
+            'version': 0, 'generation': 0, 'data_file': "data.0.bin", 'dtype': np.dtype(dtype).str,
+            'devices': list(devices), 'categories': list(categories), 'dates': [],
+        }
+        open(os.path.join(path, meta['data_file']), 'wb').close()
+        cls._write_meta(path, meta)
+        return cls(path)
+
+    @classmethod
+    def open_or_create(cls, path, devices, categories, dtype=np.int64):
+        if os.path.isfile(os.path.join(path, META_FILENAME)):
+            store = cls(path)
+            if store.devices != list(devices) or store.categories != list(categories):
+                raise ValueError(f"{path} was built for other devices/categories; delete it to rebuild.")
+            return store
+        return cls.create(path, devices, categories, dtype)
+
+    @staticmethod
+    def _write_meta(path, meta):
+        meta_path = os.path.join(path, META_FILENAME)
+        temp_path = f"{meta_path}.tmp{os.getpid()}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(meta, written_at=time.strftime('%Y-%m-%d %H:%M:%S')), f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, meta_path)
+
+    @property
+    def dates(self): return list(self.meta['dates'])
+
+    @property
+    def devices(self): return list(self.meta['devices'])
+
+    @property
+    def categories(self): return list(self.meta['categories'])
+
+    @property
+    def dtype(self): return np.dtype(self.meta['dtype'])
+
+    @property
+    def version(self): return self.meta['version']
+
+    @property
+    def shape(self):
+        return (len(self.meta['devices']), len(self.meta['categories']), len(self.meta['dates']))
+
+    @property
+    def _data_path(self):
+        return os.path.join(self.path, self.meta['data_file'])
+
+    # --- Reading ---
+    def tensor(self):
+        """Read-only (N, M, T) view of the memory-mapped data (zero-copy; transposed time-major slices)."""
+        num_devices, num_categories, num_slices = self.shape
+        if num_slices == 0:
+            return np.zeros(self.shape, dtype=self.dtype)
+        slices = np.memmap(self._data_path, dtype=self.dtype, mode='r', shape=(num_slices, num_devices, num_categories))
+        return slices.transpose(1, 2, 0)
+
+    # --- Writing ---
+    def write_days(self, dates, matrices):
+        """Adds or replaces days (N x M matrices). New days after the last stored date are appended in place."""
+        if not dates:
+            return
+        num_devices, num_categories, _ = self.shape
+        matrices = [np.asarray(matrix, dtype=self.dtype) for matrix in matrices]
+        if any(matrix.shape != (num_devices, num_categories) for matrix in matrices):
+            raise ValueError(f"Every day must be a {num_devices} x {num_categories} matrix.")
+        order = np.argsort(dates, kind='stable')
+        dates = [dates[i] for i in order]
+        matrices = [matrices[i] for i in order]
+        stored = self.meta['dates']
+        if len(set(dates)) == len(dates) and not set(dates) & set(stored) and (not stored or dates[0] > stored[-1]):
+            self._append(dates, matrices)
+        else:
+            self._rewrite(dates, matrices)
+
+    def _append(self, dates, matrices):
+        slice_bytes = self.shape[0] * self.shape[1] * self.dtype.itemsize
+        committed_bytes = len(self.meta['dates']) * slice_bytes
+        with open(self._data_path, 'r+b') as f:
+            f.truncate(committed_bytes) # Drops the tail of an append that crashed before its meta update
+            f.seek(committed_bytes)
+            for matrix in matrices:
+                f.write(np.ascontiguousarray(matrix).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        meta = dict(self.meta, dates=self.meta['dates'] + list(dates), version=self.meta['version'] + 1)
+        self._write_meta(self.path, meta)
+        self.meta = meta
+
+    def _rewrite(self, dates, matrices):
+        """Merges the days into a new generation file; readers of the old file are unaffected."""
+        by_date = dict(zip(self.meta['dates'], np.moveaxis(np.asarray(self.tensor()), 2, 0)))
+        by_date.update(zip(dates, matrices))
+        all_dates = sorted(by_date)
+        generation = self.meta['generation'] + 1
+        data_file = f"data.{generation}.bin"
+        with open(os.path.join(self.path, data_file), 'wb') as f:
+            for date in all_dates:
+                f.write(np.ascontiguousarray(by_date[date], dtype=self.dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        old_data_path = self._data_path
+        meta = dict(self.meta, dates=all_dates, version=self.meta['version'] + 1, generation=generation, data_file=data_file)
+        self._write_meta(self.path, meta)
+        self.meta = meta
+        try:
+            os.remove(old_data_path)
+        except OSError: # Still mapped by a reader (Windows); removed by a later rewrite
+            pass
+        for name in os.listdir(self.path):
+            if name.startswith("data.") and name.endswith(".bin") and name != data_file:
+                try: os.remove(os.path.join(self.path, name))
+                except OSError: pass
+
+
+def load_tensor_file(tensor_path):
+    """(N, M, T) tensor for a <name>_tensor.npy path without copying it into RAM.
+
+    Uses the <name>.store next to it when that is newer than the .npy (or the .npy is missing),
+    otherwise np.load(mmap_mode='r'). Raises FileNotFoundError if neither exists.
+    """
+    store_path = store_path_for(tensor_path)
+    store_meta = os.path.join(store_path, META_FILENAME)
+    if os.path.isfile(store_meta) and (not os.path.isfile(tensor_path)
+                                       or os.path.getmtime(store_meta) >= os.path.getmtime(tensor_path)):
+        return TensorStore(store_path).tensor()
+    return np.load(tensor_path, mmap_mode='r')
@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pandas as pd
+from sparse_tensor import SparseTensor
+
+# --- Sub-Daily Time Bins ---
+# Packets are assigned to fixed windows of one capture day by frame.time_epoch. A day's N x M x B
+# array (B bins) is mostly zeros at 15 min / 1 h resolution, so it is stored in COO form
+# (coords + values) in a compressed .npz instead of B dense CSVs.
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def bins_per_day(bin_minutes):
+    if bin_minutes <= 0 or MINUTES_PER_DAY % bin_minutes:
+        raise ValueError(f"Time bin of {bin_minutes} min does not divide a day evenly.")
+    return MINUTES_PER_DAY // bin_minutes
+
+
+def day_start_epoch(date, timezone='UTC'):
+    """Unix time of midnight at the start of date (YYYY-MM-DD) in the given timezone."""
+    return pd.Timestamp(date).tz_localize(timezone).timestamp()
+
+
+def time_bin_codes(time_epoch, day_start, bin_minutes):
+    """Bin index per packet within its day.
+
+    Packets stamped slightly before midnight or after the last bin (capture rotation, a 25 h DST
+    day) are clamped into the first/last bin; packets without a timestamp get -1 (day totals only).
+    """
+    num_bins = bins_per_day(bin_minutes)
+    seconds = pd.to_numeric(pd.Series(time_epoch), errors='coerce').to_numpy(dtype=np.float64) - day_start
+    bins = np.clip(np.floor_divide(np.nan_to_num(seconds, nan=0.0), bin_minutes * 60), 0, num_bins - 1).astype(np.int64)
+    bins[np.isnan(seconds)] = -1
+    return bins
+
+
+def binned_dir_name(base_dir_name, bin_minutes):
+    """Directory of the sub-daily outputs next to a daily layer directory, e.g. layer_gateway_dns_count_60min."""
+    return f"{base_dir_name}_{bin_minutes}min"
+
+
+def save_binned_day(path, array, bin_minutes):
+    """Stores one day's N x M x B array or SparseTensor sparsely (written to a temp file, then renamed into place)."""
+    if isinstance(array, SparseTensor):
+        coords, values = array.coords, array.values
+    else:
+        nonzero = np.nonzero(array)
+        coords, values = np.stack(nonzero), array[nonzero]
+    index_dtype = np.uint16 if max(array.shape) < 2 ** 16 else np.int64
+    temp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(f, coords=coords.astype(index_dtype), values=values,
+                                shape=np.array(array.shape), bin_minutes=np.array(bin_minutes))
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path): os.remove(temp_path)
+
+
+def load_binned_day_coo(path):
+    """(coords (3 x nnz), values, shape, bin_minutes) of one stored day, without densifying it."""
+    with np.load(path) as data:
+        return data['coords'].astype(np.int64), data['values'], tuple(data['shape']), int(data['bin_minutes'])
+
+
+def load_binned_day(path):
+    """(dense N x M x B array, bin_minutes) of one stored day."""
+    coords, values, shape, bin_minutes = load_binned_day_coo(path)
+    array = np.zeros(shape, dtype=values.dtype)
+    array[tuple(coords)] = values
+    return array, bin_minutes
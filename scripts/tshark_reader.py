@@ -0,0 +1,77 @@
+import io
+import subprocess
+import tempfile
+import numpy as np
+import pandas as pd
+
+# --- tshark Ingest ---
+# Two ways of getting packet fields out of tshark:
+#   read_tshark_buffered(): original path, whole stdout captured as one string, then parsed
+#   iter_tshark_chunks():   stdout read through Popen in fixed-size row chunks, so peak memory
+#                           is bounded by the chunk size instead of the pcap size
+
+TSHARK_FIELDS = ['sll.src.eth', 'ip.dst', '_ws.col.protocol', 'tcp.dstport', 'udp.dstport', 'frame.len', 'frame.time_epoch']
+TSHARK_DISPLAY_FILTER = 'ip and (sll or eth)'
+STRING_FIELDS = ['sll.src.eth', 'ip.dst', 'ipv6.dst', '_ws.col.protocol']
+DEFAULT_CHUNK_ROWS = 500_000
+
+
+def build_tshark_cmd(pcap_path, fields=TSHARK_FIELDS, display_filter=TSHARK_DISPLAY_FILTER):
+    """tshark command line extracting the given fields as quoted CSV with a header row."""
+    cmd = ['tshark', '-r', pcap_path, '-T', 'fields']
+    for field in fields:
+        cmd += ['-e', field]
+    cmd += ['-E', 'header=y', '-E', 'separator=,', '-E', 'quote=d', '-E', 'occurrence=f', '-Y', display_filter]
+    return cmd
+
+
+def clean_packet_frame(df):
+    """Normalizes raw tshark columns in place (lower-case MACs, string IPs, numeric ports/lengths/timestamps)."""
+    df['sll.src.eth'] = df['sll.src.eth'].fillna('').astype(str).str.lower()
+    df['ip.dst'] = df['ip.dst'].fillna('').astype(str)
+    if 'ipv6.dst' in df.columns: df['ip.dst'] = df['ip.dst'].where(df['ip.dst'] != '', df['ipv6.dst'].fillna('').astype(str))
+    for port_col in ['tcp.dstport', 'udp.dstport']:
+        if port_col in df.columns: df[port_col] = pd.to_numeric(df[port_col], errors='coerce')
+        else: df[port_col] = np.nan
+    if 'frame.len' in df.columns: df['frame.len'] = pd.to_numeric(df['frame.len'], errors='coerce').fillna(0).astype(np.int64)
+    else: df['frame.len'] = 0
+    if 'frame.time_epoch' in df.columns: df['frame.time_epoch'] = pd.to_numeric(df['frame.time_epoch'], errors='coerce')
+    return df
+
+
+def read_tshark_buffered(tshark_cmd):
+    """Runs tshark to completion and parses its full stdout. Returns None if no packets were extracted."""
+    process = subprocess.run(tshark_cmd, capture_output=True, text=True, check=True, encoding='utf-8')
+    tshark_output = process.stdout
+    if not tshark_output or len(tshark_output.splitlines()) <= 1:
+        return None
+    return clean_packet_frame(pd.read_csv(io.StringIO(tshark_output), low_memory=False))
+
+
+def iter_tshark_chunks(tshark_cmd, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yields cleaned DataFrames of at most chunk_rows packets while tshark is still running.
+
+    Raises subprocess.CalledProcessError (like check=True) if tshark exits with an error.
+    """
+    with tempfile.TemporaryFile() as stderr_file:
+        # stderr goes to a file so a chatty tshark can never block on a full pipe
+        process = subprocess.Popen(tshark_cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            stdout_text = io.TextIOWrapper(process.stdout, encoding='utf-8', newline='')
+            string_dtypes = {field: str for field in STRING_FIELDS}
+            try:
+                reader = pd.read_csv(stdout_text, chunksize=chunk_rows, dtype=string_dtypes)
+            except pd.errors.EmptyDataError:
+                reader = [] # tshark produced no output at all
+            for chunk in reader:
+                yield clean_packet_frame(chunk)
+            returncode = process.wait()
+        finally:
+            if process.poll() is None: # Consumer stopped early or parsing failed
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        if returncode != 0:
+            stderr_file.seek(0)
+            stderr_text = stderr_file.read().decode('utf-8', errors='replace')
+            raise subprocess.CalledProcessError(returncode, tshark_cmd, stderr=stderr_text)
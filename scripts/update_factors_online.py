@@ -0,0 +1,111 @@
+import os
+import numpy as np
+import sys
+import time
+from tensor_store import load_tensor_file
+from online_cpd import fold_weights, init_state, online_update, full_refit, drift_baseline, save_factors, save_state, load_state
+from cp_utils import relative_error
+
+# --- Configuration ---
+TENSOR_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\tensors"
+FACTOR_DIR = r"C:\Users\Asus\Documents\Master thesis\Deakin ddataset\output_dir\factors" # Factors saved by performing_clustering.py
+
+# --- CHOOSE THE LAYER AND ITS RANK (as in performing_clustering.py) ---
+AGGREGATION_METRIC = 'count' # 'count', 'bytes' or 'distinct_dst' tensor built by load_tensor.py
+TENSOR_FILENAME = f"local_tcp_{AGGREGATION_METRIC}_tensor.npy"
+CHOSEN_RANK = 2
+LAYER_NAME = f"local_tcp_{AGGREGATION_METRIC}"
+# --- END CHOOSE ---
+
+# --- Online Update Parameters (see online_cpd.py) ---
+# Days of the tensor beyond the rows of factor C are folded in one at a time. A full warm-started
+# refit of the whole tensor runs every REFIT_EVERY_DAYS days, or earlier when a new day's error
+# exceeds DRIFT_ERROR_RATIO x the median error of the DRIFT_BASELINE_DAYS days before it (per-day
+# errors of the last full fit, then of each folded-in day).
+NNLS_ITERS = 100           # NNLS sweeps per factor update
+REFIT_EVERY_DAYS = 7       # None: only refit on drift
+DRIFT_ERROR_RATIO = 1.5
+DRIFT_BASELINE_DAYS = 14
+REFIT_N_ITER_MAX = 100     # Warm-started refits start close to convergence
+REFIT_TOL = 1e-8
+
+# --- Construct Paths ---
+tensor_path = os.path.join(TENSOR_DIR, TENSOR_FILENAME)
+base_output_name = f"{LAYER_NAME}_R{CHOSEN_RANK}"
+path_A = os.path.join(FACTOR_DIR, f"{base_output_name}_factor_A.npy")
+path_B = os.path.join(FACTOR_DIR, f"{base_output_name}_factor_B.npy")
+path_C = os.path.join(FACTOR_DIR, f"{base_output_name}_factor_C.npy")
+path_W = os.path.join(FACTOR_DIR, f"{base_output_name}_weights.npy")
+path_state = os.path.join(FACTOR_DIR, f"{base_output_name}_online_state.npz")
+
+# --- Load Factors and Tensor ---
+print(f"Loading factors: {base_output_name} from {FACTOR_DIR}")
+try:
+    factors = fold_weights(np.load(path_W), [np.load(path_A), np.load(path_B), np.load(path_C)])
+except FileNotFoundError as e:
+    print(f"FATAL ERROR: Factor file not found ({e}). Run performing_clustering.py first.")
+    sys.exit(1)
+
+print(f"Loading tensor: {tensor_path}")
+try:
+    tensor = load_tensor_file(tensor_path) # Memory-mapped: only the new days are read
+except FileNotFoundError:
+    print(f"FATAL ERROR: Tensor file not found at {tensor_path}")
+    sys.exit(1)
+N, M, T = tensor.shape
+known_days = factors[2].shape[0]
+if factors[0].shape[0] != N or factors[1].shape[0] != M:
+    print(f"FATAL ERROR: Factors ({factors[0].shape[0]} x {factors[1].shape[0]}) do not match tensor {tensor.shape}. "
+          f"New devices or categories need a full run of performing_clustering.py.")
+    sys.exit(1)
+if T < known_days:
+    print(f"FATAL ERROR: Tensor has {T} days but factor C has {known_days} rows.")
+    sys.exit(1)
+if T == known_days:
+    print(f"Factors are up to date ({T} days). Nothing to do.")
+    sys.exit(0)
+
+# --- Sufficient Statistics ---
+state = load_state(path_state, factors)
+if state is None:
+    print(f"No online state for these factors, computing it from the {known_days} days already decomposed...")
+    history = np.asarray(tensor[:, :, :known_days], dtype=np.float64)
+    state = init_state(history, factors, relative_error(history, None, factors))
+    del history
+
+# --- Fold In New Days ---
+print(f"\nFolding {T - known_days} new day(s) into the R={CHOSEN_RANK} model "
+      f"(last full fit error {state['refit_error']:.6f}, {state['slices_since_refit']} days ago)...")
+start_time_update = time.time()
+for t in range(known_days, T):
+    start_time_day = time.time()
+    baseline = drift_baseline(state, DRIFT_BASELINE_DAYS)
+    factors, state, day_error = online_update(factors, state, tensor[:, :, t], NNLS_ITERS)
+    print(f"  Day {t + 1}/{T}: error {day_error:.6f} (recent median {baseline:.6f}, {(time.time() - start_time_day) * 1000:.1f} ms)")
+
+    drifted = day_error > DRIFT_ERROR_RATIO * baseline # False for NaN (all-zero day, or no baseline yet)
+    due = REFIT_EVERY_DAYS and state['slices_since_refit'] >= REFIT_EVERY_DAYS
+    if drifted or due:
+        print(f"  Full refit of days 1-{t + 1} ({'drift' if drifted else 'scheduled'})...")
+        start_time_refit = time.time()
+        try:
+            factors, state, refit_error = full_refit(np.asarray(tensor[:, :, :t + 1], dtype=np.float64), factors,
+                                                     REFIT_N_ITER_MAX, REFIT_TOL)
+        except Exception as e:
+            print(f"FATAL ERROR during full refit: {e}")
+            sys.exit(1)
+        print(f"  Refit error {refit_error:.6f} ({time.time() - start_time_refit:.2f}s)")
+print(f"Finished online update in {time.time() - start_time_update:.2f}s.")
+
+# --- Save the Factor Matrices ---
+# Weights are folded into factor A, so they are saved as ones (as non_negative_parafac returns them)
+print("\nSaving factor matrices...")
+try:
+    save_factors((path_A, path_B, path_C, path_W), factors) # All four replaced together
+    save_state(path_state, state, factors) # Fingerprinted: a crash before this line only makes the next run recompute it
+    print(f"  Saved factors to {FACTOR_DIR} (Factor C shape: {factors[2].shape}) and online state to {path_state}")
+except Exception as e:
+    print(f"FATAL ERROR saving factor matrices: {e}")
+    sys.exit(1)
+
+print("\n--- Script Finished ---")